@@ -0,0 +1,150 @@
+"""
+    gpstruct.py Convert a GOLDParser parse tree export to Structorizer XML
+
+    Copyright (C) 2022  Sven Coenye
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+    Compare the latency of converting through a running gpstructd.py
+    with starting gpstruct.py for each conversion.
+    Run as: python -m benchmarks.daemon_latency [options]
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.generator import ParseTreeGenerator
+from gpstructd import UnixHTTPConnection, request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def wait_for_socket(socket_path, timeout=30):
+    """
+    :param socket_path: Unix socket the server listens on
+    :param timeout: seconds to wait for the server
+    :return:
+    """
+    deadline = time.monotonic() + timeout
+
+    while True:
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+        try:
+            probe.connect(socket_path)
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+        finally:
+            probe.close()
+
+
+def time_daemon(data, requests, socket_path, keep_alive=True):
+    """
+    :param data: parse tree export as bytes
+    :param requests: number of conversions
+    :param socket_path: Unix socket of a running server
+    :param keep_alive: send all requests on one connection
+    :return: seconds for each request
+    """
+    connection = UnixHTTPConnection(socket_path) if keep_alive else None
+    timings = []
+
+    for _ in range(requests):
+        start = time.perf_counter()
+        status, _ = request(data, socket_path, connection=connection)
+        timings.append(time.perf_counter() - start)
+
+        if status != 200:
+            raise RuntimeError('The server answered {}'.format(status))
+
+    return timings
+
+
+def time_processes(data, requests):
+    """
+    :param data: parse tree export as bytes
+    :param requests: number of conversions
+    :return: seconds for each gpstruct.py run
+    """
+    command = [sys.executable, os.path.join(ROOT, 'gpstruct.py')]
+    timings = []
+
+    for _ in range(requests):
+        start = time.perf_counter()
+        subprocess.run(command, input=data, stdout=subprocess.DEVNULL, check=True, cwd=ROOT)
+        timings.append(time.perf_counter() - start)
+
+    return timings
+
+
+def summary(timings):
+    """
+    :param timings: seconds for each request
+    :return: mean, median and 95th percentile in milliseconds
+    """
+    ordered = sorted(timings)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    return statistics.mean(ordered) * 1000, statistics.median(ordered) * 1000, p95 * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare gpstructd.py latency with a process per conversion')
+    parser.add_argument('--statements', type=int, default=200, help='statements in the generated program')
+    parser.add_argument('--requests', type=int, default=50, help='conversions per variant')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+
+    options = parser.parse_args()
+
+    data = ParseTreeGenerator(options.statements, seed=options.seed).text().encode('utf-8')
+
+    results = [('process per call', time_processes(data, options.requests))]
+
+    # Without its cache the daemon converts every request, which shows the gain of keeping the converter loaded
+    for cache_size, name in (('0', 'daemon, no cache'), ('64', 'daemon, cached')):
+        with tempfile.TemporaryDirectory() as work_dir:
+            socket_path = os.path.join(work_dir, 'gpstruct.sock')
+            daemon = subprocess.Popen([sys.executable, os.path.join(ROOT, 'gpstructd.py'), '--socket', socket_path,
+                                       '--cache-size', cache_size], stderr=subprocess.DEVNULL, cwd=ROOT)
+
+            try:
+                wait_for_socket(socket_path)
+
+                results.append((name + ', new connection', time_daemon(data, options.requests, socket_path, False)))
+                results.append((name + ', keep-alive', time_daemon(data, options.requests, socket_path)))
+            finally:
+                daemon.terminate()
+                daemon.wait()
+
+    print('{} statements, {:,} bytes, {} requests each'.format(options.statements, len(data), options.requests))
+    print('{:<34} {:>10} {:>10} {:>10}'.format('variant', 'mean ms', 'p50 ms', 'p95 ms'))
+
+    for name, timings in results:
+        print('{:<34} {:>10.2f} {:>10.2f} {:>10.2f}'.format(name, *summary(timings)))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
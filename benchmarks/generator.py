@@ -0,0 +1,238 @@
+"""
+    gpstruct.py Convert a GOLDParser parse tree export to Structorizer XML
+
+    Copyright (C) 2022  Sven Coenye
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import random
+
+
+class ParseTreeGenerator:
+    """
+    Produce synthetic GOLDParser parse tree exports shaped like the
+    trees of real Natural programs.
+    """
+
+    simple = ('MOVE', 'ADD', 'PERFORM', 'CALLNAT', 'STORE')
+    nested = ('IF_open', 'FOR', 'DECIDE_ON', 'FIND_with_loop')
+
+    # Relative weight of each statement kind
+    default_mix = {
+        'MOVE': 4,
+        'ADD': 3,
+        'PERFORM': 2,
+        'CALLNAT': 2,
+        'STORE': 1,
+        'IF_open': 2,
+        'FOR': 1,
+        'DECIDE_ON': 1,
+        'FIND_with_loop': 1
+    }
+
+    def __init__(self, statements=1000, depth=3, fan_out=4, mix=None, seed=0):
+        """
+        :param statements: number of statements in the program
+        :param depth: deepest nesting of block statements
+        :param fan_out: largest number of statements in a block
+        :param mix: relative weight of each statement kind, default_mix if None
+        :param seed: random seed, the same seed gives the same tree
+        """
+        mix = self.default_mix if mix is None else mix
+        unknown = [kind for kind in mix if kind not in self.simple + self.nested]
+
+        if unknown:
+            raise ValueError('Unknown statement kind {}'.format(', '.join(unknown)))
+
+        if not any(mix.get(kind, 0) > 0 for kind in self.simple):
+            raise ValueError('The statement mix needs at least one simple statement kind')
+
+        if fan_out < 1:
+            raise ValueError('fan_out must be at least 1')
+
+        self.statements = statements
+        self.depth = depth
+        self.fan_out = fan_out
+        self.mix = dict(mix)
+        self.seed = seed
+
+        self._random = None
+        self._remaining = 0
+
+        # Kinds and weights to pick from inside and at the bottom of the nesting
+        self._all = [(kind, weight) for kind, weight in self.mix.items() if weight > 0]
+        self._leaves = [(kind, weight) for kind, weight in self._all if kind in self.simple]
+
+    def lines(self):
+        """
+        Generate the lines of the parse tree section as (level, text) pairs
+        :return:
+        """
+        self._random = random.Random(self.seed)
+        self._remaining = self.statements
+
+        yield 0, '<program> ::= <statement_list> END'
+
+        while self._remaining > 0:
+            yield from self._statement(1, self.depth)
+
+        yield 1, 'END'
+
+    def write(self, out_file):
+        """
+        Write a complete parse tree export file
+        :param out_file: text file
+        :return:
+        """
+        out_file.write('Parse Tree\n\n')
+
+        for level, text in self.lines():
+            out_file.write('|  ' * level + '+--' + text + '\n')
+
+        out_file.write('\n')
+
+    def text(self):
+        """
+        :return: complete parse tree export as a string
+        """
+        parts = ['Parse Tree\n\n']
+        parts.extend('|  ' * level + '+--' + text + '\n' for level, text in self.lines())
+        parts.append('\n')
+
+        return ''.join(parts)
+
+    def _identifier(self):
+        return '#{}{}'.format(self._random.choice('ABCDEFGHIJ'), self._random.randint(1, 50))
+
+    def _statement(self, level, depth):
+        self._remaining -= 1
+
+        kinds, weights = zip(*(self._all if depth > 0 else self._leaves))
+        kind = self._random.choices(kinds, weights)[0]
+
+        yield from getattr(self, '_' + kind)(level, depth)
+
+    def _statements(self, level, depth):
+        # The statements of a block, without a <statement_list> of their own
+        for _ in range(self._random.randint(1, self.fan_out)):
+            if self._remaining <= 0:
+                break
+
+            yield from self._statement(level, depth - 1)
+
+    def _block(self, level, depth):
+        yield level, '<statement_list> ::= <statement> <statement_list>'
+        yield from self._statements(level + 1, depth)
+
+    def _MOVE(self, level, depth):
+        yield level, '<MOVE> ::= MOVE <operand> TO <operand>'
+        yield level + 1, 'MOVE'
+        yield level + 1, self._identifier()
+        yield level + 1, 'TO'
+        yield level + 1, self._identifier()
+
+    def _ADD(self, level, depth):
+        yield level, '<ADD> ::= ADD <operand> TO <operand>'
+        yield level + 1, 'ADD'
+        yield level + 1, str(self._random.randint(1, 9))
+        yield level + 1, 'TO'
+        yield level + 1, self._identifier()
+
+    def _PERFORM(self, level, depth):
+        yield level, '<PERFORM> ::= PERFORM <subroutine_name>'
+        yield level + 1, 'PERFORM'
+        yield level + 1, 'SUB-{}'.format(self._random.randint(1, 20))
+
+    def _CALLNAT(self, level, depth):
+        yield level, '<CALLNAT> ::= CALLNAT <operand> <parameter_list>'
+        yield level + 1, 'CALLNAT'
+        yield level + 1, "'NAT{:04}'".format(self._random.randint(1, 200))
+        yield level + 1, self._identifier()
+
+    def _IF_open(self, level, depth):
+        yield level, '<IF_open> ::= IF <logical_expression> <THEN_open> END-IF'
+        yield level + 1, 'IF'
+        yield level + 1, '<logical_expression> ::= <operand> <comparison> <operand>'
+        yield level + 2, self._identifier()
+        yield level + 2, self._random.choice(('EQ', 'NE', '<', '>'))
+        yield level + 2, str(self._random.randint(0, 99))
+        yield level + 1, '<THEN_open> ::= THEN <statement_list>'
+        yield level + 2, 'THEN'
+        yield from self._block(level + 2, depth)
+        yield level + 1, 'END-IF'
+
+    def _FOR(self, level, depth):
+        yield level, '<FOR> ::= FOR <user_identifier> <FOR_from> <FOR_to> <statement_list> END-FOR'
+        yield level + 1, 'FOR'
+        yield level + 1, '<user_identifier> ::= Identifier'
+        yield level + 2, self._identifier()
+        yield level + 1, '<constant_integer_pos> ::= Integer'
+        yield level + 2, '1'
+        yield level + 1, '<constant_integer_pos> ::= Integer'
+        yield level + 2, str(self._random.randint(2, 100))
+        yield from self._block(level + 1, depth)
+        yield level + 1, 'END-FOR'
+
+    def _STORE(self, level, depth):
+        yield level, '<STORE> ::= STORE <view_name> <STORE_how>'
+        yield level + 1, 'STORE'
+        yield level + 1, 'VIEW-{}'.format(self._random.randint(1, 10))
+        yield level + 1, '<STORE_how> ::= SET <assignment_list>'
+        yield level + 2, 'SET'
+
+        for _ in range(self._random.randint(1, 3)):
+            yield level + 2, "<assignment_all> ::= <field> '=' <operand>"
+            yield level + 3, 'FIELD-{}'.format(self._random.randint(1, 30))
+            yield level + 3, '='
+            yield level + 3, self._identifier()
+
+    def _DECIDE_ON(self, level, depth):
+        yield level, '<DECIDE_ON> ::= DECIDE ON <DECIDE_which> <OF> <operand> <DECIDE_ON_conditions> END-DECIDE'
+        yield level + 1, 'DECIDE'
+        yield level + 1, 'ON'
+        yield level + 1, '<DECIDE_which> ::= FIRST VALUE'
+        yield level + 2, 'FIRST'
+        yield level + 2, 'VALUE'
+        yield level + 1, '<OF> ::= OF'
+        yield level + 2, 'OF'
+        yield level + 1, '<user_variable> ::= Identifier'
+        yield level + 2, self._identifier()
+        yield level + 1, '<DECIDE_ON_conditions> ::= <DECIDE_ON_branch> <DECIDE_ON_conditions>'
+
+        for value in range(self._random.randint(1, self.fan_out)):
+            yield level + 2, '<DECIDE_ON_branch> ::= VALUE <constant_alpha> <statement_list>'
+            yield level + 3, 'VALUE'
+            yield level + 3, '<constant_alpha> ::= String'
+            yield level + 4, "'{}'".format(value)
+            yield from self._block(level + 3, depth)
+
+        yield level + 2, '<DECIDE_ON_none> ::= NONE <statement_list>'
+        yield level + 3, 'NONE'
+        yield level + 3, '<IGNORE> ::= IGNORE'
+        yield level + 4, 'IGNORE'
+        yield level + 1, 'END-DECIDE'
+
+    def _FIND_with_loop(self, level, depth):
+        yield level, '<FIND_with_loop> ::= FIND <view_name> WITH <search_expression> <loop_statement_list>'
+        yield level + 1, 'FIND'
+        yield level + 1, 'VIEW-{}'.format(self._random.randint(1, 10))
+        yield level + 1, 'WITH'
+        yield level + 1, '<search_expression> ::= <descriptor> <comparison> <operand>'
+        yield level + 2, 'KEY-{}'.format(self._random.randint(1, 5))
+        yield level + 2, '='
+        yield level + 2, self._identifier()
+        yield from self._statements(level + 1, depth)
+        yield level + 1, '<loop_statement_list> ::= END-FIND'
+        yield level + 2, 'END-FIND'
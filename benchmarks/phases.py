@@ -0,0 +1,255 @@
+"""
+    gpstruct.py Convert a GOLDParser parse tree export to Structorizer XML
+
+    Copyright (C) 2022  Sven Coenye
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+    Time the conversion phases on a synthetic parse tree.
+    Run as: python -m benchmarks.phases [options]
+    Results can be saved with --save and checked against a saved run
+    with --compare, which fails when a phase got slower than allowed.
+"""
+
+import argparse
+import gc
+import io
+import json
+import sys
+import time
+import tracemalloc
+
+from benchmarks.generator import ParseTreeGenerator
+from gpstruct import GPStruct
+from structorizer.factory import StatementFactory
+
+PHASES = ('parse', 'build_render_nodes', 'build_diagram', 'render')
+
+
+def phase_steps(gp_parser, gp_file, output):
+    """
+    :param gp_parser: GPStruct to run the phases on
+    :param gp_file: parse tree export
+    :param output: XML output destination
+    :return: (phase name, callable) for each phase, in order
+    """
+    return (('parse', lambda: gp_parser.parse(gp_file, StatementFactory)),
+            ('build_render_nodes', lambda: gp_parser.build_render_nodes(StatementFactory)),
+            ('build_diagram', gp_parser.build_diagram),
+            ('render', lambda: gp_parser.render(output)))
+
+
+def run_phases(text, columnar=False):
+    """
+    Convert a parse tree export once, timing each phase
+    :param text: parse tree export
+    :param columnar: use the ColumnarTree
+    :return: dictionary of phase name: seconds
+    """
+    gp_parser = GPStruct(columnar)
+    timings = {}
+
+    with io.StringIO(text) as gp_file, io.StringIO() as output:
+        steps = phase_steps(gp_parser, gp_file, output)
+
+        for phase, step in steps:
+            start = time.perf_counter()
+            step()
+            timings[phase] = time.perf_counter() - start
+
+    return timings
+
+
+def peak_memory(text, columnar=False):
+    """
+    Convert a parse tree export once under tracemalloc. This is kept
+    apart from the timed runs as tracing slows everything down.
+    :param text: parse tree export
+    :param columnar: use the ColumnarTree
+    :return: dictionary of phase name: peak bytes allocated during the phase
+    """
+    gp_parser = GPStruct(columnar)
+    peaks = {}
+
+    with io.StringIO(text) as gp_file, io.StringIO() as output:
+        steps = phase_steps(gp_parser, gp_file, output)
+
+        gc.collect()
+        tracemalloc.start()
+
+        try:
+            for phase, step in steps:
+                tracemalloc.reset_peak()
+                start = tracemalloc.get_traced_memory()[0]
+                step()
+                peaks[phase] = tracemalloc.get_traced_memory()[1] - start
+        finally:
+            tracemalloc.stop()
+
+    return peaks
+
+
+def benchmark(generator, repeat=3, columnar=False):
+    """
+    Time the conversion phases
+    :param generator: ParseTreeGenerator for the input
+    :param repeat: number of runs, the fastest time of each phase is kept
+    :param columnar: use the ColumnarTree
+    :return: dictionary with the settings and the results per phase
+    """
+    text = generator.text()
+    lines = text.count('\n') - 3        # Header and the blank lines around the tree
+
+    best = dict.fromkeys(PHASES, float('inf'))
+
+    for _ in range(repeat):
+        gc.collect()
+
+        for phase, seconds in run_phases(text, columnar).items():
+            best[phase] = min(best[phase], seconds)
+
+    peaks = peak_memory(text, columnar)
+
+    return {
+        'settings': {
+            'statements': generator.statements,
+            'depth': generator.depth,
+            'fan_out': generator.fan_out,
+            'mix': generator.mix,
+            'seed': generator.seed,
+            'columnar': columnar,
+            'repeat': repeat
+        },
+        'lines': lines,
+        'phases': {phase: {'seconds': best[phase],
+                           'lines_per_second': lines / best[phase] if best[phase] else 0.0,
+                           'peak_bytes': peaks[phase]}
+                   for phase in PHASES}
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Check the results against an earlier run
+    :param results: benchmark results
+    :param baseline: results of the earlier run
+    :param tolerance: allowed slowdown as a fraction, 0.25 is 25% slower
+    :return: list of (phase, ratio) for the phases that are too slow
+    """
+    regressions = []
+
+    for phase in PHASES:
+        before = baseline['phases'][phase]['seconds']
+        ratio = results['phases'][phase]['seconds'] / before if before else 1.0
+
+        if ratio > 1 + tolerance:
+            regressions.append((phase, ratio))
+
+    return regressions
+
+
+def report(results, out_file, baseline=None):
+    """
+    Print the results as a table
+    :param results: benchmark results
+    :param out_file: text file
+    :param baseline: results of an earlier run to show the change against
+    :return:
+    """
+    settings = results['settings']
+    tree = 'columnar' if settings['columnar'] else 'object'
+
+    out_file.write('{} statements, depth {}, fan-out {}, {} tree: {} parse tree lines\n'.format(
+        settings['statements'], settings['depth'], settings['fan_out'], tree, results['lines']))
+
+    out_file.write('{:<20} {:>10} {:>14} {:>14}{}\n'.format('phase', 'seconds', 'lines/s', 'peak bytes',
+                                                            '  vs baseline' if baseline else ''))
+
+    for phase in PHASES:
+        result = results['phases'][phase]
+        change = ''
+
+        if baseline:
+            before = baseline['phases'][phase]['seconds']
+            change = '  {:+.1%}'.format(result['seconds'] / before - 1) if before else '  n/a'
+
+        out_file.write('{:<20} {:>10.4f} {:>14,.0f} {:>14,}{}\n'.format(
+            phase, result['seconds'], result['lines_per_second'], result['peak_bytes'], change))
+
+
+def parse_mix(text):
+    """
+    :param text: statement mix as KIND=WEIGHT,KIND=WEIGHT
+    :return: dictionary of kind: weight
+    """
+    mix = {}
+
+    for part in text.split(','):
+        kind, _, weight = part.partition('=')
+        mix[kind.strip()] = float(weight) if weight else 1.0
+
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the GPStruct conversion phases')
+    parser.add_argument('--statements', type=int, default=20000, help='statements in the generated program')
+    parser.add_argument('--depth', type=int, default=4, help='deepest nesting of block statements')
+    parser.add_argument('--fan-out', type=int, default=4, help='largest number of statements in a block')
+    parser.add_argument('--mix', type=parse_mix, help='statement mix as KIND=WEIGHT,... (default: {})'.format(
+        ','.join('{}={}'.format(kind, weight) for kind, weight in ParseTreeGenerator.default_mix.items())))
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per phase, the fastest is kept')
+    parser.add_argument('--columnar', action='store_true', help='parse into the columnar tree')
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON file of an earlier run to check against')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed slowdown against --compare, as a fraction (default 0.25)')
+
+    options = parser.parse_args()
+
+    try:
+        generator = ParseTreeGenerator(options.statements, options.depth, options.fan_out, options.mix, options.seed)
+    except ValueError as error:
+        parser.error(str(error))
+
+    results = benchmark(generator, options.repeat, options.columnar)
+    baseline = None
+
+    if options.compare:
+        with open(options.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+
+        if baseline['settings'] != results['settings']:
+            print('The baseline was run with different settings', file=sys.stderr)
+
+    report(results, sys.stdout, baseline)
+
+    if options.save:
+        with open(options.save, 'w') as results_file:
+            json.dump(results, results_file, indent=2)
+
+    if baseline:
+        regressions = compare(results, baseline, options.tolerance)
+
+        for phase, ratio in regressions:
+            print('{} is {:.1%} slower than the baseline'.format(phase, ratio - 1), file=sys.stderr)
+
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
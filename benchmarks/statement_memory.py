@@ -0,0 +1,82 @@
+"""
+    gpstruct.py Convert a GOLDParser parse tree export to Structorizer XML
+
+    Copyright (C) 2022  Sven Coenye
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+    Measure the memory held by the Statement tree of a large program.
+    Run as: python -m benchmarks.statement_memory [statements]
+    The layout before the slotted Statement nodes is measured by running
+    this script against the converter of the commit before them:
+      git worktree add /tmp/before 0321ae6~1
+      cd /tmp/before && PYTHONPATH=. python $OLDPWD/benchmarks/statement_memory.py
+      git worktree remove /tmp/before
+"""
+
+import gc
+import io
+import sys
+import tracemalloc
+
+from collections import Counter
+
+from benchmarks.generator import ParseTreeGenerator
+from gpstruct import GPStruct
+from structorizer.factory import StatementFactory
+
+
+def count_statements(diagram_root):
+    """
+    :param diagram_root: root of the Statement tree
+    :return: Counter of Statement classes
+    """
+    counts = Counter()
+    pending = [diagram_root]
+
+    while pending:
+        statement = pending.pop()
+        counts[type(statement).__name__] += 1
+        pending.extend(statement.child_nodes)
+
+    return counts
+
+
+def main():
+    statements = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    gp_parser = GPStruct()
+    gp_parser.parse(io.StringIO(ParseTreeGenerator(statements).text()))
+
+    gc.collect()
+    tracemalloc.start()
+
+    gp_parser.build_render_nodes(StatementFactory)
+    gp_parser.build_diagram()
+
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    counts = count_statements(gp_parser.diagram_root)
+    total = sum(counts.values())
+
+    print('{} statements, {} Statement nodes'.format(statements, total))
+    for name, count in counts.most_common():
+        print('  {:<22} {:>8}'.format(name, count))
+    print('Statement tree: {:,} bytes, {:.1f} bytes/node'.format(size, size / total))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""
+    gpstruct.py Convert a GOLDParser parse tree export to Structorizer XML
+
+    Copyright (C) 2022  Sven Coenye
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+    Compare the speed of splitting the parse tree section into lines
+    with the per-line reader the converter used before TreeTokenizer.
+    Run as: python -m benchmarks.tokenizer [options]
+"""
+
+import argparse
+import gc
+import io
+import re
+import sys
+import time
+
+from benchmarks.generator import ParseTreeGenerator
+from goldparser.reader import TreeTokenizer
+
+# Every tree line in one pattern: the bars in front of +-- and the text
+line_l = re.compile(r'^[^\S\n]*([| ]*)\+--(.*?)[^\S\n]*$|^[^\S\n]*$', re.MULTILINE)
+
+
+def split_line(line):
+    # GPStruct._split_line, which the converter called for every line before TreeTokenizer
+    parts = line.split('+--', maxsplit=1)  # In case the definition contains an expression
+    parts[0] = parts[0].count('|')  # Replace tree level string with the equivalent number
+
+    return parts
+
+
+def per_line(gp_file):
+    # The reader before TreeTokenizer: strip and split every line
+    for line in gp_file:
+        if line.strip() == '':
+            break
+
+    for line in gp_file:
+        line = line.strip()
+        if line == '':
+            break
+
+        yield split_line(line)
+
+
+def regex_scan(gp_file):
+    # One pattern match per line over the whole file
+    for line in gp_file:
+        if line.strip() == '':
+            break
+
+    for match in line_l.finditer(gp_file.read()):
+        prefix, text = match.groups()
+
+        if text is None:
+            break
+
+        yield prefix.count('|'), text
+
+
+def tokenizer_lines(gp_file):
+    return TreeTokenizer(gp_file).lines()
+
+
+READERS = (('per line (before)', per_line),
+           ('regex finditer', regex_scan),
+           ('TreeTokenizer.lines', tokenizer_lines))
+
+
+def time_reader(reader, text, repeat):
+    """
+    :param reader: function generating the tree lines of a text file
+    :param text: parse tree export
+    :param repeat: number of runs, the fastest is kept
+    :return: seconds and the number of lines read
+    """
+    best = float('inf')
+    count = 0
+
+    for _ in range(repeat):
+        gc.collect()
+
+        with io.StringIO(text) as gp_file:
+            start = time.perf_counter()
+            count = sum(1 for _ in reader(gp_file))
+            best = min(best, time.perf_counter() - start)
+
+    return best, count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the parse tree line readers')
+    parser.add_argument('--statements', type=int, default=20000, help='statements in the generated program')
+    parser.add_argument('--depth', type=int, default=4, help='deepest nesting of block statements')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per reader, the fastest is kept')
+
+    options = parser.parse_args()
+
+    text = ParseTreeGenerator(options.statements, options.depth, seed=options.seed).text()
+
+    with io.StringIO(text) as gp_file:
+        expected = [tuple(parts) for parts in per_line(gp_file)]
+
+    for name, reader in READERS[1:]:
+        with io.StringIO(text) as gp_file:
+            if list(reader(gp_file)) != expected:
+                print('{} does not read the same lines'.format(name), file=sys.stderr)
+                return 1
+
+    print('{:,} parse tree lines, {:,} characters'.format(len(expected), len(text)))
+    print('{:<22} {:>10} {:>14} {:>8}'.format('reader', 'seconds', 'lines/s', 'speedup'))
+
+    before = None
+
+    for name, reader in READERS:
+        seconds, count = time_reader(reader, text, options.repeat)
+        before = before or seconds
+
+        print('{:<22} {:>10.4f} {:>14,.0f} {:>7.2f}x'.format(name, seconds, count / seconds, before / seconds))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,66 @@
+"""
+    gpstruct.py Convert a GOLDParser parse tree export to Structorizer XML
+
+    Copyright (C) 2022  Sven Coenye
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+    Compare the memory held by the object parse tree and the ColumnarTree.
+    Run as: python -m benchmarks.tree_memory [statements]
+"""
+
+import gc
+import io
+import sys
+import tracemalloc
+
+from benchmarks.generator import ParseTreeGenerator
+from gpstruct import GPStruct
+
+
+def tree_size(text, columnar):
+    """
+    Parse a tree and measure the memory it keeps
+    :param text: parse tree export
+    :param columnar: use the ColumnarTree
+    :return: bytes held by the parsed tree
+    """
+    gc.collect()
+    tracemalloc.start()
+
+    gp_parser = GPStruct(columnar)
+    gp_parser.parse(io.StringIO(text))
+
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    return size
+
+
+def main():
+    statements = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    text = ParseTreeGenerator(statements).text()
+    lines = text.count('\n') - 3
+
+    print('{} statements, {} parse tree lines'.format(statements, lines))
+
+    for name, columnar in (('object tree', False), ('columnar tree', True)):
+        size = tree_size(text, columnar)
+        print('{:<14} {:>12,} bytes {:>8.1f} bytes/line'.format(name, size, size / lines))
+
+
+if __name__ == '__main__':
+    main()
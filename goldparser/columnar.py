@@ -0,0 +1,219 @@
+"""
+    gpstruct.py Convert a GOLDParser parse tree export to Structorizer XML
+
+    Copyright (C) 2022  Sven Coenye
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+from array import array
+
+from goldparser.grammar import ExpressionNode, TerminalNode, symbols
+
+
+class ColumnarTree:
+    """
+    Parse tree stored as parallel arrays instead of one object per line.
+    Node i is described by levels[i], parents[i], first_child[i],
+    next_sibling[i] and strings[expressions[i]]. Expressions and
+    terminals are kept once in the string table, however often they
+    occur. -1 marks a missing parent, child or sibling.
+    Nodes are handed out as light views that behave like the
+    ExpressionNode and TerminalNode they replace.
+    """
+
+    def __init__(self):
+        self.levels = array('i')
+        self.parents = array('i')
+        self.first_child = array('i')
+        self.next_sibling = array('i')
+        self.expressions = array('i')      # Index in the string table
+        self.terminals = bytearray()        # 1 for terminals, 0 for expressions
+
+        self.strings = []                   # String table
+        self.string_symbols = array('i')    # Symbol ID of each string, -1 for terminals
+        self._string_index = {}
+
+        # Construction state: open expressions (deepest last) and the last child of each node
+        self._open_nodes = []
+        self._last_child = array('i')
+
+    def __len__(self):
+        return len(self.levels)
+
+    def append(self, level, expression, terminal):
+        """
+        Add the next line of the parse tree. Lines must arrive in the
+        order of the export.
+        :param level: depth of the line
+        :param expression: expression or terminal text
+        :param terminal: True if the line holds a terminal
+        :return: index of the new node
+        """
+        # Close the expressions that cannot hold this line, as GPStruct.parse does
+        open_nodes = self._open_nodes
+        levels = self.levels
+
+        while open_nodes and levels[open_nodes[-1]] >= level:
+            open_nodes.pop()
+
+        index = len(levels)
+
+        if open_nodes:
+            parent = open_nodes[-1]
+            last_child = self._last_child[parent]
+
+            if last_child < 0:
+                self.first_child[parent] = index
+            else:
+                self.next_sibling[last_child] = index
+
+            self._last_child[parent] = index
+        elif index > 0:
+            raise ValueError('Found {} at level {} outside the initial statement'.format(expression, level))
+        else:
+            parent = -1
+
+        string = self._string_index.get(expression)
+        if string is None:
+            if terminal:
+                symbol = -1
+            else:
+                expression, symbol = symbols.expression(expression)
+
+            string = len(self.strings)
+            self.strings.append(expression)
+            self.string_symbols.append(symbol)
+            self._string_index[expression] = string
+
+        levels.append(level)
+        self.parents.append(parent)
+        self.first_child.append(-1)
+        self.next_sibling.append(-1)
+        self.expressions.append(string)
+        self.terminals.append(1 if terminal else 0)
+        self._last_child.append(-1)
+
+        if not terminal:
+            open_nodes.append(index)
+
+        return index
+
+    def close(self):
+        """
+        Release the construction state once the last line is in.
+        :return:
+        """
+        self._open_nodes = []
+        self._last_child = array('i')
+        self._string_index = {}
+
+    def node(self, index):
+        """
+        :param index: node number
+        :return: view on the node, None for -1
+        """
+        if index < 0:
+            return None
+        elif self.terminals[index]:
+            return ColumnarTerminal(self, index)
+        else:
+            return ColumnarExpression(self, index)
+
+    def root(self):
+        """
+        :return: view on the first node, None if the tree is empty
+        """
+        return self.node(0 if len(self.levels) else -1)
+
+
+class ColumnarView:
+    """
+    Attribute access shared by the ColumnarTree node views. A view only
+    holds the tree and the node number, everything else is looked up.
+    The GrammarNode slots it inherits are hidden by the properties and
+    stay empty.
+    """
+    __slots__ = ()
+
+    @property
+    def level(self):
+        return self.tree.levels[self.index]
+
+    @property
+    def expression(self):
+        tree = self.tree
+        return tree.strings[tree.expressions[self.index]]
+
+    @property
+    def symbol(self):
+        tree = self.tree
+        return tree.string_symbols[tree.expressions[self.index]]
+
+    @property
+    def parent(self):
+        tree = self.tree
+        return tree.node(tree.parents[self.index])
+
+    def __eq__(self, other):
+        return (isinstance(other, ColumnarView) and
+                self.tree is other.tree and self.index == other.index)
+
+    def __hash__(self):
+        return hash((id(self.tree), self.index))
+
+
+class ColumnarExpression(ColumnarView, ExpressionNode):
+    """
+    ExpressionNode view on a ColumnarTree node
+    """
+    __slots__ = ('tree', 'index')
+
+    def __init__(self, tree, index):
+        # The GrammarNode attributes are served from the tree
+        self.tree = tree
+        self.index = index
+
+    @property
+    def children(self):
+        return list(self.traverse())
+
+    def add_node(self, level, child):
+        """
+        Columnar trees are filled through ColumnarTree.append
+        """
+        raise TypeError('ColumnarTree nodes are added with ColumnarTree.append')
+
+    def traverse(self):
+        """
+        Go over the branch nodes in order
+        :return:
+        """
+        tree = self.tree
+        next_sibling = tree.next_sibling
+        child = tree.first_child[self.index]
+
+        while child >= 0:
+            yield tree.node(child)
+            child = next_sibling[child]
+
+
+class ColumnarTerminal(ColumnarView, TerminalNode):
+    """
+    TerminalNode view on a ColumnarTree node
+    """
+    __slots__ = ('tree', 'index')
+
+    def __init__(self, tree, index):
+        self.tree = tree
+        self.index = index
@@ -17,14 +17,155 @@
     along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 import re
+import threading
 
 from abc import ABC, abstractmethod
 
 
+class SymbolTable:
+    """
+    Numbers the production names (the left side of an expression) so
+    that nodes can be told apart by comparing integers. A name gets its
+    symbol ID the first time it is seen. The lvalue regular expression
+    runs once for each distinct expression text rather than once for
+    each node, and nodes with the same expression share one string.
+    """
+    expression_l = re.compile(r'<(.+?)>')
+    tag_l = re.compile(r'<([^>]+)>')
+
+    def __init__(self):
+        self.names = []             # Production name for each symbol ID
+        self._symbols = {}          # Production name -> symbol ID
+        self._expressions = {}      # Expression text -> (shared text, symbol ID)
+        self._tags = {}             # Text passed to matches -> symbol ID, None if it is not a tag
+
+        self._lock = threading.Lock()
+
+    def symbol(self, name):
+        """
+        :param name: production name, without the angle brackets
+        :return: symbol ID for the name
+        """
+        symbol = self._symbols.get(name)
+
+        if symbol is None:
+            with self._lock:        # Two threads must not hand out different IDs for a name
+                symbol = self._symbols.get(name)
+
+                if symbol is None:
+                    symbol = len(self.names)
+                    self.names.append(name)
+                    self._symbols[name] = symbol
+
+        return symbol
+
+    def expression(self, expression):
+        """
+        :param expression: expression text from the parse tree
+        :return: shared copy of the text and the symbol ID of its left side
+        """
+        entry = self._expressions.get(expression)
+
+        if entry is None:
+            match = SymbolTable.expression_l.search(expression)
+            entry = self._expressions.setdefault(
+                expression, (expression, self.symbol(match.group(1) if match else None)))
+
+        return entry
+
+    def tag(self, text):
+        """
+        :param text: text to compare expressions against, like '<OF>'
+        :return: symbol ID if the text is a complete '<name>' tag, None otherwise
+        """
+        try:
+            return self._tags[text]
+        except KeyError:
+            match = SymbolTable.tag_l.fullmatch(text)
+            return self._tags.setdefault(text, self.symbol(match.group(1)) if match else None)
+
+
+symbols = SymbolTable()     # Shared by all parse trees in the process
+
+
+class EscapeCache:
+    """
+    Bounded cache of the XML-safe text of terminals. Programs repeat the
+    same identifiers, keywords and literals over and over, so each
+    distinct text is escaped once. Text without any of the characters
+    that break XML is stored as it is, without going through translate.
+    Once max_entries texts are stored the cache starts over.
+    """
+    special_l = re.compile('[&<>"]')
+
+    # Things that break XML
+    entities = str.maketrans({
+        '&': '&amp;',
+        '<': '&lt;',
+        '>': '&gt;',
+        '"': '&#34;&#34;'
+    })
+
+    def __init__(self, max_entries=1 << 16):
+        """
+        :param max_entries: number of texts kept
+        """
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+        self.plain = 0          # Misses that needed no escaping
+
+        self._escaped = {}      # Terminal text -> XML-safe text
+
+    def __len__(self):
+        return len(self._escaped)
+
+    def escape(self, text):
+        """
+        :param text: terminal text
+        :return: text with the XML special characters replaced
+        """
+        escaped = self._escaped.get(text)
+
+        if escaped is not None:
+            self.hits += 1
+            return escaped
+
+        self.misses += 1
+
+        if EscapeCache.special_l.search(text) is None:
+            escaped = text
+            self.plain += 1
+        else:
+            escaped = text.translate(EscapeCache.entities)
+
+        if len(self._escaped) >= self.max_entries:
+            self._escaped.clear()
+
+        self._escaped[text] = escaped
+
+        return escaped
+
+    def counts(self):
+        """
+        :return: hits, misses, plain misses and stored entries
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'plain': self.plain, 'entries': len(self._escaped)}
+
+
+escapes = EscapeCache()     # Shared by all conversions in the process
+
+
 class GrammarNode(ABC):
     """
     GP grammar node interface
     """
+    __slots__ = ('level', 'expression', 'parent')
+
+    symbol = -1     # Symbol ID of the expression, -1 for terminals
+    leaf = True     # True if the node cannot have children
+
     def __init__(self, level, expression):
         self.level = level      # Depth of this node
         self.expression = expression
@@ -38,7 +179,14 @@ class GrammarNode(ABC):
         :param lvalue: text to match
         :return: True if the expression matches, False if not
         """
-        if self.expression.startswith(lvalue):
+        # The text is nearly always a tag like '<OF>'. An expression starts with
+        # such a tag exactly when the tag holds its left side, so the symbol IDs
+        # can be compared instead of the text.
+        symbol = symbols.tag(lvalue)
+
+        if symbol is not None:
+            return symbol == self.symbol
+        elif self.expression.startswith(lvalue):
             return True
         else:
             return False
@@ -49,11 +197,23 @@ class ExpressionNode(GrammarNode):
     GP grammar node to hold an expression. ExpressionNodes may contain
     other GrammarNodes.
     """
-    expression_l = re.compile(r'<(.+?)>')
+    __slots__ = ('symbol', 'children')
+
+    expression_l = SymbolTable.expression_l
+    leaf = False
+
+    def __init__(self, level, expression, symbol=None):
+        """
+        :param level: depth of the node
+        :param expression: expression text
+        :param symbol: symbol ID if expression was already interned by symbols.expression
+        """
+        if symbol is None:
+            expression, symbol = symbols.expression(expression)
 
-    def __init__(self, level, expression):
         super().__init__(level, expression)
 
+        self.symbol = symbol
         self.children = []
 
     def add_node(self, level, child):
@@ -67,11 +227,13 @@ class ExpressionNode(GrammarNode):
         :param child: new child node
         :return:
         """
-        if level > self.level:
-            self.children.append(child)
-            child.parent = self
-        else:
-            self.parent.add_node(level, child)
+        # Walk up instead of recursing so deep trees do not run into the recursion limit
+        node = self
+        while level <= node.level:
+            node = node.parent
+
+        node.children.append(child)
+        child.parent = node
 
     def traverse(self):
         """
@@ -80,6 +242,15 @@ class ExpressionNode(GrammarNode):
         """
         yield from self.children
 
+    def statement(self, factory, parent):
+        """
+        Create the diagram node for this grammar node only
+        :param factory: StatementFactory
+        :param parent: Statement node above this expression
+        :return:
+        """
+        return factory.node(self, parent)
+
     def export_node(self, factory, parent):
         """
         Create the diagram node for this grammar node
@@ -87,7 +258,7 @@ class ExpressionNode(GrammarNode):
         :param parent: Statement node above this expression
         :return:
         """
-        # Build our own Statement node
+        # Build our own Statement node, which builds the rest of the subtree
         statement = factory.node(self, parent)
         statement.import_expressions(factory)
 
@@ -97,21 +268,16 @@ class ExpressionNode(GrammarNode):
         """
         :return: left side of the expression without the angle brackets
         """
-        return ExpressionNode.expression_l.search(self.expression).group(1)
+        return symbols.names[self.symbol]
 
 
 class TerminalNode(GrammarNode):
     """
     GP grammar node to hold terminals. TerminalNodes are leaf nodes.
     """
+    __slots__ = ()
 
-    # Things that break XML
-    entities = str.maketrans({
-        '&': '&amp;',
-        '<': '&lt;',
-        '>': '&gt;',
-        '"': '&#34;&#34;'
-    })
+    entities = EscapeCache.entities
 
     def add_node(self, level, child):
         """
@@ -122,7 +288,7 @@ class TerminalNode(GrammarNode):
         """
         pass
 
-    def export_node(self, factory, parent):
+    def statement(self, factory, parent):
         """
         Create the diagram node for this grammar node
         :param factory: StatementFactory
@@ -131,6 +297,15 @@ class TerminalNode(GrammarNode):
         """
         return factory.terminal(self, parent)
 
+    def export_node(self, factory, parent):
+        """
+        Create the diagram node for this grammar node
+        :param factory: StatementFactory
+        :param parent: Statement node above this expression
+        :return:
+        """
+        return self.statement(factory, parent)
+
     def render(self):
         """
         A DiagramTerminal returns its keyword as an XML-safe string
@@ -138,4 +313,4 @@ class TerminalNode(GrammarNode):
         :param factory: diagram node factory class
         :return:
         """
-        return self.expression.translate(TerminalNode.entities)
+        return escapes.escape(self.expression)
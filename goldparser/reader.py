@@ -0,0 +1,193 @@
+"""
+    gpstruct.py Convert a GOLDParser parse tree export to Structorizer XML
+
+    Copyright (C) 2022  Sven Coenye
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import mmap
+import os
+import re
+
+
+class MappedExport:
+    """
+    Parse tree export file read through a memory map. The parse tree
+    lines are found by scanning the bytes; only the expression part of
+    each line is decoded, and each distinct expression only once. Any
+    single byte encoding (cp1252, latin-1, ...) or UTF-8 can be used,
+    the file is never decoded as a whole.
+    Pass it to GPStruct in place of a text file. Files that cannot be
+    mapped, like pipes, are read into memory instead.
+    """
+
+    blank_l = re.compile(rb'^[ \t\r\f\v]*$', re.MULTILINE)
+    chunk_size = 1 << 20    # Bytes of the map split into lines at a time
+
+    def __init__(self, gp_file, encoding='utf-8'):
+        """
+        :param gp_file: path or binary file
+        :param encoding: encoding of the export
+        """
+        self.encoding = encoding
+
+        self._file = open(gp_file, 'rb') if isinstance(gp_file, (str, bytes, os.PathLike)) else None
+        self._map = None
+        self._strings = {}      # Decoded expressions
+
+        self.malformed = None   # First tree line without an expression, once tree_lines has stopped at it
+
+        source = self._file or gp_file
+
+        try:
+            self._map = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+            self.data = self._map
+        except (AttributeError, OSError, ValueError):
+            # Empty files, pipes and in-memory streams cannot be mapped
+            self.data = source.read()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Release the map and the file
+        :return:
+        """
+        self.data = b''
+        self._strings = {}
+
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _section(self):
+        # Start and end offset of the parse tree section: the header ends at the first
+        # blank line, the section at the next one.
+        data = self.data
+        header = self.blank_l.search(data)
+
+        if header is None:
+            return 0, 0
+
+        start = data.find(b'\n', header.end()) + 1
+
+        if start == 0:
+            return 0, 0
+
+        end = self.blank_l.search(data, start)
+
+        return start, end.start() if end else len(data)
+
+    def tree_lines(self):
+        """
+        Generate the level and expression of each line in the parse
+        tree section, as GPStruct._read_tree does for a text file.
+        Stops at the first line without an expression after +--, which
+        is kept in malformed.
+        :return: generator of (level, expression) pairs
+        """
+        data = self.data
+        start, end = self._section()
+        strings = self._strings
+        encoding = self.encoding
+
+        while start < end:
+            # Work on whole lines, a chunk at a time, so only one chunk is copied out of the map
+            cut = data.rfind(b'\n', start, min(start + self.chunk_size, end)) + 1
+
+            if cut <= start:
+                cut = data.find(b'\n', start, end) + 1 or end
+
+            for line in data[start:cut].split(b'\n'):
+                # The level part holds the vertical bars, the expression everything after the first +--
+                line = line.strip()
+                level, separator, expression = line.partition(b'+--')
+
+                if not expression:
+                    if line:    # The split leaves an empty line after the last line end
+                        self.malformed = line.decode(encoding, 'replace')
+                        return
+                else:
+                    text = strings.get(expression)
+
+                    if text is None:
+                        # Whitespace outside ASCII, like a no-break space, only shows once decoded
+                        text = strings[expression] = expression.decode(encoding).rstrip()
+
+                    yield level.count(b'|'), text
+
+            start = cut
+
+
+class _Levels(dict):
+    # Level for each distinct text in front of +--, the vertical bars counted once
+    def __missing__(self, prefix):
+        level = self[prefix] = prefix.count('|')
+        return level
+
+
+class TreeTokenizer:
+    """
+    Reads the parse tree section of a text export line by line. Each
+    line is stripped of its line end and trailing whitespace and
+    partitioned on its first +-- in C; the level of each distinct
+    prefix is counted only once. A +-- in the text of a line is kept.
+    """
+
+    def __init__(self, gp_file):
+        """
+        :param gp_file: parse tree export as a text file
+        """
+        self.gp_file = gp_file
+        self.malformed = None   # First line without an expression, once lines has stopped at it
+
+    def lines(self):
+        """
+        Generate the level and expression of each tree line, as
+        GPStruct._read_tree does. Stops at the first line without an
+        expression after +--, which is kept in malformed.
+        :return: generator of (level, expression) pairs
+        """
+        gp_file = self.gp_file
+
+        # The header ends at the first blank line
+        for line in gp_file:
+            if line.strip() == '':
+                break
+
+        levels = _Levels()
+
+        for line in gp_file:
+            line = line.rstrip()
+
+            if not line:
+                break
+
+            prefix, _, text = line.partition('+--')
+
+            # Partition leaves the expression empty both without a +-- and with nothing after it
+            if not text:
+                self.malformed = line
+                break
+
+            yield levels[prefix], text
@@ -0,0 +1,319 @@
+"""
+    gpstruct.py Convert a GOLDParser parse tree export to Structorizer XML
+
+    Copyright (C) 2022  Sven Coenye
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import gc
+import struct
+import sys
+import zlib
+
+from array import array
+
+from goldparser.columnar import ColumnarExpression, ColumnarTree
+from goldparser.grammar import ExpressionNode, TerminalNode, symbols
+
+
+class SnapshotError(ValueError):
+    """
+    The file is not a parse tree snapshot this version can read
+    """
+    pass
+
+
+class TreeSnapshot:
+    """
+    Compact binary copy of a parse tree, quicker to load than the text
+    export it was parsed from.
+    Layout, little-endian:
+      header: magic, format version, CRC-32 of the rest of the file
+      counts: nodes, strings, size of the string table
+      string table: the distinct expressions and terminals, UTF-8, newline separated
+      arrays: level, parent + 1 and string number of each node in tree
+              order, then a byte per node that is 1 for terminals.
+              Each array is stored with the smallest unsigned item size
+              that holds its values, given by a type code before it.
+    Symbol IDs are not stored, they only hold within one process.
+    """
+
+    magic = b'GPTREE'
+    version = 1
+
+    header_s = struct.Struct('<6sHI')
+    counts_s = struct.Struct('<III')
+    array_s = struct.Struct('<cI')      # Type code and length in bytes
+
+    @staticmethod
+    def _nodes(root):
+        # Tree order walk that does not recurse
+        pending = [root]
+
+        while pending:
+            node = pending.pop()
+            yield node
+
+            if not node.leaf:
+                pending.extend(reversed(list(node.traverse())))
+
+    @classmethod
+    def _pack(cls, values):
+        # Smallest unsigned array type holding the values
+        largest = max(values, default=0)
+
+        for code in 'BHIL':
+            if largest < 1 << (8 * array(code).itemsize):
+                break
+
+        packed = array(code, values)
+
+        if sys.byteorder == 'big':
+            packed.byteswap()
+
+        data = packed.tobytes()
+
+        return cls.array_s.pack(code.encode('ascii'), len(data)) + data
+
+    @classmethod
+    def _unpack(cls, data, offset):
+        code, size = cls.array_s.unpack_from(data, offset)
+        offset += cls.array_s.size
+
+        values = array(code.decode('ascii'))
+        values.frombytes(data[offset:offset + size])
+
+        if sys.byteorder == 'big':
+            values.byteswap()
+
+        return values, offset + size
+
+    @classmethod
+    def _arrays(cls, root):
+        # Strings, levels, parents + 1, string numbers and terminal flags of the nodes in tree order
+        if isinstance(root, ColumnarExpression) and root.index == 0:
+            # A whole ColumnarTree is already laid out that way
+            tree = root.tree
+            parents = array('L', (parent + 1 for parent in tree.parents))
+
+            return tree.strings, tree.levels, parents, tree.expressions, tree.terminals
+
+        levels = array('L')
+        parents = array('L')
+        expressions = array('L')
+        terminals = bytearray()
+
+        strings = []
+        string_index = {}
+        node_index = {}
+
+        for number, node in enumerate(cls._nodes(root)):
+            expression = node.expression
+            string = string_index.get(expression)
+
+            if string is None:
+                string = string_index[expression] = len(strings)
+                strings.append(expression)
+
+            node_index[node] = number
+
+            levels.append(node.level)
+            parents.append(0 if node is root else node_index[node.parent] + 1)
+            expressions.append(string)
+            terminals.append(1 if node.leaf else 0)
+
+        return strings, levels, parents, expressions, terminals
+
+    @classmethod
+    def dumps(cls, root):
+        """
+        :param root: root GrammarNode of a parse tree, object or columnar
+        :return: snapshot as bytes
+        """
+        strings, levels, parents, expressions, terminals = cls._arrays(root)
+        string_table = '\n'.join(strings).encode('utf-8')
+
+        payload = b''.join((cls.counts_s.pack(len(levels), len(strings), len(string_table)),
+                            string_table,
+                            cls._pack(levels),
+                            cls._pack(parents),
+                            cls._pack(expressions),
+                            bytes(terminals)))
+
+        return cls.header_s.pack(cls.magic, cls.version, zlib.crc32(payload)) + payload
+
+    @classmethod
+    def _read(cls, data):
+        # Check the header and split the payload into its parts
+        if len(data) < cls.header_s.size:
+            raise SnapshotError('File too short for a parse tree snapshot')
+
+        magic, version, checksum = cls.header_s.unpack_from(data)
+
+        if magic != cls.magic:
+            raise SnapshotError('Not a parse tree snapshot')
+
+        if version != cls.version:
+            raise SnapshotError('Unsupported snapshot version {}, expected {}'.format(version, cls.version))
+
+        payload = memoryview(data)[cls.header_s.size:]
+
+        if zlib.crc32(payload) != checksum:
+            raise SnapshotError('Snapshot checksum mismatch, the file is damaged')
+
+        try:
+            count, string_count, table_size = cls.counts_s.unpack_from(payload)
+            offset = cls.counts_s.size
+
+            strings = bytes(payload[offset:offset + table_size]).decode('utf-8').split('\n')
+            offset += table_size
+
+            levels, offset = cls._unpack(payload, offset)
+            parents, offset = cls._unpack(payload, offset)
+            expressions, offset = cls._unpack(payload, offset)
+            terminals = bytes(payload[offset:offset + count])
+        except (struct.error, UnicodeDecodeError, ValueError) as error:
+            raise SnapshotError('Damaged snapshot: {}'.format(error))
+
+        if (len(strings) != string_count or len(levels) != count or len(parents) != count or
+                len(expressions) != count or len(terminals) != count):
+            raise SnapshotError('Damaged snapshot: counts do not match')
+
+        return strings, levels, parents, expressions, terminals
+
+    @classmethod
+    def loads(cls, data, columnar=False):
+        """
+        :param data: snapshot as bytes
+        :param columnar: load into a ColumnarTree
+        :return: root of the parse tree, None for an empty tree
+        """
+        strings, levels, parents, expressions, terminals = cls._read(data)
+
+        if not levels:
+            return None
+
+        if columnar:
+            return cls._columnar(strings, levels, parents, expressions, terminals)
+
+        # Intern each expression once instead of once per node
+        interned = [None if terminal else symbols.expression(text)
+                    for text, terminal in zip(strings, cls._terminal_strings(expressions, terminals, len(strings)))]
+
+        nodes = []
+        append = nodes.append
+
+        # The nodes only become garbage with the whole tree. Collections while the
+        # tree is built would only walk it over and over.
+        collecting = gc.isenabled()
+        gc.disable()
+
+        try:
+            for level, parent, string, terminal in zip(levels, parents, expressions, terminals):
+                if terminal:
+                    node = TerminalNode(level, strings[string])
+                else:
+                    expression, symbol = interned[string]
+                    node = ExpressionNode(level, expression, symbol)
+
+                if parent:
+                    parent_node = nodes[parent - 1]
+                    parent_node.children.append(node)
+                    node.parent = parent_node
+
+                append(node)
+        finally:
+            if collecting:
+                gc.enable()
+
+        return nodes[0]
+
+    @staticmethod
+    def _terminal_strings(expressions, terminals, string_count):
+        # Flag per string, True if the string is a terminal
+        flags = bytearray(string_count)
+
+        for string, terminal in zip(expressions, terminals):
+            if terminal:
+                flags[string] = 1
+
+        return flags
+
+    @classmethod
+    def _columnar(cls, strings, levels, parents, expressions, terminals):
+        tree = ColumnarTree()
+        count = len(levels)
+
+        tree.levels = array('i', levels)
+        tree.parents = array('i', (parent - 1 for parent in parents))
+        tree.expressions = array('i', expressions)
+        tree.terminals = bytearray(terminals)
+
+        # Expressions are interned as the parser does, terminals keep symbol -1
+        tree.strings = []
+        tree.string_symbols = array('i')
+
+        for text, terminal in zip(strings, cls._terminal_strings(expressions, terminals, len(strings))):
+            if terminal:
+                symbol = -1
+            else:
+                text, symbol = symbols.expression(text)
+
+            tree.strings.append(text)
+            tree.string_symbols.append(symbol)
+
+        # Child and sibling links follow from the parents, children being in tree order
+        first_child = array('i', [-1]) * count
+        next_sibling = array('i', [-1]) * count
+        last_child = array('i', [-1]) * count
+
+        for index in range(1, count):
+            parent = tree.parents[index]
+            last = last_child[parent]
+
+            if last < 0:
+                first_child[parent] = index
+            else:
+                next_sibling[last] = index
+
+            last_child[parent] = index
+
+        tree.first_child = first_child
+        tree.next_sibling = next_sibling
+        tree.close()
+
+        return tree.root()
+
+    @classmethod
+    def save(cls, root, path):
+        """
+        Write a snapshot file
+        :param root: root GrammarNode of a parse tree
+        :param path: output file
+        :return:
+        """
+        with open(path, 'wb') as snapshot_file:
+            snapshot_file.write(cls.dumps(root))
+
+    @classmethod
+    def load(cls, path, columnar=False):
+        """
+        Read a snapshot file
+        :param path: snapshot file
+        :param columnar: load into a ColumnarTree
+        :return: root of the parse tree
+        """
+        with open(path, 'rb') as snapshot_file:
+            return cls.loads(snapshot_file.read(), columnar)
@@ -20,10 +20,38 @@
 """
 
 import argparse
+import codecs
+import cProfile
+import glob
+import io
+import json
+import os
+import pstats
 import sys
+import threading
+import time
+import tracemalloc
 
-from goldparser.grammar import ExpressionNode, TerminalNode
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+from goldparser.columnar import ColumnarTree
+from goldparser.grammar import ExpressionNode, TerminalNode, escapes, symbols
+from goldparser.reader import MappedExport, TreeTokenizer
+from goldparser.snapshot import SnapshotError, TreeSnapshot
+from structorizer.cache import ConversionCache
+from structorizer.compression import formats, input_format, open_input, open_output, path_format, strip_extension
 from structorizer.factory import StatementFactory
+from structorizer.nodes import DiagramNode, Statement
+from structorizer.output import RenderBuffer, backends
+from structorizer.xref import CrossReference
+
+
+class ParseTreeError(ValueError):
+    """
+    The input is not a usable GOLDParser parse tree export
+    """
 
 
 class GPStruct:
@@ -32,61 +60,498 @@ class GPStruct:
     Structorizer XML
     """
 
-    def __init__(self):
+    fragment_lines = 32     # Smallest unit kept in a fragment cache
+    parallel_lines = 2000   # Lines of units sent to a worker process at a time
+    strict = False          # Raise ParseTreeError on a bad parse tree instead of printing the problem
+
+    def __init__(self, columnar=False):
         self.gp_root = None
         self.diagram_root = None
 
+        self.columnar = columnar    # Keep the parse tree in a ColumnarTree
+
+    def _read_tree(self, gp_file):
+        """
+        Generate the level and expression of each line in the parse tree
+        section of a GOLDParser export file. Every pair has an expression;
+        a line without one ends the section as a bad parse tree.
+        :param gp_file: parse tree export file, or a MappedExport
+        :return: generator of (level, expression) pairs
+        """
+        # Parse tree files have two sections, each with a header. The header and section
+        # are separated by a blank line.
+        if isinstance(gp_file, MappedExport):
+            reader = gp_file
+            yield from reader.tree_lines()
+        else:
+            reader = TreeTokenizer(gp_file)
+            yield from reader.lines()
+
+        if reader.malformed is not None:
+            self._bad_tree('Bad parsetree file. No expression on line {!r}'.format(reader.malformed))
+
     @staticmethod
-    def _split_line(line):
-        # Each line has a level part and an expression part, separated by +--
-        # Split the line on the +-- and replace the vertical bars with the bar count.
-        parts = line.split('+--', maxsplit=1)  # In case the definition contains an expression
-        parts[0] = parts[0].count('|')  # Replace tree level string with the equivalent number
+    def _is_terminal(expression):
+        # line contains a terminal if it starts with <, but just < means 'less than'
+        return expression[0] != '<' or expression == '<'
 
-        return parts
+    @staticmethod
+    def _grammar_node(level, expression):
+        if GPStruct._is_terminal(expression):
+            return TerminalNode(level, expression)
+        else:
+            return ExpressionNode(level, expression)
 
-    def parse(self, gp_file):
+    def _bad_tree(self, message):
         """
-        Process a GoldParser grammar tree export file. The result is a
-        tree made of GrammarNodes.
-        :param gp_file:
+        Report a problem with the parse tree. In strict mode this raises
+        ParseTreeError, otherwise the message is printed on stderr and
+        the conversion carries on with what was read so far.
+        :param message: description of the problem
         :return:
         """
-        # Parse tree files have two sections, each with a header. The header and section
-        # are separated by a blank line.
-        for line in gp_file:            # Skip the Parse Tree header
-            if line.strip() == '':      # strip because line endings
-                break
+        if self.strict:
+            raise ParseTreeError(message)
 
-        parts = self._split_line(gp_file.readline().strip())        # Normally the <program> line
+        print(message, file=sys.stderr)
 
+    def _start_tree(self, parts):
+        """
+        Create the root of the parse tree from the first line of the tree section
+        :param parts: level and expression of the first line, None if the section is empty
+        :return: root ExpressionNode, or None if the line does not start a tree
+        """
         # The first line should be at level 0. If not, we punt.
-        if parts[0] != 0:
-            print('Bad parsetree file. Initial statement is not at level 0')
-            print('Found {} at level {}'. format(parts[1], parts[0]))
+        if parts is None:
+            self._bad_tree('Bad parsetree file. No parse tree section found')
+        elif parts[0] != 0:
+            self._bad_tree('Bad parsetree file. Initial statement is not at level 0\n'
+                           'Found {} at level {}'.format(parts[1], parts[0]))
         else:
             # Expressions start with a keyword in angle brackets
-            if parts[1][0] != '<':
-                print('Unable to detect a starting expression.')
+            if len(parts) < 2 or not parts[1].startswith('<'):
+                self._bad_tree('Unable to detect a starting expression.')
             else:
-                self.gp_root = ExpressionNode(parts[0], parts[1])
-                last_node = self.gp_root
+                return ExpressionNode(parts[0], parts[1])
+
+        return None
+
+    def _grow_tree(self, root, lines):
+        """
+        Attach the remaining parse tree lines below the root expression
+        :param root: ExpressionNode for the first line
+        :param lines: level and expression pairs following the first line
+        :return:
+        """
+        open_nodes = [root]     # Expressions still accepting children, deepest last
+
+        for level, expression in lines:
+            # Every expression at or below the level of this line is complete. The
+            # deepest one left open is the parent. Each expression is pushed and
+            # popped once, so attaching a line does not depend on the tree depth.
+            while open_nodes and open_nodes[-1].level >= level:
+                open_nodes.pop()
+
+            if not open_nodes:
+                self._bad_tree('Bad parsetree file. Found {} at level {} outside the initial statement'.format(
+                    expression, level))
+                break
+
+            new_node = self._grammar_node(level, expression)
+            open_nodes[-1].add_node(level, new_node)
+
+            if isinstance(new_node, ExpressionNode):
+                open_nodes.append(new_node)     # Descend to the next level
+
+    def _grow_columnar(self, parts, lines):
+        """
+        Store the parse tree lines in a ColumnarTree
+        :param parts: level and expression of the first line
+        :param lines: level and expression pairs following the first line
+        :return: view on the root node
+        """
+        tree = ColumnarTree()
+        tree.append(parts[0], parts[1], False)
+
+        for level, expression in lines:
+            try:
+                tree.append(level, expression, self._is_terminal(expression))
+            except ValueError as error:
+                self._bad_tree('Bad parsetree file. {}'.format(error))
+                break
 
-                for line in gp_file:  # Process the parse tree and stop at the end of the section
-                    line = line.strip()
-                    if line == '':
-                        break
+        tree.close()
 
-                    parts = self._split_line(line)      # Break up in level and expression
+        return tree.root()
 
-                    # line contains a terminal if it starts with <, but just < means 'less than'
-                    if parts[1][0] != '<' or parts[1] == '<':
-                        new_node = TerminalNode(parts[0], parts[1])
-                        last_node.add_node(parts[0], new_node)
+    @staticmethod
+    def _prune(lines, pruned):
+        """
+        Leave out the lines of pruned productions and of everything below
+        them. No nodes are created for the lines that are skipped.
+        :param lines: level and expression pairs
+        :param pruned: symbol IDs of the productions to leave out
+        :return: generator of the remaining level and expression pairs
+        """
+        verdicts = {}           # Expression text -> True if pruned, terminals included
+        skip_level = None       # Level of the pruned expression whose lines are being skipped
+
+        for parts in lines:
+            if skip_level is not None:
+                if parts[0] > skip_level:
+                    continue
+
+                skip_level = None
+
+            expression = parts[1]
+            verdict = verdicts.get(expression)
+
+            if verdict is None:
+                verdict = verdicts[expression] = (not GPStruct._is_terminal(expression) and
+                                                  symbols.expression(expression)[1] in pruned)
+
+            if verdict:
+                skip_level = parts[0]
+                continue
+
+            yield parts
+
+    def parse(self, gp_file, factory=None):
+        """
+        Process a GoldParser grammar tree export file. The result is a
+        tree made of GrammarNodes, or views on a ColumnarTree if the
+        columnar option is set.
+        :param gp_file:
+        :param factory: StatementFactory whose pruned productions are left
+                        out of the tree, None to keep every line
+        :return:
+        """
+        self._plant(self._read_tree(gp_file), factory)
+
+    def prune(self, factory):
+        """
+        Leave the pruned productions of a factory out of a tree that holds
+        them all, like one loaded from a snapshot, as parse does while it
+        reads an export
+        :param factory: StatementFactory
+        :return:
+        """
+        if self.gp_root is not None:
+            self._plant(self._tree_lines(self.gp_root), factory)
+
+    def _plant(self, lines, factory):
+        """
+        Grow the parse tree from its lines
+        :param lines: level and expression pairs, starting with the root
+        :param factory: StatementFactory whose pruned productions are left
+                        out of the tree, None to keep every line
+        :return:
+        """
+        parts = next(lines, None)       # Normally the <program> line
+        self.gp_root = self._start_tree(parts)
+
+        if self.gp_root is not None:
+            if factory is not None:
+                lines = self._prune(lines, factory.pruned_symbols())
+
+            if self.columnar:
+                self.gp_root = self._grow_columnar(parts, lines)
+            else:
+                self._grow_tree(self.gp_root, lines)
+
+    @staticmethod
+    def _tree_lines(root):
+        """
+        Generate the lines of a parse tree back from its nodes, in export order
+        :param root: root GrammarNode
+        :return: generator of (level, expression) pairs
+        """
+        stack = [iter((root,))]
+
+        while stack:
+            for node in stack[-1]:
+                yield node.level, node.expression
+
+                if not node.leaf:
+                    stack.append(iter(node.traverse()))
+                    break
+            else:
+                stack.pop()
+
+    def save_snapshot(self, path):
+        """
+        Save the parsed tree as a TreeSnapshot
+        :param path: snapshot file
+        :return:
+        """
+        TreeSnapshot.save(self.gp_root, path)
+
+    def load_snapshot(self, path):
+        """
+        Load a tree saved by save_snapshot in place of parsing an export
+        :param path: snapshot file
+        :return:
+        """
+        self.gp_root = TreeSnapshot.load(path, self.columnar)
+        self.diagram_root = None
+
+    def _units(self, lines, factory, raw=False):
+        """
+        Split the parse tree into units that can be exported, built and
+        rendered on their own. A unit is a subtree whose ancestors all
+        pass their children through (the diagram root, unmapped
+        expressions like statement_list, ...). The ancestors are reported
+        as they open and close, each unit as soon as its last line is read.
+        Units are not attached to the tree so they can be dropped once
+        they have been dealt with.
+        :param lines: level and expression pairs following the first line
+        :param factory: StatementFactory
+        :param raw: report the units as their list of [level, expression] lines
+                    instead of building their GrammarNodes
+        :return: generator of ('open', Statement, None), ('close', Statement, None)
+                 and ('unit', GrammarNode or lines, parent Statement) tuples
+        """
+        root_statement = factory.node(self.gp_root, None)
+
+        if not root_statement.passes_through():
+            # Nothing can be split off. The whole tree is a single unit.
+            if raw:
+                yield 'unit', [[self.gp_root.level, self.gp_root.expression]] + list(lines), None
+            else:
+                self._grow_tree(self.gp_root, lines)
+                yield 'unit', self.gp_root, None
+            return
+
+        yield 'open', root_statement, None
+
+        # Open pass-through containers as (GrammarNode, Statement), deepest last
+        containers = [(self.gp_root, root_statement)]
+
+        # Unit being read: its root or lines, level, parent container and, when
+        # building nodes, its expressions still accepting children, deepest last
+        unit = None
+        unit_level = 0
+        owner = None
+        open_nodes = []
+
+        for level, expression in lines:
+            if unit is not None:
+                if level > unit_level:
+                    if raw:
+                        unit.append([level, expression])
                     else:
-                        new_node = ExpressionNode(parts[0], parts[1])
-                        last_node.add_node(parts[0], new_node)
-                        last_node = new_node    # Descend to the next level
+                        # As in _grow_tree: the deepest expression left open below this level is the
+                        # parent, so a line after a deep subtree does not walk back up through it
+                        while open_nodes[-1].level >= level:
+                            open_nodes.pop()
+
+                        new_node = self._grammar_node(level, expression)
+                        open_nodes[-1].add_node(level, new_node)
+
+                        if not new_node.leaf:
+                            open_nodes.append(new_node)
+                    continue
+
+                yield 'unit', unit, owner
+                unit = None
+
+            while containers and containers[-1][0].level >= level:
+                yield 'close', containers.pop()[1], None
+
+            if not containers:
+                self._bad_tree('Bad parsetree file. Found {} at level {} outside the initial statement'.format(
+                    expression, level))
+                break
+
+            parent, container = containers[-1]
+            new_node = self._grammar_node(level, expression)
+            new_node.parent = parent
+
+            if new_node.leaf:
+                yield 'unit', [[level, expression]] if raw else new_node, container
+            else:
+                statement = factory.node(new_node, container)
+
+                if statement.passes_through():
+                    yield 'open', statement, None
+                    containers.append((new_node, statement))
+                else:
+                    unit = [[level, expression]] if raw else new_node
+                    unit_level = level
+                    owner = container
+                    open_nodes = [new_node]
+
+        if unit is not None:
+            yield 'unit', unit, owner
+
+        while containers:
+            yield 'close', containers.pop()[1], None
+
+    @staticmethod
+    def _unit_text(gp_node):
+        """
+        :param gp_node: root of a unit
+        :return: the unit's parse tree lines, with levels relative to gp_node, as bytes
+        """
+        base = gp_node.level
+        lines = []
+        pending = [gp_node]
+
+        while pending:
+            node = pending.pop()
+            lines.append('{} {}\n'.format(node.level - base, node.expression))
+
+            if not node.leaf:
+                pending.extend(reversed(node.children))
+
+        return ''.join(lines).encode('utf-8')
+
+    def _convert_unit(self, gp_node, parent, factory, buffer, fragments):
+        """
+        Export, build and render a unit. With a fragment cache, units of
+        fragment_lines lines or more are looked up first and stored
+        after rendering. Smaller units are cheaper to convert than to
+        look up.
+        :param gp_node: root of the unit
+        :param parent: Statement the unit belongs to
+        :param factory: StatementFactory
+        :param buffer: RenderBuffer
+        :param fragments: ConversionCache for the rendered units, or None
+        :return:
+        """
+        key = None
+
+        # The fragment store is not dated. A unit holding the whole tree renders the
+        # diagram root with its creation date and is not stored.
+        if fragments is not None and gp_node is not self.gp_root:
+            data = self._unit_text(gp_node)
+
+            if data.count(b'\n') >= self.fragment_lines:
+                key = fragments.key(data)
+                xml = fragments.get(key)
+
+                if xml is not None:
+                    buffer.write(xml.decode('utf-8'))
+                    return
+
+        statement = gp_node.export_node(factory, parent)
+        statement.build('instruction')      # build_diagram starts the root with 'instruction'
+
+        if key is None:
+            statement.render(buffer)
+        else:
+            with io.StringIO() as output:
+                statement.render(output)
+                xml = output.getvalue()
+
+            fragments.put(key, xml.encode('utf-8'))
+            buffer.write(xml)
+
+    def stream(self, gp_file, factory, out_file, fragments=None):
+        """
+        Convert a GoldParser grammar tree export file to Structorizer XML
+        without holding the whole tree. Each unit (see _units) is
+        exported, built and rendered as soon as it is complete and
+        dropped afterwards, so memory is bounded by the largest unit
+        rather than by the file. The output is identical to that of
+        parse, build_render_nodes, build_diagram and render. Neither
+        gp_root nor diagram_root hold the tree afterwards.
+        A unit only depends on its own lines, so with a fragment cache
+        the XML rendered for a unit is kept and reused for identical
+        units, in this file or in a later run.
+        :param gp_file: parse tree export file
+        :param factory: StatementFactory
+        :param out_file: XML output destination, text or binary
+        :param fragments: ConversionCache for the rendered units, or None
+        :return:
+        """
+        lines = self._read_tree(gp_file)
+        self.gp_root = self._start_tree(next(lines, None))
+
+        if self.gp_root is None:
+            return
+
+        lines = self._prune(lines, factory.pruned_symbols())
+
+        backend = Statement.backend
+
+        with RenderBuffer(out_file) as buffer:
+            for action, node, parent in self._units(lines, factory):
+                if action == 'open':
+                    backend.open(node, buffer)
+                elif action == 'close':
+                    backend.close(node, buffer)
+                else:
+                    self._convert_unit(node, parent, factory, buffer, fragments)
+
+    def parallel(self, gp_file, factory, out_file, workers=None):
+        """
+        Convert a GoldParser grammar tree export file to Structorizer XML,
+        exporting, building and rendering the units (see _units) on a
+        pool of worker processes. The file is read here; the lines of
+        each unit are sent to the workers as soon as the unit is
+        complete, a few units at a time, and the XML that comes back is
+        written in the original order. The output is identical to that
+        of the other conversions. As with stream, neither gp_root nor
+        diagram_root hold the tree afterwards.
+        :param gp_file: parse tree export file
+        :param factory: StatementFactory
+        :param out_file: XML output destination, text or binary
+        :param workers: number of worker processes, defaults to the available cores
+        :return:
+        """
+        lines = self._read_tree(gp_file)
+        self.gp_root = self._start_tree(next(lines, None))
+
+        if self.gp_root is None:
+            return
+
+        lines = self._prune(lines, factory.pruned_symbols())
+        pieces = deque()        # XML text and futures of the XML rendered by the workers, in output order
+        chunk = []              # Units waiting to be sent
+        chunk_lines = 0
+        backend = Statement.backend
+
+        with ProcessPoolExecutor(max_workers=workers or _available_cores(), initializer=_start_unit_worker,
+                                 initargs=(factory, backend)) as pool, RenderBuffer(out_file) as buffer:
+            for action, node, parent in self._units(lines, factory, raw=True):
+                if action == 'unit':
+                    chunk.append(node)
+                    chunk_lines += len(node)
+
+                    if chunk_lines < self.parallel_lines:
+                        continue
+                else:
+                    # Most containers, like statement_list, write nothing. Those need not hold up the units.
+                    with io.StringIO() as output:
+                        if action == 'open':
+                            backend.open(node, output)
+                        else:
+                            backend.close(node, output)
+
+                        xml = output.getvalue()
+
+                    if not xml:
+                        continue
+
+                if chunk:
+                    pieces.append(pool.submit(_convert_units, chunk))
+                    chunk = []
+                    chunk_lines = 0
+
+                if action != 'unit':
+                    pieces.append(xml)
+
+                # Write out whatever is ready at the head of the queue
+                while pieces and (isinstance(pieces[0], str) or pieces[0].done()):
+                    piece = pieces.popleft()
+                    buffer.write(piece if isinstance(piece, str) else piece.result())
+
+            if chunk:
+                pieces.append(pool.submit(_convert_units, chunk))
+
+            for piece in pieces:
+                buffer.write(piece if isinstance(piece, str) else piece.result())
 
     def build_render_nodes(self, factory):
         """
@@ -107,21 +572,984 @@ class GPStruct:
     def render(self, out_file):
         """
         Render the parsed GP file as Structorizer XML
+        :param out_file: XML output destination, text or binary
         :return:
         """
         self.diagram_root.render(out_file)
 
+    def convert(self, gp_file, factory, out_file, stream=False, fragments=None, workers=None):
+        """
+        Convert a parse tree export file to Structorizer XML in one go.
+        Nothing is rendered if the file does not hold a parse tree.
+        :param gp_file: parse tree export file
+        :param factory: StatementFactory
+        :param out_file: XML output destination, text or binary
+        :param stream: use the streaming conversion
+        :param fragments: ConversionCache to reuse the XML of unchanged top level
+                          statements from, implies stream
+        :param workers: number of processes to convert the top level statements on,
+                        0 for the available cores, None to convert them here
+        :return: True if a parse tree was found
+        """
+        self.gp_root = None
+        self.diagram_root = None
+
+        if workers is not None:
+            self.parallel(gp_file, factory, out_file, workers)
+        elif stream or fragments is not None:
+            self.stream(gp_file, factory, out_file, fragments)
+        else:
+            self.parse(gp_file, factory)
 
-if __name__ == '__main__':
+            if self.gp_root is not None:
+                self.build_render_nodes(factory)
+                self.build_diagram()
+                self.render(out_file)
+
+        return self.gp_root is not None
+
+    def convert_cached(self, gp_data, factory, out_file, cache, stream=False, encoding='utf-8', fragments=None,
+                       workers=None):
+        """
+        Convert a parse tree export through a ConversionCache. On a cache
+        hit the stored XML is written without parsing anything.
+        Exports without a parse tree are not cached.
+        :param gp_data: parse tree export as bytes
+        :param factory: StatementFactory
+        :param out_file: XML output destination, text or binary
+        :param cache: ConversionCache
+        :param stream: use the streaming conversion on a cache miss
+        :param encoding: encoding of gp_data
+        :param fragments: fragment cache used on a cache miss, see convert
+        :param workers: worker processes used on a cache miss, see convert
+        :return: True if a parse tree was found
+        """
+        key = cache.key(gp_data, encoding)
+        xml = cache.get(key)
+
+        if xml is None:
+            # newline=None gives the universal newlines of a file opened in text mode
+            with io.StringIO(gp_data.decode(encoding), newline=None) as gp_file, io.BytesIO() as output:
+                if not self.convert(gp_file, factory, output, stream, fragments, workers):
+                    return False
+
+                xml = output.getvalue()
+
+            cache.put(key, xml)
+        else:
+            self.gp_root = None
+            self.diagram_root = None
+
+        if isinstance(out_file, (io.RawIOBase, io.BufferedIOBase)):
+            out_file.write(xml)
+        else:
+            out_file.write(xml.decode('utf-8'))
+
+        return True
+
+
+class Converter:
+    """
+    Conversion interface for use as a library. A Converter only holds
+    its settings; each call parses into a GPStruct of its own that is
+    dropped before the call returns, so one instance can be reused for
+    any number of conversions. Nothing is printed: a bad parse tree
+    raises ParseTreeError and undecodable input UnicodeDecodeError.
+    The output format, creation date, pruned productions and cross
+    reference are process-wide class settings (Statement.backend,
+    DiagramNode.created, StatementFactory.pruned and Statement.xref).
+    A call puts those of the Converter in place and restores the
+    previous ones when it returns, so calls in one process run one at a
+    time.
+    """
+    _lock = threading.RLock()     # Held while the settings of a call are in place
+
+    def __init__(self, factory=StatementFactory, columnar=False, stream=False, backend='xml', created=None,
+                 pruned=(), xref=None):
+        """
+        :param factory: StatementFactory
+        :param columnar: keep the parse tree in a ColumnarTree
+        :param stream: use the streaming conversion
+        :param backend: output format, a name in structorizer.output.backends
+        :param created: creation date written to the diagrams (YYYY-MM-DD), None for
+                        the date from SOURCE_DATE_EPOCH or today
+        :param pruned: names of the productions to leave out with everything below them
+        :param xref: CrossReference to add the calls and file accesses to, None to collect none
+        """
+        self.factory = factory
+        self.columnar = columnar
+        self.stream = stream
+        self.backend = backends[backend]
+        self.created = created
+        self.pruned = set(pruned)
+        self.xref = xref
+
+    def convert(self, source, encoding='utf-8', binary=False):
+        """
+        :param source: parse tree export as str or bytes, the path of an export
+                       file as an os.PathLike or as a str naming an existing file,
+                       or a text or binary file object
+        :param encoding: encoding of bytes, binary files and export files
+        :param binary: return the XML as UTF-8 encoded bytes rather than str
+        :return: Structorizer XML
+        """
+        if isinstance(source, str):
+            # An export has line ends, a single line can only be a file name
+            if '\n' not in source and os.path.isfile(source):
+                return self.convert_file(source, encoding, binary)
+
+            # newline=None gives the universal newlines of a file opened in text mode
+            with io.StringIO(source, newline=None) as gp_file:
+                return self._convert(gp_file, binary)
+        elif isinstance(source, (bytes, bytearray, memoryview)):
+            return self.convert(str(source, encoding), binary=binary)
+        elif isinstance(source, os.PathLike):
+            return self.convert_file(source, encoding, binary)
+        elif isinstance(source.read(0), bytes):
+            gp_file = io.TextIOWrapper(source, encoding, newline=None)
+
+            try:
+                return self._convert(gp_file, binary)
+            finally:
+                gp_file.detach()        # Leave the caller's file open
+        else:
+            return self._convert(source, binary)
+
+    def convert_file(self, path, encoding='utf-8', binary=False):
+        """
+        :param path: parse tree export file, possibly compressed
+        :param encoding: encoding of the file
+        :param binary: return the XML as UTF-8 encoded bytes rather than str
+        :return: Structorizer XML
+        """
+        compression = input_format(path)
+
+        if compression:
+            gp_file = io.TextIOWrapper(open_input(path, compression), encoding)
+        else:
+            gp_file = MappedExport(path, encoding)
+
+        with gp_file:
+            return self._convert(gp_file, binary)
+
+    def _convert(self, gp_file, binary):
+        gp_parser = GPStruct(self.columnar)
+        gp_parser.strict = True
+
+        with Converter._lock:
+            saved = Statement.backend, DiagramNode.created, StatementFactory.pruned, Statement.xref
+
+            Statement.backend = self.backend
+            DiagramNode.created = self.created
+            StatementFactory.pruned = self.pruned
+            Statement.xref = self.xref
+
+            try:
+                with io.BytesIO() if binary else io.StringIO() as output:
+                    gp_parser.convert(gp_file, self.factory, output, self.stream)
+
+                    return output.getvalue()
+            finally:
+                Statement.backend, DiagramNode.created, StatementFactory.pruned, Statement.xref = saved
+
+
+def convert_export(source, encoding='utf-8', binary=False, factory=StatementFactory):
+    """
+    Convert a parse tree export to Structorizer XML, see Converter.convert
+    :param source: parse tree export as str or bytes, a path or a file object
+    :param encoding: encoding of bytes, binary files and export files
+    :param binary: return the XML as UTF-8 encoded bytes rather than str
+    :param factory: StatementFactory
+    :return: Structorizer XML
+    """
+    return Converter(factory).convert(source, encoding, binary)
+
+
+class ConversionProfile:
+    """
+    Run the conversion phases one by one and record what each one
+    costs: wall and CPU time, peak traced memory and, optionally,
+    cProfile statistics. The Statement nodes created are counted per
+    class once the diagram is built, and the use of the shared cache of
+    escaped terminals during the run is recorded.
+    Memory tracing and cProfile slow the conversion down, the times
+    are best compared between runs with the same settings.
+    """
+
+    phases = ('parse', 'export', 'build', 'render')
+
+    def __init__(self, trace_memory=True, cprofile=False):
+        """
+        :param trace_memory: record peak memory with tracemalloc
+        :param cprofile: collect cProfile statistics
+        """
+        self.trace_memory = trace_memory
+        self.cprofile = cprofile
+
+        self.times = {}             # Phase: (wall seconds, CPU seconds)
+        self.peaks = {}             # Phase: peak bytes allocated during the phase
+        self.peak_memory = None     # Peak bytes allocated during the whole conversion
+        self.node_counts = Counter()
+        self.stats = None           # pstats.Stats when cprofile is set
+        self.escapes = {}           # Escaped terminal cache hits, misses, plain misses and entries
+
+    def run(self, gp_parser, gp_file, factory, out_file):
+        """
+        Convert a parse tree export file while profiling it
+        :param gp_parser: GPStruct
+        :param gp_file: parse tree export file
+        :param factory: StatementFactory
+        :param out_file: XML output destination, text or binary
+        :return: True if a parse tree was found
+        """
+        steps = (('parse', lambda: gp_parser.parse(gp_file, factory)),
+                 ('export', lambda: gp_parser.build_render_nodes(factory)),
+                 ('build', gp_parser.build_diagram),
+                 ('render', lambda: gp_parser.render(out_file)))
+
+        gp_parser.gp_root = None
+        gp_parser.diagram_root = None
+
+        profiler = cProfile.Profile() if self.cprofile else None
+        tracing = self.trace_memory and not tracemalloc.is_tracing()
+
+        if tracing:
+            tracemalloc.start()
+
+        if self.trace_memory:
+            start_memory = tracemalloc.get_traced_memory()[0]
+            self.peak_memory = 0
+
+        escape_counts = escapes.counts()
+
+        try:
+            for phase, step in steps:
+                if phase != 'parse' and gp_parser.gp_root is None:
+                    break
+
+                if self.trace_memory:
+                    tracemalloc.reset_peak()
+                    memory = tracemalloc.get_traced_memory()[0]
+
+                wall = time.perf_counter()
+                cpu = time.process_time()
+
+                if profiler:
+                    profiler.enable()
+
+                step()
+
+                if profiler:
+                    profiler.disable()
+
+                self.times[phase] = (time.perf_counter() - wall, time.process_time() - cpu)
+
+                if self.trace_memory:
+                    peak = tracemalloc.get_traced_memory()[1]
+                    self.peaks[phase] = peak - memory
+                    self.peak_memory = max(self.peak_memory, peak - start_memory)
+        finally:
+            if tracing:
+                tracemalloc.stop()
+
+        # The cache outlives the run, only count what happened during it
+        self.escapes = {name: count - escape_counts[name] if name != 'entries' else count
+                        for name, count in escapes.counts().items()}
+
+        if gp_parser.diagram_root is not None:
+            self._count_nodes(gp_parser.diagram_root)
+
+        if profiler:
+            self.stats = pstats.Stats(profiler)
+
+        return gp_parser.gp_root is not None
+
+    def _count_nodes(self, diagram_root):
+        pending = [diagram_root]
+
+        while pending:
+            statement = pending.pop()
+            self.node_counts[type(statement).__name__] += 1
+            pending.extend(statement.child_nodes)
+
+    def as_dict(self):
+        """
+        :return: the profile as a dictionary ready for JSON
+        """
+        return {
+            'phases': {phase: {'wall_seconds': wall,
+                               'cpu_seconds': cpu,
+                               'peak_bytes': self.peaks.get(phase)}
+                       for phase, (wall, cpu) in self.times.items()},
+            'peak_bytes': self.peak_memory,
+            'nodes': dict(self.node_counts.most_common()),
+            'escape_cache': self.escapes
+        }
+
+    def report(self, out_file, json_format=False):
+        """
+        Write the profile
+        :param out_file: text file
+        :param json_format: write JSON instead of a table
+        :return:
+        """
+        if json_format:
+            json.dump(self.as_dict(), out_file, indent=2)
+            out_file.write('\n')
+            return
+
+        out_file.write('{:<8} {:>10} {:>10} {:>14}\n'.format('phase', 'wall s', 'CPU s', 'peak bytes'))
+
+        for phase, (wall, cpu) in self.times.items():
+            peak = self.peaks.get(phase)
+            out_file.write('{:<8} {:>10.4f} {:>10.4f} {:>14}\n'.format(
+                phase, wall, cpu, '{:,}'.format(peak) if peak is not None else '-'))
+
+        if self.peak_memory is not None:
+            out_file.write('Peak traced memory: {:,} bytes\n'.format(self.peak_memory))
+
+        if self.escapes:
+            lookups = self.escapes['hits'] + self.escapes['misses']
+            rate = self.escapes['hits'] / lookups if lookups else 0.0
+
+            out_file.write('Escaped terminals: {} hits, {} misses ({} without special characters), '
+                           '{:.0%} hit rate, {} stored\n'.format(self.escapes['hits'], self.escapes['misses'],
+                                                                 self.escapes['plain'], rate, self.escapes['entries']))
+
+        if self.node_counts:
+            out_file.write('{} Statement nodes\n'.format(sum(self.node_counts.values())))
+
+            for name, count in self.node_counts.most_common():
+                out_file.write('  {:<22} {:>8}\n'.format(name, count))
+
+    def dump_stats(self, path):
+        """
+        Save the cProfile statistics for pstats
+        :param path: output file
+        :return:
+        """
+        self.stats.dump_stats(path)
+
+
+def _available_cores():
+    return len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+
+
+# Parallel conversion of the units of a single file
+_unit_parser = None
+_unit_factory = None
+
+
+def _start_unit_worker(factory, backend):
+    global _unit_parser, _unit_factory
+
+    _unit_parser = GPStruct()
+    _unit_factory = factory
+
+    Statement.backend = backend
+
+
+def _convert_units(units):
+    """
+    Export, build and render units in a GPStruct.parallel worker
+    :param units: lines of each unit, as [level, expression] lists
+    :return: XML of the units
+    """
+    # Text sent up from the unit root is dropped, as in the diagram root's pass-through containers
+    owner = Statement(None, None)
+
+    with io.StringIO() as output:
+        for lines in units:
+            level, expression = lines[0]
+            gp_node = GPStruct._grammar_node(level, expression)
+
+            if len(lines) > 1:
+                _unit_parser._grow_tree(gp_node, iter(lines[1:]))
+
+            statement = gp_node.export_node(_unit_factory, owner)
+            statement.build('instruction')      # build_diagram starts the root with 'instruction'
+            statement.render(output)
+
+        return output.getvalue()
+
+
+# Batch conversion. Every worker process keeps a single GPStruct for all the files it converts.
+_batch_parser = None
+_batch_options = None
+_batch_cache = None
+_batch_fragments = None
+
+
+def _start_batch_worker(options):
+    global _batch_parser, _batch_options, _batch_cache, _batch_fragments
+
+    _batch_parser = GPStruct(options['columnar'])
+    _batch_parser.strict = True         # A bad parse tree fails the file, with the problem as its error
+    _batch_options = options
+
+    DiagramNode.created = options['created']
+    StatementFactory.pruned = set(options['pruned'])
+    Statement.backend = backends[options['format']]
+
+    if options['cache']:
+        _batch_cache = ConversionCache(options['cache'], StatementFactory, options['cache_size'])
+
+    if options['fragments']:
+        _batch_fragments = ConversionCache(options['fragments'], StatementFactory, options['cache_size'],
+                                           dated=False)
+
+
+def _convert_file(job):
+    """
+    Convert a single file in a batch worker. Failures are reported
+    rather than raised so the rest of the batch carries on. Compressed
+    input is decompressed on the fly, the output is compressed if its
+    file extension names a compressed format. With the xref option a
+    cross-reference index is written next to the output.
+    :param job: input path and output path
+    :return: input path, error message or None if the conversion succeeded,
+             True for a cache hit, False for a miss, None without a cache
+    """
+    in_path, out_path = job
+    temp_path = out_path + '.tmp'
+    compression = path_format(out_path)
+    hit = None
+
+    try:
+        os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
+
+        in_compression = input_format(in_path)
+
+        if _batch_options['xref']:
+            Statement.xref = CrossReference()
+
+        if _batch_cache:
+            with open_input(in_path, in_compression) as gp_file:
+                gp_data = gp_file.read()
+
+            hits = _batch_cache.hits
+
+            with open_output(temp_path, compression) as out_file:
+                found = _batch_parser.convert_cached(gp_data, StatementFactory, out_file, _batch_cache,
+                                                     _batch_options['stream'], _batch_options['encoding'],
+                                                     _batch_fragments)
+
+            hit = _batch_cache.hits > hits
+        else:
+            if _batch_options['mmap'] and not in_compression:
+                gp_file = MappedExport(in_path, _batch_options['encoding'])
+            else:
+                gp_file = io.TextIOWrapper(open_input(in_path, in_compression), _batch_options['encoding'])
+
+            with gp_file, open_output(temp_path, compression) as out_file:
+                found = _batch_parser.convert(gp_file, StatementFactory, out_file, _batch_options['stream'],
+                                              _batch_fragments)
+
+        if not found:
+            raise ValueError('no parse tree found')
+
+        os.replace(temp_path, out_path)
+
+        if _batch_options['xref']:
+            Statement.xref.write(CrossReference.sidecar_path(out_path))
+    except Exception as error:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+        return in_path, '{}: {}'.format(type(error).__name__, error), hit
+
+    return in_path, None, hit
+
+
+def _glob_base(pattern):
+    """
+    :param pattern: glob pattern
+    :return: directory part of the pattern in front of its first wildcard
+    """
+    parts = os.path.normpath(pattern).split(os.sep)
+    base = []
+
+    for part in parts[:-1]:     # The last part names the files
+        if glob.has_magic(part):
+            break
+
+        base.append(part)
+
+    return os.sep.join(base) or ('/' if pattern.startswith('/') else '.')
+
+
+def _output_file(file_name, suffixes):
+    # Files a batch run writes, so they are not taken as input when the output is inside an input directory
+    return file_name.endswith(suffixes) or strip_extension(file_name).endswith(suffixes)
+
+
+def batch_jobs(inputs, out_dir, suffix=None):
+    """
+    Expand the batch inputs to (input path, output path) pairs. Files
+    found under an input directory, or matched by a glob pattern, keep
+    their path relative to that directory or to the directory part of
+    the pattern in front of its first wildcard. Converter output (files
+    with the output extension, cross-reference indexes and temporary
+    files) found under an input directory is skipped. The extension of
+    a compressed format is dropped along with the input file extension.
+    :param inputs: directories, files or glob patterns
+    :param out_dir: output directory
+    :param suffix: file extension for the output files, defaults to that of the output format
+    :return: list of (input path, output path) pairs
+    :raises ValueError: if two inputs would be written to the same output file
+    """
+    if suffix is None:
+        suffix = Statement.backend.suffix
+
+    skipped = (strip_extension(suffix), CrossReference.suffix, '.tmp')
+    jobs = []
+
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            for dir_path, dir_names, file_names in os.walk(pattern):
+                dir_names.sort()
+
+                for file_name in sorted(file_names):
+                    if not _output_file(file_name, skipped):
+                        in_path = os.path.join(dir_path, file_name)
+                        relative = strip_extension(os.path.relpath(in_path, pattern))
+                        jobs.append((in_path, os.path.join(out_dir, os.path.splitext(relative)[0] + suffix)))
+        else:
+            base = _glob_base(pattern)
+
+            for in_path in sorted(glob.glob(pattern, recursive=True)):
+                if os.path.isfile(in_path):
+                    relative = strip_extension(os.path.relpath(in_path, base))
+                    jobs.append((in_path, os.path.join(out_dir, os.path.splitext(relative)[0] + suffix)))
+
+    # Two workers writing one output file would overwrite each other's result
+    written = {}
+
+    for in_path, out_path in jobs:
+        key = os.path.normcase(os.path.abspath(out_path))
+
+        if key in written:
+            raise ValueError('{} and {} would both be written to {}'.format(written[key], in_path, out_path))
+
+        written[key] = in_path
+
+    return jobs
+
+
+def batch_convert(jobs, workers=None, stream=False, encoding='utf-8', columnar=False,
+                  cache=None, cache_size=512 << 20, cache_stats=None, fragments=None, mmap=False, xref=False):
+    """
+    Convert a list of files on a pool of worker processes
+    :param jobs: (input path, output path) pairs
+    :param workers: number of worker processes, defaults to the available cores
+    :param stream: use the streaming conversion
+    :param encoding: parse tree file encoding
+    :param columnar: keep the parse trees in a ColumnarTree
+    :param cache: ConversionCache directory, None to convert every file
+    :param cache_size: size limit of the cache in bytes
+    :param cache_stats: Counter receiving the 'hits' and 'misses' of the cache
+    :param fragments: directory of the rendered top level statements to reuse, None to render them all
+    :param mmap: read the parse tree files through a MappedExport
+    :param xref: write a cross-reference index next to each output file. The index is collected while
+                 building, so it cannot be combined with a cache or fragments.
+    :return: generator of (input path, error message or None) in job order
+    """
+    if xref and (cache or fragments):
+        raise ValueError('a cross-reference index cannot be collected from cached diagrams')
+
+    if workers is None:
+        workers = _available_cores()
+
+    workers = max(1, min(workers, len(jobs)))
+    options = {'stream': stream, 'encoding': encoding, 'columnar': columnar,
+               'cache': cache, 'cache_size': cache_size, 'fragments': fragments, 'mmap': mmap,
+               'created': DiagramNode.created, 'pruned': sorted(StatementFactory.pruned),
+               'format': Statement.backend.name, 'xref': xref}
+
+    # Small chunks keep the workers evenly loaded when file sizes vary
+    chunk_size = max(1, min(16, len(jobs) // (workers * 8)))
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_start_batch_worker,
+                             initargs=(options,)) as pool:
+        for in_path, error, hit in pool.map(_convert_file, jobs, chunksize=chunk_size):
+            if hit is not None and cache_stats is not None:
+                cache_stats['hits' if hit else 'misses'] += 1
+
+            yield in_path, error
+
+
+# Multi-document streams: many exports on one input, one framed XML document out for each
+
+document_header = b'Parse Tree'     # First line of a GOLDParser export
+tokens_header = b'Tokens'           # First line of the section after the parse tree
+
+
+def read_documents(in_file, framed=False):
+    """
+    Split a binary stream carrying many parse tree exports into one
+    export per document. Each document is produced as soon as it is
+    complete, so a pipe can feed documents one at a time.
+    Concatenated exports are told apart by their 'Parse Tree' header
+    line, which may follow a UTF-8 byte order mark. A document is
+    complete at the blank line ending its tree section, or at the next
+    header if there is none; a Tokens section after it is skipped. Any
+    other text outside a document is produced as a document of its own,
+    up to the next header, so that it fails to convert instead of
+    silently shifting the documents after it. The encoding must leave
+    ASCII as it is.
+    Framed documents are each preceded by their length in bytes, in
+    decimal on a line of its own.
+    :param in_file: binary input stream
+    :param framed: the documents are length-framed rather than concatenated
+    :return: generator of the documents as bytes
+    """
+    if framed:
+        for line in iter(in_file.readline, b''):
+            if not line.strip():
+                continue        # Tolerate blank lines between frames
+
+            try:
+                length = int(line)
+            except ValueError:
+                raise ParseTreeError('Bad frame header {!r}'.format(line)) from None
+
+            document = in_file.read(length)
+
+            if len(document) != length:
+                raise ParseTreeError('Truncated frame: expected {} bytes, got {}'.format(length, len(document)))
+
+            yield document
+
+        return
+
+    document = None
+    in_tree = False     # Past the blank line after the header
+    stray = False       # The document has no header, it runs up to the next one
+    skipping = False    # In the Tokens section of the last document
+
+    for line in iter(in_file.readline, b''):
+        stripped = line.strip()
+
+        if stripped.startswith(codecs.BOM_UTF8):
+            stripped = stripped[len(codecs.BOM_UTF8):]
+
+        if stripped == document_header:
+            if document is not None:
+                yield b''.join(document)    # No blank line ended the tree
+
+            document = [line]
+            in_tree = stray = skipping = False
+            continue
+
+        if document is None:
+            if skipping or not stripped:
+                continue
+            elif stripped == tokens_header:
+                skipping = True
+                continue
+
+            document = []
+            stray = True
+
+        document.append(line)
+
+        if not stripped and not stray:
+            if in_tree:
+                yield b''.join(document)
+                document = None
+            else:
+                in_tree = True
+
+    if document is not None:
+        yield b''.join(document)
+
+
+def write_frame(out_file, data):
+    """
+    Write a document preceded by its length in bytes, on a line of its
+    own, and pass it on right away
+    :param out_file: binary output stream
+    :param data: document as bytes
+    :return:
+    """
+    out_file.write(b'%d\n' % len(data))
+    out_file.write(data)
+    out_file.flush()
+
+
+def convert_documents(in_file, out_file, framed=False, encoding='utf-8', factory=StatementFactory, stream=False,
+                      columnar=False, backend='xml', created=None, pruned=()):
+    """
+    Convert every parse tree export on a stream and write the XML as a
+    framed stream, one frame per input document in input order. A
+    document that cannot be converted, for whatever reason, gets an
+    empty frame and its error is reported.
+    :param in_file: binary input stream, see read_documents
+    :param out_file: binary output stream, see write_frame
+    :param framed: the input documents are length-framed rather than concatenated
+    :param encoding: encoding of the documents
+    :param factory: StatementFactory
+    :param stream: use the streaming conversion
+    :param columnar: keep the parse trees in a ColumnarTree
+    :param backend: output format, a name in structorizer.output.backends
+    :param created: creation date written to the diagrams, see Converter
+    :param pruned: names of the productions to leave out, see Converter
+    :return: generator of (document number, error message or None), counting from 1
+    """
+    converter = Converter(factory, columnar, stream, backend, created, pruned)
+
+    for number, document in enumerate(read_documents(in_file, framed), 1):
+        try:
+            xml = converter.convert(document, encoding, binary=True)
+        except Exception as error:
+            # Whatever went wrong belongs to this document, the stream carries on with the next one
+            write_frame(out_file, b'')
+            yield number, '{}: {}'.format(type(error).__name__, error)
+        else:
+            write_frame(out_file, xml)
+            yield number, None
+
+
+def main():
     arg_parser = argparse.ArgumentParser(
         description='Read a GOLDParser parse tree file and convert it to Structorizer XML'
     )
 
-    arg_parser.parse_args()
+    arg_parser.add_argument('--stream', action='store_true',
+                            help='render each top level statement as soon as it is read instead of '
+                                 'holding the whole tree')
+    arg_parser.add_argument('--parallel', nargs='?', type=int, const=0, metavar='N',
+                            help='export, build and render the top level statements on N processes '
+                                 '(default: all cores)')
+    arg_parser.add_argument('--columnar', action='store_true',
+                            help='keep the parse tree in parallel arrays instead of node objects')
+    arg_parser.add_argument('--mmap', action='store_true',
+                            help='memory-map the parse tree file and scan it as bytes instead of reading it '
+                                 'as text')
+    arg_parser.add_argument('--save-snapshot', metavar='FILE',
+                            help='also save the parsed tree to FILE, pruned productions included, to be converted '
+                                 'again with --load-snapshot')
+    arg_parser.add_argument('--load-snapshot', metavar='FILE',
+                            help='convert the tree saved in FILE instead of reading a parse tree file')
+    arg_parser.add_argument('--profile', nargs='?', const='text', choices=('text', 'json'),
+                            help='report the time and memory of each phase and the nodes created on '
+                                 'stderr, as a table (default) or as JSON')
+    arg_parser.add_argument('--pstats', metavar='FILE',
+                            help='with --profile, also save cProfile statistics to FILE')
+    arg_parser.add_argument('--cache', metavar='DIR',
+                            help='keep converted diagrams in DIR and reuse them for unchanged parse trees')
+    arg_parser.add_argument('--incremental', metavar='DIR',
+                            help='keep the XML of each top level statement in DIR and only convert the '
+                                 'statements that changed since an earlier run')
+    arg_parser.add_argument('--cache-size', type=int, default=512, metavar='MB',
+                            help='size limit of the cache and of the incremental store in MB (default: 512)')
+    arg_parser.add_argument('--documents', choices=('concatenated', 'framed'),
+                            help='read many parse tree exports, concatenated or each preceded by its length '
+                                 'in bytes on a line of its own, and write each XML document the same way')
+    arg_parser.add_argument('--prune', action='append', metavar='NAME[,NAME]',
+                            help='leave these productions and all they contain out of the diagram, '
+                                 'e.g. DEFINE_DATA; can be repeated')
+    arg_parser.add_argument('--compress', choices=sorted(formats),
+                            help='compress the XML written to stdout, or the batch output files; compressed '
+                                 'input is recognised without this')
+    arg_parser.add_argument('--created', type=lambda text: date.fromisoformat(text).isoformat(), metavar='DATE',
+                            help='creation date (YYYY-MM-DD) written to the diagrams instead of today, '
+                                 'for byte-stable output')
+    arg_parser.add_argument('--xref', metavar='FILE',
+                            help='also write the PERFORM, CALLNAT and FETCH targets and the files read, found, '
+                                 'stored and updated to FILE as JSON')
+    arg_parser.add_argument('--format', choices=sorted(backends), default='xml',
+                            help='write Structorizer XML (default) or the diagram structure as newline '
+                                 'delimited JSON')
+
+    commands = arg_parser.add_subparsers(dest='command')
+
+    batch_parser = commands.add_parser('batch', help='convert many parse tree files in parallel')
+    batch_parser.add_argument('inputs', nargs='+', help='input directories, files or glob patterns')
+    batch_parser.add_argument('-o', '--output', required=True, help='output directory')
+    batch_parser.add_argument('-j', '--jobs', type=int, help='number of worker processes (default: all cores)')
+    batch_parser.add_argument('--suffix', help='extension of the output files (default: .nsd, .ndjson for '
+                                               '--format ndjson)')
+    batch_parser.add_argument('--encoding', default='utf-8', help='parse tree file encoding (default: utf-8)')
+    batch_parser.add_argument('--xref', action='store_true', dest='xref_sidecars',
+                              help='also write a cross-reference index (see --xref) next to each output file, '
+                                   'with the extension {}'.format(CrossReference.suffix))
+
+    args = arg_parser.parse_args()
+
+    if args.profile and (args.stream or args.command == 'batch'):
+        arg_parser.error('--profile only applies to a single file conversion without --stream')
+
+    if args.pstats and not args.profile:
+        arg_parser.error('--pstats needs --profile')
+
+    if args.profile and (args.cache or args.incremental):
+        arg_parser.error('--profile cannot be combined with --cache or --incremental')
+
+    if (args.save_snapshot or args.load_snapshot) and (args.stream or args.cache or args.incremental or
+                                                        args.profile or args.command == 'batch'):
+        arg_parser.error('snapshots only apply to a single file conversion without --stream, --cache, '
+                         '--incremental or --profile')
+
+    if args.parallel is not None and (args.stream or args.incremental or args.profile or args.save_snapshot or
+                                      args.load_snapshot or args.command == 'batch'):
+        arg_parser.error('--parallel only applies to a single file conversion without --stream, --incremental, '
+                         '--profile or snapshots')
+
+    if args.documents and (args.parallel is not None or args.mmap or args.cache or args.incremental or
+                           args.profile or args.save_snapshot or args.load_snapshot or args.command == 'batch'):
+        arg_parser.error('--documents cannot be combined with --parallel, --mmap, --cache, --incremental, '
+                         '--profile or snapshots')
+
+    if (args.xref or getattr(args, 'xref_sidecars', False)) and (args.cache or args.incremental or
+                                                                 args.parallel is not None or args.documents):
+        arg_parser.error('the cross-reference index is collected while building, it cannot be combined with '
+                         '--cache, --incremental, --parallel or --documents')
+
+    if args.xref and args.command == 'batch':
+        arg_parser.error('use batch --xref to write an index for each file')
+
+    if args.created:
+        DiagramNode.created = args.created
+
+    Statement.backend = backends[args.format]
+
+    if args.prune:
+        StatementFactory.pruned.update(name for names in args.prune for name in names.split(','))
+
+    cache_size = args.cache_size << 20
+
+    if args.command == 'batch':
+        suffix = args.suffix or Statement.backend.suffix
+
+        if args.compress and path_format(suffix) != args.compress:
+            suffix += formats[args.compress][0]
+
+        try:
+            jobs = batch_jobs(args.inputs, args.output, suffix)
+        except ValueError as error:
+            arg_parser.error(str(error))
+
+        failed = 0
+        cache_stats = Counter()
+
+        if jobs:
+            for in_path, error in batch_convert(jobs, args.jobs, args.stream, args.encoding, args.columnar,
+                                                args.cache, cache_size, cache_stats, args.incremental,
+                                                args.mmap, args.xref_sidecars):
+                if error is not None:
+                    failed += 1
+                    print('{}: {}'.format(in_path, error), file=sys.stderr)
+
+        print('Converted {} of {} files'.format(len(jobs) - failed, len(jobs)), file=sys.stderr)
+
+        if args.cache:
+            print('Cache: {} hits, {} misses'.format(cache_stats['hits'], cache_stats['misses']), file=sys.stderr)
+
+        return 1 if failed else 0
+
+    # Compressed input is recognised by its magic bytes, the output is compressed on request.
+    # A snapshot is converted without reading stdin, which must not be waited on.
+    in_file = sys.stdin.buffer if args.load_snapshot else open_input(sys.stdin.buffer)
+    out_file = open_output(sys.stdout.buffer, args.compress)
+    found = False
 
-    gp_parser = GPStruct()
-    gp_parser.parse(sys.stdin)
-    gp_parser.build_render_nodes(StatementFactory)
-    gp_parser.build_diagram()
+    if args.xref:
+        Statement.xref = CrossReference()
 
-    gp_parser.render(sys.stdout)
+    try:
+        if args.documents:
+            failed = 0
+
+            try:
+                for number, error in convert_documents(in_file, out_file, args.documents == 'framed',
+                                                       sys.stdin.encoding, StatementFactory, args.stream,
+                                                       args.columnar, args.format, DiagramNode.created,
+                                                       StatementFactory.pruned):
+                    if error is not None:
+                        failed += 1
+                        print('Document {}: {}'.format(number, error), file=sys.stderr)
+            except ParseTreeError as error:
+                print(error, file=sys.stderr)
+                return 1
+
+            return 1 if failed else 0
+
+        gp_parser = GPStruct(args.columnar)
+
+        if args.load_snapshot:
+            try:
+                gp_parser.load_snapshot(args.load_snapshot)
+            except SnapshotError as error:
+                print('Bad snapshot file. {}'.format(error), file=sys.stderr)
+                return 1
+
+            if gp_parser.gp_root is None:
+                return 1
+
+            gp_parser.prune(StatementFactory)     # Snapshots hold the whole tree
+            gp_parser.build_render_nodes(StatementFactory)
+            gp_parser.build_diagram()
+            gp_parser.render(out_file)
+            found = True
+
+            return 0
+
+        # A cache lookup needs the bytes of the file anyway, there is nothing to map
+        if in_file is not sys.stdin.buffer:
+            gp_file = io.TextIOWrapper(in_file, sys.stdin.encoding)     # Decompressed
+        elif args.mmap and not args.cache:
+            gp_file = MappedExport(sys.stdin.buffer, sys.stdin.encoding)
+        else:
+            gp_file = sys.stdin
+
+        if args.profile:
+            profile = ConversionProfile(cprofile=bool(args.pstats))
+            found = profile.run(gp_parser, gp_file, StatementFactory, out_file)
+
+            profile.report(sys.stderr, args.profile == 'json')
+
+            if args.pstats:
+                profile.dump_stats(args.pstats)
+
+            return 0 if found else 1
+
+        fragments = ConversionCache(args.incremental, StatementFactory, cache_size,
+                                    dated=False) if args.incremental else None
+
+        if args.cache:
+            cache = ConversionCache(args.cache, StatementFactory, cache_size)
+            found = gp_parser.convert_cached(in_file.read(), StatementFactory, out_file, cache,
+                                             args.stream, sys.stdin.encoding, fragments, args.parallel)
+            cache.report(sys.stderr)
+        elif args.save_snapshot:
+            # The snapshot keeps what this conversion prunes, for converting it again with other settings
+            gp_parser.parse(gp_file)
+            found = gp_parser.gp_root is not None
+
+            if found:
+                gp_parser.save_snapshot(args.save_snapshot)
+                gp_parser.prune(StatementFactory)
+                gp_parser.build_render_nodes(StatementFactory)
+                gp_parser.build_diagram()
+                gp_parser.render(out_file)
+        else:
+            # The XML goes out as UTF-8 bytes, whatever the locale says
+            found = gp_parser.convert(gp_file, StatementFactory, out_file, args.stream, fragments,
+                                      args.parallel)
+
+        if fragments:
+            fragments.report(sys.stderr, 'Fragments')
+
+        return 0 if found else 1
+
+    finally:
+        if out_file is not sys.stdout.buffer:
+            out_file.close()      # Writes the end of the compressed data
+
+        if found and args.xref:
+            Statement.xref.write(args.xref)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
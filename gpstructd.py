@@ -0,0 +1,452 @@
+#! /usr/bin/env python3
+
+"""
+    gpstruct.py Convert a GOLDParser parse tree export to Structorizer XML
+
+    Copyright (C) 2022  Sven Coenye
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+    gpstructd.py keeps a converter loaded and serves conversions over
+    HTTP, on a Unix socket or a localhost TCP port:
+      POST /convert   body: parse tree export, ?encoding=... if not UTF-8
+                      reply: Structorizer XML (NDJSON with --format ndjson), 422 if the
+                      parse tree is bad
+      GET /stats      reply: request and LRU cache counts as JSON
+    Example: curl --unix-socket /tmp/gpstruct.sock --data-binary @tree.txt http://localhost/convert
+"""
+
+import argparse
+import asyncio
+import hashlib
+import http.client
+import ipaddress
+import json
+import os
+import socket
+import sys
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import date
+from urllib.parse import parse_qs, urlsplit
+
+from gpstruct import Converter, ParseTreeError
+from structorizer.nodes import DiagramNode, Statement
+from structorizer.output import backends
+
+
+class ResultCache:
+    """
+    In-memory LRU of converted diagrams, bounded by the size of the XML
+    """
+
+    def __init__(self, max_bytes=64 << 20):
+        """
+        :param max_bytes: size limit of the stored XML
+        """
+        self.max_bytes = max_bytes
+        self.size = 0
+
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        :param key: cache key
+        :return: stored XML, None if not in the cache
+        """
+        xml = self._entries.get(key)
+
+        if xml is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._entries.move_to_end(key)
+
+        return xml
+
+    def put(self, key, xml):
+        """
+        Store a diagram, dropping the least recently used ones if the cache is full
+        :param key: cache key
+        :param xml: XML as bytes
+        :return:
+        """
+        if len(xml) > self.max_bytes:
+            return
+
+        old = self._entries.pop(key, None)
+
+        if old is not None:
+            self.size -= len(old)
+
+        self._entries[key] = xml
+        self.size += len(xml)
+
+        while self.size > self.max_bytes:
+            _, dropped = self._entries.popitem(last=False)
+            self.size -= len(dropped)
+
+
+# Conversions run in a worker, a thread or a process, that keeps a Converter
+_converter = None
+
+
+def _start_worker(created, backend):
+    global _converter
+
+    _converter = Converter(backend=backend.name, created=created)
+
+
+def _convert_data(data, encoding):
+    """
+    Convert a parse tree export in a worker
+    :param data: parse tree export as bytes
+    :param encoding: encoding of data
+    :return: XML as bytes
+    """
+    return _converter.convert(data, encoding, binary=True)
+
+
+class ConversionServer:
+    """
+    HTTP/1.1 conversion service on asyncio. Connections are served
+    concurrently; conversions run on a single thread next to the event
+    loop, or on a pool of worker processes, each keeping its converter
+    loaded. Recent results are kept in a ResultCache.
+    """
+
+    max_body = 1 << 30      # Largest parse tree accepted
+
+    reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               413: 'Payload Too Large', 422: 'Unprocessable Entity',
+               431: 'Request Header Fields Too Large', 500: 'Internal Server Error'}
+
+    def __init__(self, cache_bytes=64 << 20, workers=0):
+        """
+        :param cache_bytes: size limit of the in-memory result cache
+        :param workers: number of worker processes, 0 to convert on a thread
+        """
+        self.cache = ResultCache(cache_bytes)
+        self.requests = 0
+        self.failures = 0
+
+        if workers:
+            self.executor = ProcessPoolExecutor(max_workers=workers, initializer=_start_worker,
+                                                initargs=(DiagramNode.created, Statement.backend))
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=1, initializer=_start_worker,
+                                               initargs=(DiagramNode.created, Statement.backend))
+
+    def close(self):
+        """
+        Stop the workers
+        :return:
+        """
+        self.executor.shutdown()
+
+    def stats(self):
+        """
+        :return: request and cache counts
+        """
+        return {
+            'requests': self.requests,
+            'failures': self.failures,
+            'cache_hits': self.cache.hits,
+            'cache_misses': self.cache.misses,
+            'cache_entries': len(self.cache),
+            'cache_bytes': self.cache.size
+        }
+
+    async def convert(self, data, encoding='utf-8'):
+        """
+        :param data: parse tree export as bytes
+        :param encoding: encoding of data
+        :return: XML as bytes
+        """
+        # The creation date is part of the output, a cached diagram from yesterday will not do
+        digest = hashlib.sha256(DiagramNode.created_date().encode('ascii'))
+        digest.update(encoding.lower().encode('ascii'))
+        digest.update(b'\0')
+        digest.update(data)
+        key = digest.digest()
+
+        xml = self.cache.get(key)
+
+        if xml is None:
+            xml = await asyncio.get_running_loop().run_in_executor(self.executor, _convert_data, data, encoding)
+            self.cache.put(key, xml)
+
+        return xml
+
+    async def respond(self, method, target, body):
+        """
+        :param method: HTTP method
+        :param target: request target
+        :param body: request body
+        :return: status, content type and body of the response
+        """
+        url = urlsplit(target)
+
+        if url.path == '/stats':
+            if method != 'GET':
+                return 405, 'text/plain', b'Use GET\n'
+
+            return 200, 'application/json', json.dumps(self.stats()).encode('utf-8')
+
+        if url.path not in ('/', '/convert'):
+            return 404, 'text/plain', b'Unknown path\n'
+
+        if method != 'POST':
+            return 405, 'text/plain', b'POST the parse tree export\n'
+
+        encoding = parse_qs(url.query).get('encoding', ['utf-8'])[0]
+
+        try:
+            xml = await self.convert(body, encoding)
+        except ParseTreeError as error:
+            return 422, 'text/plain', '{}\n'.format(error).encode('utf-8')
+        except (LookupError, UnicodeDecodeError) as error:
+            return 400, 'text/plain', '{}\n'.format(error).encode('utf-8')
+
+        return 200, '{}; charset=utf-8'.format(Statement.backend.content_type), xml
+
+    async def handle(self, reader, writer):
+        """
+        Serve the requests on a connection
+        :param reader: asyncio StreamReader
+        :param writer: asyncio StreamWriter
+        :return:
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+
+                if not request_line.strip():
+                    break
+
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self._send(writer, 400, 'text/plain', b'Bad request line\n', False)
+                    break
+
+                headers = {}
+
+                while True:
+                    line = await reader.readline()
+
+                    if not line.strip():
+                        break
+
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                keep_alive = (version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close')
+
+                try:
+                    length = int(headers.get('content-length', 0))
+                except ValueError:
+                    length = -1
+
+                if length < 0 or length > self.max_body:
+                    await self._send(writer, 413 if length > 0 else 400, 'text/plain', b'Bad body length\n', False)
+                    break
+
+                body = await reader.readexactly(length) if length else b''
+
+                self.requests += 1
+
+                try:
+                    status, content_type, payload = await self.respond(method, target, body)
+                except Exception as error:
+                    status, content_type, payload = 500, 'text/plain', '{}: {}\n'.format(
+                        type(error).__name__, error).encode('utf-8')
+
+                if status != 200:
+                    self.failures += 1
+
+                await self._send(writer, status, content_type, payload, keep_alive)
+
+                if not keep_alive:
+                    break
+        except ValueError:
+            # readline() gives up on a request or header line beyond the stream limit
+            try:
+                await self._send(writer, 431, 'text/plain', b'Request line or header too long\n', False)
+            except ConnectionError:
+                pass
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _send(self, writer, status, content_type, payload, keep_alive):
+        writer.write('HTTP/1.1 {} {}\r\nContent-Type: {}\r\nContent-Length: {}\r\nConnection: {}\r\n\r\n'.format(
+            status, self.reasons[status], content_type, len(payload),
+            'keep-alive' if keep_alive else 'close').encode('latin-1'))
+        writer.write(payload)
+
+        await writer.drain()
+
+    async def serve(self, socket_path=None, host='127.0.0.1', port=8000, ready=None):
+        """
+        Serve until cancelled
+        :param socket_path: Unix socket to listen on, None to listen on host and port
+        :param host: TCP address
+        :param port: TCP port, 0 for any free port
+        :param ready: called with the listening server once it accepts connections
+        :return:
+        """
+        if socket_path:
+            _remove_stale_socket(socket_path)
+            server = await asyncio.start_unix_server(self.handle, path=socket_path)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+
+        try:
+            async with server:
+                if ready:
+                    ready(server)
+
+                await server.serve_forever()
+        finally:
+            if socket_path and os.path.exists(socket_path):
+                os.remove(socket_path)
+
+
+def _remove_stale_socket(socket_path):
+    # A socket file left behind by a server that is gone would block the bind
+    if not os.path.exists(socket_path):
+        return
+
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    try:
+        probe.connect(socket_path)
+    except ConnectionRefusedError:
+        os.remove(socket_path)
+    else:
+        raise OSError('A server is already listening on {}'.format(socket_path))
+    finally:
+        probe.close()
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """
+    HTTPConnection over a Unix socket
+    """
+
+    def __init__(self, socket_path, timeout=60):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def is_loopback(host):
+    """
+    Tell if a listening address only accepts connections from this machine
+    :param host: TCP address or host name
+    :return:
+    """
+    if host == 'localhost':
+        return True
+
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def request(data, socket_path=None, host='127.0.0.1', port=8000, encoding=None, connection=None):
+    """
+    Convert a parse tree export on a running server
+    :param data: parse tree export as bytes
+    :param socket_path: Unix socket of the server, None to use host and port
+    :param host: TCP address of the server
+    :param port: TCP port of the server
+    :param encoding: encoding of data if not UTF-8
+    :param connection: open HTTPConnection to reuse, a new one is used if None
+    :return: HTTP status and response body
+    """
+    if connection is None:
+        if socket_path:
+            connection = UnixHTTPConnection(socket_path)
+        else:
+            connection = http.client.HTTPConnection(host, port)
+
+    target = '/convert?encoding={}'.format(encoding) if encoding else '/convert'
+    connection.request('POST', target, body=data, headers={'Content-Type': 'text/plain'})
+    response = connection.getresponse()
+
+    return response.status, response.read()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Serve GOLDParser parse tree to Structorizer XML conversions')
+
+    listen = arg_parser.add_mutually_exclusive_group(required=True)
+    listen.add_argument('--socket', metavar='PATH', help='listen on a Unix socket')
+    listen.add_argument('--port', type=int, help='listen on a localhost TCP port')
+
+    arg_parser.add_argument('--host', default='127.0.0.1',
+                            help='loopback TCP address to listen on (default: 127.0.0.1)')
+    arg_parser.add_argument('--allow-remote', action='store_true',
+                            help='allow a --host other than a loopback address. The service has no authentication')
+    arg_parser.add_argument('--workers', type=int, default=0,
+                            help='convert on this many processes (default: 0, on a thread of the server)')
+    arg_parser.add_argument('--cache-size', type=int, default=64, metavar='MB',
+                            help='size limit of the in-memory result cache in MB (default: 64)')
+    arg_parser.add_argument('--created', type=lambda text: date.fromisoformat(text).isoformat(), metavar='DATE',
+                            help='creation date (YYYY-MM-DD) written to the diagrams instead of today')
+    arg_parser.add_argument('--format', choices=sorted(backends), default='xml',
+                            help='answer with Structorizer XML (default) or newline delimited JSON')
+
+    args = arg_parser.parse_args()
+
+    if not (args.socket or args.allow_remote or is_loopback(args.host)):
+        arg_parser.error('--host {} is not a loopback address, add --allow-remote to listen on it'.format(args.host))
+
+    if args.created:
+        DiagramNode.created = args.created
+
+    Statement.backend = backends[args.format]
+
+    server = ConversionServer(args.cache_size << 20, args.workers)
+
+    def ready(_):
+        print('Listening on {}'.format(args.socket or '{}:{}'.format(args.host, args.port)), file=sys.stderr)
+
+    try:
+        asyncio.run(server.serve(args.socket, args.host, args.port, ready))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,225 @@
+"""
+    gpstruct.py Convert a GOLDParser parse tree export to Structorizer XML
+
+    Copyright (C) 2022  Sven Coenye
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import hashlib
+import os
+import tempfile
+
+from structorizer import __version__
+from structorizer.nodes import DiagramNode, Statement
+
+
+class ConversionCache:
+    """
+    On-disk store of converted diagrams, keyed by the hash of the
+    parse tree export and a fingerprint of the converter. The least
+    recently used entries are removed once the cache grows past its
+    size limit. A store of rendered fragments, which do not hold the
+    creation date, is made with dated=False so it stays valid from one
+    day to the next.
+    """
+
+    suffix = '.nsd'
+
+    def __init__(self, directory, factory, max_bytes=512 << 20, dated=True):
+        """
+        :param directory: cache directory, created if needed
+        :param factory: StatementFactory the diagrams are converted with
+        :param max_bytes: size limit of the stored diagrams
+        :param dated: the entries hold the creation date, False for fragments without the diagram root
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.fingerprint = self.converter_fingerprint(factory, dated)
+
+        self.hits = 0
+        self.misses = 0
+
+        self._size = None       # Total size of the entries, counted on first use
+
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def converter_fingerprint(factory, dated=True):
+        """
+        Hash of everything besides the input that decides the output:
+        the package version, the output format, the expression to
+        Statement class mapping, the pruned productions and the creation
+        date written to the diagrams.
+        :param factory: StatementFactory
+        :param dated: include the creation date
+        :return: hex digest
+        """
+        digest = hashlib.sha256()
+        digest.update(__version__.encode('utf-8'))
+
+        if dated:
+            digest.update(DiagramNode.created_date().encode('utf-8'))
+
+        digest.update('\0{}'.format(Statement.backend.name).encode('utf-8'))
+
+        for name, node_class in sorted(factory.nodes.items()):
+            digest.update('\0{}={}.{}'.format(name, node_class.__module__, node_class.__qualname__).encode('utf-8'))
+
+        for name in sorted(factory.pruned):
+            digest.update('\0-{}'.format(name).encode('utf-8'))
+
+        return digest.hexdigest()
+
+    def key(self, data, encoding='utf-8'):
+        """
+        :param data: parse tree export as bytes
+        :param encoding: encoding of data
+        :return: cache key for the export
+        """
+        digest = hashlib.sha256(self.fingerprint.encode('ascii'))
+        digest.update(encoding.lower().encode('ascii'))
+        digest.update(b'\0')
+        digest.update(data)
+
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + self.suffix)
+
+    def get(self, key):
+        """
+        :param key: cache key
+        :return: stored XML as bytes, None if the key is not in the cache
+        """
+        path = self._path(key)
+
+        try:
+            with open(path, 'rb') as cache_file:
+                xml = cache_file.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+
+        try:
+            os.utime(path)      # Mark as recently used
+        except OSError:
+            pass
+
+        return xml
+
+    def put(self, key, xml):
+        """
+        Store a converted diagram, evicting old entries if the cache is full
+        :param key: cache key
+        :param xml: XML as bytes
+        :return:
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        try:
+            replaced = os.path.getsize(path)
+        except OSError:
+            replaced = 0
+
+        # Write to a temporary file first so readers never see a partial entry
+        handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+
+        try:
+            with os.fdopen(handle, 'wb') as cache_file:
+                cache_file.write(xml)
+
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+        if self._size is not None:
+            self._size += len(xml) - replaced
+
+        if self.size() > self.max_bytes:
+            self.evict(keep=path)
+
+    def _entries(self):
+        # (modification time, size, path) of every entry
+        entries = []
+
+        for dir_path, _, file_names in os.walk(self.directory):
+            for file_name in file_names:
+                if file_name.endswith(self.suffix):
+                    path = os.path.join(dir_path, file_name)
+
+                    try:
+                        status = os.stat(path)
+                    except OSError:
+                        continue        # Evicted by another process
+
+                    entries.append((status.st_mtime, status.st_size, path))
+
+        return entries
+
+    def size(self):
+        """
+        :return: total size of the stored diagrams in bytes
+        """
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._entries())
+
+        return self._size
+
+    def evict(self, keep=None):
+        """
+        Remove the least recently used entries until the cache fits
+        in max_bytes
+        :param keep: path of an entry that must stay
+        :return: number of entries removed
+        """
+        entries = sorted(self._entries())
+        size = sum(entry_size for _, entry_size, _ in entries)
+        removed = 0
+
+        for _, entry_size, path in entries:
+            if size <= self.max_bytes:
+                break
+
+            if path == keep:
+                continue
+
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+            size -= entry_size
+            removed += 1
+
+        self._size = size
+
+        return removed
+
+    def report(self, out_file, name='Cache'):
+        """
+        Write the hit and miss counts
+        :param out_file: text file
+        :param name: what the cache holds, starts the line
+        :return:
+        """
+        lookups = self.hits + self.misses
+        rate = self.hits / lookups if lookups else 0.0
+
+        out_file.write('{}: {} hits, {} misses ({:.0%} hit rate), {:,} bytes stored\n'.format(
+            name, self.hits, self.misses, rate, self.size()))
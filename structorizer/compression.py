@@ -0,0 +1,135 @@
+"""
+    gpstruct.py Convert a GOLDParser parse tree export to Structorizer XML
+
+    Copyright (C) 2022  Sven Coenye
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import bz2
+import gzip
+import lzma
+import os
+
+
+def _open_gzip(source, mode):
+    # Level 6 like the gzip tool, the default 9 is much slower for little gain
+    return gzip.open(source, mode, compresslevel=6)
+
+
+# Compressed formats: (file extension, magic bytes at the start of the data, open function)
+formats = {
+    'gz': ('.gz', b'\x1f\x8b', _open_gzip),
+    'bz2': ('.bz2', b'BZh', bz2.open),
+    'xz': ('.xz', b'\xfd7zXZ\x00', lzma.open)
+}
+
+magic_size = max(len(magic) for _, magic, _ in formats.values())
+
+
+def path_format(path):
+    """
+    :param path: file path
+    :return: compressed format named by the file extension, None if there is none
+    """
+    extension = os.path.splitext(os.fspath(path))[1].lower()
+
+    for name, (format_extension, _, _) in formats.items():
+        if extension == format_extension:
+            return name
+
+    return None
+
+
+def data_format(head):
+    """
+    :param head: first bytes of the data
+    :return: compressed format recognised from its magic bytes, None if there is none
+    """
+    for name, (_, magic, _) in formats.items():
+        if head.startswith(magic):
+            return name
+
+    return None
+
+
+def strip_extension(path):
+    """
+    :param path: file path
+    :return: path without its compressed format extension, if it has one
+    """
+    return os.path.splitext(path)[0] if path_format(path) else path
+
+
+def input_format(source):
+    """
+    Find out if an input is compressed, from the file extension of a
+    path or else from the magic bytes at the start of the data. The
+    bytes of a file object are looked at without consuming them, which
+    needs a peek method as on io.BufferedReader; without one the data is
+    taken to be uncompressed.
+    :param source: path or binary file
+    :return: compressed format, None if the input is not compressed
+    """
+    if isinstance(source, (str, bytes, os.PathLike)):
+        compression = path_format(source)
+
+        if compression is None:
+            with open(source, 'rb') as in_file:
+                compression = data_format(in_file.read(magic_size))
+
+        return compression
+
+    if hasattr(source, 'peek'):
+        return data_format(source.peek(magic_size)[:magic_size])
+
+    return None
+
+
+def open_input(source, compression=None):
+    """
+    Open an input for reading as bytes, decompressing it on the fly if
+    it is compressed. Closing the result does not close a file passed in.
+    :param source: path or binary file
+    :param compression: compressed format, found by input_format if None
+    :return: binary file, source itself if it is an uncompressed file
+    """
+    compression = compression or input_format(source)
+
+    if compression:
+        return formats[compression][2](source, 'rb')
+    elif isinstance(source, (str, bytes, os.PathLike)):
+        return open(source, 'rb')
+    else:
+        return source
+
+
+def open_output(target, compression=None):
+    """
+    Open an output for writing bytes, compressing them on the fly.
+    Closing the result writes the end of the compressed data; it does not
+    close a file passed in.
+    :param target: path or binary file
+    :param compression: compressed format, for a path taken from the file extension if None
+    :return: binary file, target itself if it is a file and there is no compression
+    """
+    if compression is None and isinstance(target, (str, bytes, os.PathLike)):
+        compression = path_format(target)
+
+    if compression:
+        return formats[compression][2](target, 'wb')
+    elif isinstance(target, (str, bytes, os.PathLike)):
+        return open(target, 'wb')
+    else:
+        return target
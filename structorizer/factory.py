@@ -17,6 +17,9 @@
     along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+import threading
+
+from goldparser.grammar import symbols
 from structorizer import nodes
 
 
@@ -79,6 +82,15 @@ class StatementFactory:
         '^': nodes.NullStatement
     }
 
+    # Productions left out of the diagram with everything below them, on top of those
+    # mapped to a Statement class that renders nothing. See pruned_symbols.
+    pruned = set()
+
+    # Statement class for each symbol ID, filled in from nodes as new symbols come along.
+    # Call reset() after changing nodes.
+    _classes = []
+    _lock = threading.Lock()    # Two threads must not append the classes of the same symbols
+
     @staticmethod
     def node(gp_node, parent):
         """
@@ -88,12 +100,42 @@ class StatementFactory:
         :param parent: diagram node above the node being created
         :return:
         """
-        temp_node = StatementFactory.nodes.get(gp_node.lvalue())
+        symbol = gp_node.symbol
+        classes = StatementFactory._classes
+
+        if symbol >= len(classes):
+            with StatementFactory._lock:
+                for name in symbols.names[len(classes):symbol + 1]:
+                    # Unknown expressions get the null renderer
+                    classes.append(StatementFactory.nodes.get(name, nodes.Statement))
+        elif symbol < 0:
+            # Terminals have no symbol, a negative index would pick some other class
+            raise TypeError('{!r} is not an expression'.format(gp_node.expression))
+
+        return classes[symbol](gp_node, parent)
+
+    @staticmethod
+    def pruned_symbols():
+        """
+        Productions whose lines need not be parsed at all: those mapped
+        to a silent Statement class like NullStatement, which render
+        nothing of what is below them, and those listed in pruned.
+        :return: frozenset of symbol IDs
+        """
+        names = {name for name, node_class in StatementFactory.nodes.items() if node_class.silent}
+        names.update(StatementFactory.pruned)
 
-        if temp_node is None:
-            return nodes.Statement(gp_node, parent)  # The null renderer
-        else:
-            return temp_node(gp_node, parent)
+        return frozenset(symbols.symbol(name) for name in names)
+
+    @staticmethod
+    def reset():
+        """
+        Forget the Statement classes looked up so far. Needed after a
+        change to nodes.
+        :return:
+        """
+        with StatementFactory._lock:
+            StatementFactory._classes.clear()
 
     @staticmethod
     def terminal(gp_node, parent):
@@ -17,19 +17,80 @@
     along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
-from datetime import date
+import os
+
+from datetime import date, datetime, timezone
+from itertools import repeat
+
+from goldparser.grammar import symbols
+from structorizer.output import RenderBuffer, XmlBackend
+from structorizer.xref import CrossReference
+
+
+# Shared stand-in for the child list and generator of nodes without children.
+# Iterating it yields nothing, so no per-node empty containers are needed.
+NO_CHILDREN = ()
 
 
 class Statement:
+    """
+    Diagram node base. Statements are created in large numbers, so the
+    classes use __slots__ and keep the text they collect in a tuple
+    of lists, one per name in text_fields. Subclasses list their own
+    fields in text_fields and must declare __slots__ as well.
+    """
+    __slots__ = ('gp_node', 'parent', 'gp_children', 'child_nodes', 'texts')
+
     color = 'ffffff'
+    kind = None             # Node kind written by the backends, None for nodes that only hold children
+    text_fields = ()        # Names of the text fields collected by the node
+    _field_index = {}
+    _own_build = False
+    _own_render = False
+    _own_roles = False
+    _references = False
+    silent = False          # True if the node renders nothing, its children included
+
+    # Output format, XmlBackend or NdjsonBackend from structorizer.output. Set for the
+    # whole process, like DiagramNode.created.
+    backend = XmlBackend
+
+    # CrossReference the calls and file accesses are added to while building, None to
+    # skip collecting them. Set for the whole process, one program at a time.
+    xref = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._field_index = {field: index for index, field in enumerate(cls.text_fields)}
+
+        # Classes overriding build or render themselves are handed to that method by the
+        # traversals. Checked once here instead of for every node.
+        cls._own_build = cls.build is not Statement.build
+        cls._own_render = cls.render is not Statement.render
+        cls._own_roles = cls.index_roles is not Statement.index_roles
+        cls._references = cls.add_references is not Statement.add_references
 
     def __init__(self, gp_node, parent):
         self.gp_node = gp_node      # GrammarNode being rendered by this Statement
         self.parent = parent
         self.gp_children = None     # GP child node generator
-        self.child_nodes = []       # Statement nodes corresponding to the GP children
+        self.child_nodes = NO_CHILDREN      # Statement nodes corresponding to the GP children
 
-        self.node_text = {}
+        self.texts = tuple([] for _ in self.text_fields) if self.text_fields else NO_CHILDREN
+
+    @property
+    def node_text(self):
+        """
+        :return: dictionary of the text fields and their contents
+        """
+        return dict(zip(self.text_fields, self.texts))
+
+    def text(self, field):
+        """
+        :param field: name of one of the node's text fields
+        :return: list collecting the text for the field
+        """
+        return self.texts[self._field_index[field]]
 
     def open(self, out_file):
         """
@@ -55,10 +116,27 @@ class Statement:
         :param text: text to add
         :return:
         """
-        if self.node_text.get(field) is not None:
-            self.node_text[field].append(text)
-        elif self.parent:   # Terminals for not yet supported instructions can reach the diagram root and crash
-            self.parent.add_text(field, text)
+        index = self._field_index.get(field)
+
+        if index is not None:
+            self.texts[index].append(text)
+            return
+
+        node = self.parent
+
+        # Walk up the parent chain rather than recursing
+        while node:     # Terminals for not yet supported instructions can reach the diagram root and crash
+            if not isinstance(node, Statement) or type(node).add_text is not Statement.add_text:
+                node.add_text(field, text)      # The parent has its own way of taking text
+                return
+
+            index = node._field_index.get(field)
+
+            if index is not None:
+                node.texts[index].append(text)
+                return
+
+            node = node.parent
 
     def _prime_generator(self, gp_node):
         # Removing retrieval of the generator from the render method makes
@@ -69,22 +147,109 @@ class Statement:
     def import_expressions(self, factory):
         """
         Build the Statement nodes for the GP children of this
-        node's ExpressionNode.
+        node's ExpressionNode, and for their children in turn.
+        The subtree is walked with an explicit stack, so its depth is
+        not limited by the recursion limit. _prime_generator is
+        called for every node.
         :return:
         """
-        self._prime_generator(self.gp_node)
+        pending = [self]
+
+        while pending:
+            statement = pending.pop()
+            statement._prime_generator(statement.gp_node)
+
+            child_nodes = []
 
-        for child in self.gp_children:
-            self.child_nodes.append(child.export_node(factory, self))
+            for child in statement.gp_children:
+                child_node = child.statement(factory, statement)
+                child_nodes.append(child_node)
+
+                if not child.leaf:
+                    pending.append(child_node)
+
+            if child_nodes:     # The child list is only allocated when there are children
+                statement.child_nodes = child_nodes
+
+            statement.gp_children = NO_CHILDREN      # Drop the exhausted generator
+
+            if statement._own_roles:
+                statement.index_roles()
+
+    def index_roles(self):
+        """
+        Role hook, called by import_expressions once child_nodes is
+        complete. Nodes whose children play different parts (condition,
+        branches, loop bounds, ...) work out here, once, which text field
+        each child is built for, comparing symbol IDs rather than
+        expression text. Their build_steps can then hand out the result.
+        :return:
+        """
+        pass
 
     def build(self, field):
         """
         Collect any information needed from the child nodes in order
         to successfully create the NSD XML during the render pass.
+        The work for each node is done by its build_steps. The subtree
+        is walked with an explicit stack of build_steps iterators, so
+        its depth is not limited by the recursion limit. While xref is
+        set, nodes with references add them once their subtree is built.
         :return:
         """
-        for child in self.child_nodes:
-            child.build(field)
+        no_children = NO_CHILDREN
+        referencing = self.xref is not None
+
+        steps = self.build_steps(field)
+        stack = [self._referenced(steps) if referencing and self._references else iter(steps)]
+
+        while stack:
+            for child, child_field in stack[-1]:
+                if child._own_build:
+                    child.build(child_field)    # Node with a build of its own
+                else:
+                    steps = child.build_steps(child_field)
+
+                    if referencing and child._references:
+                        stack.append(child._referenced(steps))
+                        break
+                    elif steps is not no_children:
+                        stack.append(iter(steps))
+                        break
+            else:
+                stack.pop()
+
+    def build_steps(self, field):
+        """
+        Build hook. Does the node's own build work and produces the
+        (child, field) pairs of the children to build, in order. A
+        generator can do more work after a yield; it is resumed once
+        the child's subtree has been built. By default all children are
+        built for the field the node was built for.
+        :param field: name of the text field the node is built for
+        :return: iterable of (child, field) pairs, NO_CHILDREN if there is nothing to build
+        """
+        if self.child_nodes:
+            return zip(self.child_nodes, repeat(field))
+        else:
+            return NO_CHILDREN
+
+    def _referenced(self, steps):
+        # Build the children, then add the references of the now complete text
+        yield from steps
+
+        self.add_references(self.xref)
+
+    def add_references(self, xref):
+        """
+        Cross-reference hook, called once the node and its children are
+        built when Statement.xref is set. Nodes for calls and database
+        access override it; build then hands their steps to _referenced,
+        which calls this.
+        :param xref: CrossReference
+        :return:
+        """
+        pass
 
     def matches(self, expression):
         """
@@ -95,6 +260,23 @@ class Statement:
         """
         return self.gp_node.matches(expression)
 
+    def passes_through(self):
+        """
+        Report if the node only wraps its children: it collects no text
+        of its own, hands everything its children send up to its parent
+        and renders the children unchanged between a fixed opening and
+        closing phrase. The children of such a node can be built and
+        rendered one at a time.
+        :return: true if the children can be processed independently
+        """
+        node_class = type(self)
+
+        return (node_class.build is Statement.build and
+                node_class.build_steps is Statement.build_steps and
+                node_class.add_text is Statement.add_text and
+                node_class.render is Statement.render and
+                not self.text_fields)
+
     def render(self, out_file):
         """
         Collect the entities that make up the grammar node. A Statement
@@ -103,53 +285,95 @@ class Statement:
         are joined and returned as the outcome of the statement. This
         repeats as execution ascends back up the grammar tree, leading
         to a single line of text for gp_node.
+        The nodes write their fragments to a shared RenderBuffer, which
+        is created here if out_file is a plain text or binary stream.
+        The subtree is walked with an explicit stack, handing each node
+        to the open and close of the backend. Nodes that have a render
+        method of their own are left to it.
         :param out_file: XML output destination
         :return:
         """
-        self.open(out_file)
+        buffer = RenderBuffer.wrap(out_file)
+        backend_open = self.backend.open
+        backend_close = self.backend.close
 
-        for child in self.child_nodes:
-            child.render(out_file)
+        backend_open(self, buffer)
+        stack = [(self, iter(self.child_nodes))]
 
-        self.close(out_file)
+        while stack:
+            node, children = stack[-1]
+
+            for child in children:
+                if child._own_render:
+                    if not child.silent:
+                        child.render(buffer)
+                else:
+                    backend_open(child, buffer)
+                    stack.append((child, iter(child.child_nodes)))
+                    break
+            else:
+                stack.pop()
+                backend_close(node, buffer)
+
+        if buffer is not out_file:
+            buffer.flush()
 
 
 class DiagramNode(Statement):
     """
     Structorizer diagram node
     """
+    __slots__ = ()
+
+    kind = 'diagram'
+
+    # Creation date written to the diagrams (YYYY-MM-DD). When None, the date is
+    # taken from SOURCE_DATE_EPOCH if it is set, otherwise it is today.
+    created = None
+
+    @classmethod
+    def created_date(cls):
+        """
+        :return: creation date for the diagram, in ISO format
+        """
+        if cls.created is not None:
+            return cls.created
+
+        epoch = os.environ.get('SOURCE_DATE_EPOCH')
+
+        if epoch:
+            return datetime.fromtimestamp(int(epoch), timezone.utc).date().isoformat()
+
+        return date.today().isoformat()
 
     def open(self, out_file):
         # TODO: make the program name an attribute
-        today = date.today().isoformat()
-
-        print('<?xml version="1.0" encoding="UTF-8"?>', file=out_file)
-        print('<root xmlns:nsd="https://structorizer.fisch.lu" version="3.30-12" '
-              'preRepeat="until " postFor="to" preReturn="return" postForIn="in" preWhile="while " '
-              'output="OUTPUT" input="INPUT" preFor="for" preExit="exit" preLeave="leave" ignoreCase="true" '
-              'preThrow="throw" preForIn="foreach" stepFor="by" author="sven" created="{}" '
-              'changedby="" changed="" origin="GPStruct" '
-              'text="{}" comment="" color="{color}" type="program" style="nice">'.format(today,
-                                                                                         'PROGRAM',
-                                                                                         color=self.color),
-              file=out_file)
-        print('  <children>', file=out_file)
+        today = self.created_date()
+
+        out_file.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        out_file.write('<root xmlns:nsd="https://structorizer.fisch.lu" version="3.30-12" '
+                       'preRepeat="until " postFor="to" preReturn="return" postForIn="in" preWhile="while " '
+                       'output="OUTPUT" input="INPUT" preFor="for" preExit="exit" preLeave="leave" ignoreCase="true" '
+                       'preThrow="throw" preForIn="foreach" stepFor="by" author="sven" created="{}" '
+                       'changedby="" changed="" origin="GPStruct" '
+                       'text="{}" comment="" color="{color}" type="program" style="nice">\n'.format(today,
+                                                                                                  'PROGRAM',
+                                                                                                  color=self.color))
+        out_file.write('  <children>\n')
 
     def close(self, out_file):
-        print('  </children>', file=out_file)
-        print('</root>', file=out_file)
+        out_file.write('  </children>\n')
+        out_file.write('</root>\n')
 
 
 class CaseNode(Statement):
-    def __init__(self, gp_node, parent):
-        super().__init__(gp_node, parent)
+    __slots__ = ()
 
-        self.node_text['control'] = []
-        self.node_text['branches'] = []
-        self.node_text['comments'] = []
+    kind = 'case'
+    text_fields = ('control', 'branches', 'comments')
 
     def close(self, out_file):
-        print('</case>', file=out_file)
+        out_file.write('</case>\n')
 
     def open(self, out_file):
         # The Case branches are stored in the text field as a sequence of comma
@@ -157,58 +381,63 @@ class CaseNode(Statement):
         # (in parentheses), subsequent strings the branch conditions.
         # The inner XML has as may qCase elements as there are conditions in the
         # case text parameter.
-        control = '&#34;({})&#34;'.format(' '.join(self.node_text['control']))
-        branches = ','.join(['&#34;{}&#34;'.format(branch) for branch in self.node_text['branches']])
+        control = '&#34;({})&#34;'.format(' '.join(self.text('control')))
+        branches = ','.join(['&#34;{}&#34;'.format(branch) for branch in self.text('branches')])
 
-        print('<case text="{instruction}" comment="{comments}" color="{color}">'.format(
+        out_file.write('<case text="{instruction}" comment="{comments}" color="{color}">\n'.format(
             instruction=','.join([control, branches]),
-            comments=' '.join(self.node_text['comments']),
-            color=self.color), file=out_file)
+            comments=' '.join(self.text('comments')),
+            color=self.color))
 
 
 class CaseBranch(Statement):
     """
     Base for the DECIDE FOR and DECIDE ON branches
     """
-    def __init__(self, gp_node, parent):
-        super().__init__(gp_node, parent)
+    __slots__ = ()
 
-        self.node_text['instruction'] = []
+    kind = 'branch'
+    text_fields = ('instruction',)
 
     def open(self, out_file):
-        print('<qCase>', file=out_file)
+        out_file.write('<qCase>\n')
 
     def close(self, out_file):
-        print('</qCase>', file=out_file)
+        out_file.write('</qCase>\n')
 
 
 class ToCaseNode(CaseNode):
     """
     Structorizer Case statement/Natural DECIDE outer XML
     """
+    __slots__ = ('roles',)
 
-    def build(self, field):
-        on_branches = False
-        of_found = False
+    conditions_symbol = symbols.tag('<DECIDE_ON_conditions>')
+    of_symbol = symbols.tag('<OF>')
+
+    def index_roles(self):
+        field = 'comments'
+        roles = []
 
         # A tad messy, but then so is the Case statement: the <DECIDE_ON_conditions> expression
         # separates the DECIDE statement from its branches. Inside the DECIDE statement, everything
         # up to the <OF> expression becomes a comment. Everything after becomes part of the control
         # text. The <OF> expression is discarded.
         for child in self.child_nodes:
-            if child.matches('<DECIDE_ON_conditions>'):
-                on_branches = True
+            symbol = child.gp_node.symbol
 
-            if on_branches:
-                child.build('instruction')
-            else:
-                if of_found:
-                    child.build('control')
-                else:
-                    if child.matches('<OF>'):
-                        of_found = True
-                    else:
-                        child.build('comments')
+            if symbol == self.conditions_symbol:
+                field = 'instruction'
+            elif field == 'comments' and symbol == self.of_symbol:
+                field = 'control'
+                continue
+
+            roles.append((child, field))
+
+        self.roles = roles      # (child, field) for each child that is built
+
+    def build_steps(self, field):
+        return self.roles
 
 
 class ToCaseBranch(CaseBranch):
@@ -216,14 +445,15 @@ class ToCaseBranch(CaseBranch):
     Structorizer qCase branch/Natural DECIDE branch.
     This node delegates rendering to the parent ToCaseNode
     """
+    __slots__ = ()
 
-    def build(self, field):
+    def build_steps(self, field):
         # The first two nodes (trimmed and untrimmed) make up the condition, the remaining
         # nodes the statement list. node[0] is the terminal 'VALUE' and can be omitted.
-        self.child_nodes[1].build('branches')
+        yield self.child_nodes[1], 'branches'
 
         for child in self.child_nodes[2:]:
-            child.build('instruction')
+            yield child, 'instruction'
 
 
 class ToCaseCondition(Statement):
@@ -232,16 +462,15 @@ class ToCaseCondition(Statement):
     aggregated and passed to upstream as a single entity. Otherwise, the count
     of conditions and branches will not line up result in an invalid NSD file.
     """
-    def __init__(self, gp_node, parent):
-        super().__init__(gp_node, parent)
+    __slots__ = ()
 
-        self.node_text['condition'] = []
+    text_fields = ('condition',)
 
-    def build(self, field):
+    def build_steps(self, field):
         for child in self.child_nodes:
-            child.build('condition')   # Collect the parts here
+            yield child, 'condition'   # Collect the parts here
 
-        self.parent.add_text(field, ' '.join(self.node_text['condition']))
+        self.parent.add_text(field, ' '.join(self.text('condition')))
 
 
 class ToNoneBranch(ToCaseBranch):
@@ -250,38 +479,46 @@ class ToNoneBranch(ToCaseBranch):
     different grammar: there is no VALUE terminal. The NONE terminal
     takes its place and we do need it.
     """
+    __slots__ = ()
 
-    def build(self, field):
+    def build_steps(self, field):
         # node[0] is the NONE terminal.
-        self.child_nodes[0].build('branches')
+        yield self.child_nodes[0], 'branches'
 
         for child in self.child_nodes[1:]:
-            child.build('instruction')
+            yield child, 'instruction'
 
 
 class ForCaseNode(CaseNode):
     """
     Structorizer Case statement/Natural DECIDE FOR outer XML
     """
+    __slots__ = ('roles',)
+
+    conditions_symbol = symbols.tag('<DECIDE_FOR_conditions>')
+
     def __init__(self, gp_node, parent):
         super().__init__(gp_node, parent)
 
-        self.node_text['control'] = ['*']
+        self.text('control').append('*')
 
-    def build(self, field):
-        on_branches = False
+    def index_roles(self):
+        field = 'comments'
+        roles = []
 
         # A tad messy, but then so is the Case statement: the <DECIDE_FOR_conditions> expression
         # separates the DECIDE statement from its branches. Inside the DECIDE statement, everything
         # up to the <DECIDE_FOR_conditions> expression becomes a comment.
         for child in self.child_nodes:
-            if child.matches('<DECIDE_FOR_conditions>'):
-                on_branches = True
+            if child.gp_node.symbol == self.conditions_symbol:
+                field = 'instruction'
 
-            if on_branches:
-                child.build('instruction')
-            else:
-                child.build('comments')
+            roles.append((child, field))
+
+        self.roles = roles      # (child, field) for each child
+
+    def build_steps(self, field):
+        return self.roles
 
 
 class ForCaseBranch(CaseBranch):
@@ -289,20 +526,19 @@ class ForCaseBranch(CaseBranch):
     Structorizer qCase branch/Natural DECIDE FOR branch.
     This node delegates rendering to the parent ForCaseNode
     """
-    def __init__(self, gp_node, parent):
-        super().__init__(gp_node, parent)
+    __slots__ = ()
 
-        self.node_text['condition'] = []
+    text_fields = ('instruction', 'condition')
 
-    def build(self, field):
+    def build_steps(self, field):
         # The first node is the WHEN terminal, which is ignored. The second node
         # is the anchor of the branch condition. Any remaining nodes make up the
         # branch's instructions.
-        self.child_nodes[1].build('condition')   # Collect the parts here
-        self.parent.add_text('branches', ' '.join(self.node_text['condition']))
+        yield self.child_nodes[1], 'condition'   # Collect the parts here
+        self.parent.add_text('branches', ' '.join(self.text('condition')))
 
         for child in self.child_nodes[2:]:
-            child.build('instruction')
+            yield child, 'instruction'
 
 
 class ForNoneBranch(ForCaseBranch):
@@ -311,179 +547,192 @@ class ForNoneBranch(ForCaseBranch):
     different grammar: there is no VALUE terminal. The NONE terminal
     takes its place and we do need it.
     """
+    __slots__ = ()
 
-    def build(self, field):
+    def build_steps(self, field):
         # node[0] is the WHEN terminal.
-        self.child_nodes[1].build('branches')
+        yield self.child_nodes[1], 'branches'
 
         for child in self.child_nodes[2:]:
-            child.build('instruction')
+            yield child, 'instruction'
 
 
 class ExitNode(Statement):
     """
     Structorizer Exit node
     """
-    color = 'ffff80'
-
-    def __init__(self, gp_node, parent):
-        super().__init__(gp_node, parent)
+    __slots__ = ()
 
-        self.node_text['instruction'] = []
+    kind = 'jump'
+    color = 'ffff80'
+    text_fields = ('instruction',)
 
     def open(self, out_file):
         # Instructions contain no other elements so the closing tag is included.
-        print('<jump text="{instruction}" comment="" color="{color}" rotated="0" disabled="0">'.format(
-            instruction=' '.join(self.node_text['instruction']),
-            color=self.color),
-            end='', file=out_file)
+        out_file.write('<jump text="{instruction}" comment="" color="{color}" rotated="0" disabled="0">'.format(
+            instruction=' '.join(self.text('instruction')),
+            color=self.color))
 
     def close(self, out_file):
-        print('</jump>', file=out_file)
+        out_file.write('</jump>\n')
 
 
 class ExternalExitNode(ExitNode):
     """
     Cyan colored jump out of the current module
     """
+    __slots__ = ()
+
     color = '80ffff'
 
+    def add_references(self, xref):
+        xref.add_call(self.text('instruction'))     # FETCH
+
 
 class ForNode(Statement):
     """
     FOR statement outer XML element
     """
+    __slots__ = ('roles',)
 
-    def __init__(self, gp_node, parent):
-        super().__init__(gp_node, parent)
+    kind = 'for'
+
+    statement_list_symbol = symbols.tag('<statement_list>')
 
-        self.node_text['instruction'] = []
-        self.node_text['for_control'] = []
-        self.node_text['for_from'] = []
-        self.node_text['for_to'] = []
-        self.node_text['for_step'] = []
+    text_fields = ('instruction', 'for_control', 'for_from', 'for_to', 'for_step')
 
     def open(self, out_file):
         # Only show the step field if a step expression is present in the grammar.
-        if len(self.node_text['for_step']) > 0:
-            step = ' by ' + ' '.join(self.node_text['for_step'])
+        if len(self.text('for_step')) > 0:
+            step = ' by ' + ' '.join(self.text('for_step'))
         else:
             step = ''
 
         # for uses &#60; (less than) to separate the loop variable from the values
-        print('<for text="{instruction} {for_control} &#60;- {for_from} to {for_to}{for_step}" comment="" color="{color}">'.format(
-            instruction=' '.join(self.node_text['instruction']),
-            for_control=' '.join(self.node_text['for_control']),
-            for_from=' '.join(self.node_text['for_from']),
-            for_to=' '.join(self.node_text['for_to']),
+        out_file.write('<for text="{instruction} {for_control} &#60;- {for_from} to {for_to}{for_step}" comment="" color="{color}">\n'.format(
+            instruction=' '.join(self.text('instruction')),
+            for_control=' '.join(self.text('for_control')),
+            for_from=' '.join(self.text('for_from')),
+            for_to=' '.join(self.text('for_to')),
             for_step = step,
-            color=self.color), file=out_file)
-        print('  <qFor>', file=out_file)
+            color=self.color))
+        out_file.write('  <qFor>\n')
 
     def close(self, out_file):
-        print('  </qFor>', file=out_file)
-        print('</for>', file=out_file)
+        out_file.write('  </qFor>\n')
+        out_file.write('</for>\n')
 
-    def build(self, field):
+    def index_roles(self):
         """
-        Collect the parts that make up the FOR instruction
-        :param field:
+        Sort out the parts that make up the FOR instruction
         :return:
         """
         # A trimmed tree does not have any indication of what is coming
         # for the required parts
-        # TODO: support for the optional STEP
-        child = self.child_nodes[0]  # FOR terminal
-        child.build('instruction')
-
-        child = self.child_nodes[1]  # loop variable
-        child.build('for_control')
-
-        child = self.child_nodes[2]  # start value
-        child.build('for_from')
-
-        child = self.child_nodes[3]  # end value
-        child.build('for_to')
+        children = self.child_nodes
+        roles = [(children[0], 'instruction'),      # FOR terminal
+                 (children[1], 'for_control'),      # loop variable
+                 (children[2], 'for_from'),         # start value
+                 (children[3], 'for_to')]           # end value
 
         # It does appear a single loop statement results in a statement_list expression, even
         # in a trimmed tree. If element[4] is not a statement_list, take it as the step expression
-        if self.child_nodes[4].matches('<statement_list>'):
-            for child in self.child_nodes[4:-1]:
-                child.build('instruction')
+        if children[4].gp_node.symbol == self.statement_list_symbol:
+            body = children[4:-1]
         else:
-            child = self.child_nodes[4]  # end value
             # TODO: Structorizer does not like a space in negative values
-            child.build('for_step')
+            roles.append((children[4], 'for_step'))
+            body = children[5:-1]
+
+        roles.extend((child, 'instruction') for child in body)
+
+        self.roles = roles      # (child, field) for each child that is built
 
-            for child in self.child_nodes[5:-1]:
-                child.build('instruction')
+    def build_steps(self, field):
+        return self.roles
 
 
 class ForeverNode(Statement):
     """
     FOREVER statement outer XML element
     """
+    __slots__ = ()
+
+    kind = 'forever'
+
     def open(self, out_file):
-        print('<forever comment="" color="{color}">'.format(color=self.color), file=out_file)
-        print('  <qForever>', file=out_file)
+        out_file.write('<forever comment="" color="{color}">\n'.format(color=self.color))
+        out_file.write('  <qForever>\n')
 
     def close(self, out_file):
-        print('  </qForever>', file=out_file)
-        print('</forever>', file=out_file)
+        out_file.write('  </qForever>\n')
+        out_file.write('</forever>\n')
 
 
 class WhileNode(Statement):
     """
     WHILE statement outer XML element
     """
+    __slots__ = ()
 
-    def __init__(self, gp_node, parent):
-        super().__init__(gp_node, parent)
-
-        self.node_text['instruction'] = []
+    kind = 'while'
+    text_fields = ('instruction',)
 
     def open(self, out_file):
-        print('<while text="{}" comment="" color="{color}">'.format(
-            ' '.join(self.node_text['instruction']), color=self.color), file=out_file)
-        print('  <qWhile>', file=out_file)
+        out_file.write('<while text="{}" comment="" color="{color}">\n'.format(
+            ' '.join(self.text('instruction')), color=self.color))
+        out_file.write('  <qWhile>\n')
 
     def close(self, out_file):
-        print('  </qWhile>', file=out_file)
-        print('</while>', file=out_file)
+        out_file.write('  </qWhile>\n')
+        out_file.write('</while>\n')
 
-    def build(self, field):
+    def build_steps(self, field):
         """
         Collect the terminals that make up the text for the instruction
         :return:
         """
         for child in self.child_nodes[:-1]:
-            child.build('instruction')
+            yield child, 'instruction'
 
 
 class DatabaseLoop(WhileNode):
+    __slots__ = ()
+
     color = '80ff80'        # Green
 
+    def view_name(self):
+        """
+        :return: view the loop reads, None if there is none
+        """
+        return CrossReference.view_name(self.text('instruction'))
+
+    def add_references(self, xref):
+        view = self.view_name()
+
+        if view is not None:
+            xref.add_access(self.text('instruction')[0], view)      # READ, FIND
+
 
 class AlternativeNode(Statement):
     """
     IF statement outer XML element
     """
+    __slots__ = ()
 
-    def __init__(self, gp_node, parent):
-        super().__init__(gp_node, parent)
-
-        self.node_text['instruction'] = []
+    kind = 'alternative'
+    text_fields = ('instruction',)
 
     # Problem: logical expression starts at the same level as IF
     def open(self, out_file):
-        print('<alternative text="({instruction})" comment="" color="{color}">'.format(
-            instruction=' '.join(self.node_text['instruction']),
-            color=self.color), file=out_file)
+        out_file.write('<alternative text="({instruction})" comment="" color="{color}">\n'.format(
+            instruction=' '.join(self.text('instruction')),
+            color=self.color))
 
     def close(self, out_file):
-        print('</alternative>', file=out_file)
+        out_file.write('</alternative>\n')
 
-    def build(self, field):
+    def build_steps(self, field):
         """
         Collect the parts that make up the logical expression
         :return:
@@ -492,7 +741,7 @@ class AlternativeNode(Statement):
         # The rest can be built as normal as the true/false branch classes
         # are set up to collect wayward instruction terminals.
         for child in self.child_nodes[1:]:
-            child.build('instruction')
+            yield child, 'instruction'
 
 
 class AlternativeTrueNode(Statement):
@@ -500,18 +749,19 @@ class AlternativeTrueNode(Statement):
     Alternative statement True branch
     """
 
-    def __init__(self, gp_node, parent):
-        super().__init__(gp_node, parent)
+    __slots__ = ()
 
-        # THEN branch has no instruction but this prevents unused
-        # terminals from reaching the parent IF statement.
-        self.node_text['instruction'] = []
+    kind = 'true'
+
+    # THEN branch has no instruction but this prevents unused
+    # terminals from reaching the parent IF statement.
+    text_fields = ('instruction',)
 
     def open(self, out_file):
-        print('<qTrue>', file=out_file)
+        out_file.write('<qTrue>\n')
 
     def close(self, out_file):
-        print('</qTrue>', file=out_file)
+        out_file.write('</qTrue>\n')
 
 
 class AlternativeFalseNode(Statement):
@@ -519,18 +769,19 @@ class AlternativeFalseNode(Statement):
     Alternative statement False branch
     """
 
-    def __init__(self, gp_node, parent):
-        super().__init__(gp_node, parent)
+    __slots__ = ()
+
+    kind = 'false'
 
-        # ELSE branch has no instruction but this prevents unused
-        # terminals from reaching the parent IF statement.
-        self.node_text['instruction'] = []
+    # ELSE branch has no instruction but this prevents unused
+    # terminals from reaching the parent IF statement.
+    text_fields = ('instruction',)
 
     def open(self, out_file):
-        print('<qFalse>', file=out_file)
+        out_file.write('<qFalse>\n')
 
     def close(self, out_file):
-        print('</qFalse>', file=out_file)
+        out_file.write('</qFalse>\n')
 
 
 class InstructionNode(Statement):
@@ -539,19 +790,18 @@ class InstructionNode(Statement):
     multiple parser lines. The terminals for all parser lines are
     concatenated and returned as the content.
     """
+    __slots__ = ()
 
-    def __init__(self, gp_node, parent):
-        super().__init__(gp_node, parent)
-
-        self.node_text['instruction'] = []
+    kind = 'instruction'
+    text_fields = ('instruction',)
 
     def open(self, out_file):
-        print('<instruction text="{instruction}" comment="" color="{color}" rotated="0" disabled="0">'.format(
-            instruction=' '.join(self.node_text['instruction']),
-            color=self.color), end='', file=out_file)
+        out_file.write('<instruction text="{instruction}" comment="" color="{color}" rotated="0" disabled="0">'.format(
+            instruction=' '.join(self.text('instruction')),
+            color=self.color))
 
     def close(self, out_file):
-        print('</instruction>', file=out_file)
+        out_file.write('</instruction>\n')
 
 
 class CallNode(InstructionNode):
@@ -559,91 +809,119 @@ class CallNode(InstructionNode):
     Node for subroutine calls. It is a non-container instruction with
     a distinct rendering.
     """
+    __slots__ = ()
 
-    def __init__(self, gp_node, parent):
-        super().__init__(gp_node, parent)
-
-        self.node_text['instruction'] = []
+    kind = 'call'
 
     def open(self, out_file):
-        print('<call text="{instruction}" comment="" color="{color}" rotated="0" disabled="0">'.format(
-            instruction=' '.join(self.node_text['instruction']),
-            color=self.color), end='', file=out_file)
+        out_file.write('<call text="{instruction}" comment="" color="{color}" rotated="0" disabled="0">'.format(
+            instruction=' '.join(self.text('instruction')),
+            color=self.color))
 
     def close(self, out_file):
-        print('</call>', file=out_file)
+        out_file.write('</call>\n')
+
+    def add_references(self, xref):
+        xref.add_call(self.text('instruction'))     # PERFORM, CALLNAT
 
 
 class DatabaseInstruction(InstructionNode):
-    color = '80ff80'        # Green
+    __slots__ = ('roles',)
 
-    def __init__(self, gp_node, parent):
-        super().__init__(gp_node, parent)
+    assignments_symbols = (symbols.tag('<UPDATE_source>'), symbols.tag('<STORE_how>'))
 
-        self.node_text['assignments'] = []
+    color = '80ff80'        # Green
+    text_fields = ('instruction', 'assignments')
 
     def open(self, out_file):
-        statement = '&#34;{}&#34;'.format(' '.join(self.node_text['instruction']))
-        assignments = ','.join(['&#34;  {}&#34;'.format(assignment) for assignment in self.node_text['assignments']])
+        statement = '&#34;{}&#34;'.format(' '.join(self.text('instruction')))
+        assignments = ','.join(['&#34;  {}&#34;'.format(assignment) for assignment in self.text('assignments')])
 
         instruction = [statement, assignments]
 
-        print('<instruction text="{instruction}" comment="" color="{color}" rotated="0" disabled="0">'.format(
+        out_file.write('<instruction text="{instruction}" comment="" color="{color}" rotated="0" disabled="0">\n'.format(
             instruction=','.join(instruction),
-            color=self.color), file=out_file)
+            color=self.color))
 
     # In order to put the field assignments on separate line, the database
     # instruction needs to be separated from the contained instructions.
     # It is possible to do it without this build method, but then the
     # DBAssignment build method would need the 'assignments' target hardcoded.
-    def build(self, field):
-        db_instruction = True
+    def index_roles(self):
+        field = 'instruction'
+        roles = []
 
         for child in self.child_nodes:
             # This also splits USING SAME to the next line. Overcoming that will
             # need some changes to the grammar and another intermediate diagram
             # node to send SAME to 'instructions' and SET/WITH to 'assignments'
-            if child.matches('<UPDATE_source>') or child.matches('<STORE_how>'):
-                db_instruction = False
+            if child.gp_node.symbol in self.assignments_symbols:
+                field = 'assignments'
 
-            if db_instruction:
-                child.build('instruction')
-            else:
-                child.build('assignments')
+            roles.append((child, field))
+
+        self.roles = roles      # (child, field) for each child
+
+    def build_steps(self, field):
+        return self.roles
+
+    def add_references(self, xref):
+        words = self.text('instruction')
+        verb = words[0].upper() if words else None
+
+        if verb == 'UPDATE':
+            # UPDATE changes the record of the READ or FIND loop around it
+            node = self.parent
+
+            while node is not None and not isinstance(node, DatabaseLoop):
+                node = node.parent
+
+            view = node.view_name() if node is not None else None
+        elif verb in ('STORE', 'GET'):
+            view = CrossReference.view_name(words)
+        else:
+            view = None         # END TRANSACTION
+
+        if view is not None:
+            xref.add_access(verb, view)
 
 
 class DBAssignment(Statement):
     """
     Assembles the parts of a database assignment into a single line
     """
+    __slots__ = ()
 
-    def __init__(self, gp_node, parent):
-        super().__init__(gp_node, parent)
-
-        self.node_text['instruction'] = []
+    text_fields = ('instruction',)
 
-    def build(self, field):
+    def build_steps(self, field):
         # Collect the parts making up this assignment
         for child in self.child_nodes:
-            child.build('instruction')
+            yield child, 'instruction'
 
         # Assemble the pieces and send them to the parent node
-        self.parent.add_text(field, ' '.join(self.node_text['instruction']))
+        self.parent.add_text(field, ' '.join(self.text('instruction')))
 
 
 class DiagramTerminal(Statement):
     """
     Diagram equivalent of the grammar side DiagramTerminal
     """
-    def build(self, field):
+    __slots__ = ()
+
+    silent = True
+
+    def build_steps(self, field):
         """
         Pass the contents of the GrammarNode terminal to the parent
         Statement.
         :param field:
-        :return:
+        :return: NO_CHILDREN, terminals have no children to build
         """
         self.parent.add_text(field, self.gp_node.render())
 
+        return NO_CHILDREN
+
     def render(self, out_file):
         pass
 
@@ -655,11 +933,10 @@ class NullStatement(Statement):
     prevent unwanted statements (like REDEFINE) from leaking into other
     statements.
     """
+    __slots__ = ()
 
-    def __init__(self, gp_node, parent):
-        super().__init__(gp_node, parent)
-
-        self.node_text['instruction'] = []
+    silent = True
+    text_fields = ('instruction',)
 
     def render(self, out_file):
         pass
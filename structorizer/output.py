@@ -0,0 +1,203 @@
+"""
+    gpstruct.py Convert a GOLDParser parse tree export to Structorizer XML
+
+    Copyright (C) 2022  Sven Coenye
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import io
+import json
+
+from xml.sax.saxutils import unescape
+
+
+# Structorizer doubles the double quotes on top of the XML escapes
+xml_entities = {'&#34;&#34;': '"'}
+
+
+def plain_text(text):
+    """
+    :param text: text collected by a node, XML escaped
+    :return: text as it is in the program
+    """
+    if '&' in text:
+        return unescape(text, xml_entities)
+    else:
+        return text
+
+
+class RenderBuffer:
+    """
+    Collects the fragments written by the Statement nodes and passes
+    them on to the destination in large chunks. A binary destination
+    receives the XML as UTF-8 bytes, matching the XML declaration.
+    """
+    chunk_size = 1 << 16    # Characters collected before they are written out
+
+    def __init__(self, out_file, binary=None):
+        """
+        :param out_file: text or binary stream
+        :param binary: True if out_file takes bytes, detected when None
+        """
+        if binary is None:
+            binary = isinstance(out_file, (io.RawIOBase, io.BufferedIOBase))
+
+        self.out_file = out_file
+        self.binary = binary
+
+        self._fragments = []
+        self._size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+    @staticmethod
+    def wrap(out_file):
+        """
+        :param out_file: stream or RenderBuffer
+        :return: out_file if it is a RenderBuffer, otherwise a new RenderBuffer for it
+        """
+        if isinstance(out_file, RenderBuffer):
+            return out_file
+        else:
+            return RenderBuffer(out_file)
+
+    def write(self, fragment):
+        """
+        Add a fragment of output
+        :param fragment: text
+        :return:
+        """
+        self._fragments.append(fragment)
+        self._size += len(fragment)
+
+        if self._size >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Pass everything collected so far on to the destination
+        :return:
+        """
+        if self._fragments:
+            chunk = ''.join(self._fragments)
+            self._fragments = []
+            self._size = 0
+
+            if self.binary:
+                self.out_file.write(chunk.encode('utf-8'))
+            else:
+                self.out_file.write(chunk)
+
+
+class XmlBackend:
+    """
+    Structorizer XML, written by the open and close hooks of the
+    Statement nodes themselves
+    """
+    name = 'xml'
+    suffix = '.nsd'
+    content_type = 'application/xml'
+
+    @staticmethod
+    def open(node, out_file):
+        """
+        Write the part of a node that comes before its children
+        :param node: Statement
+        :param out_file: RenderBuffer or text stream
+        :return:
+        """
+        node.open(out_file)
+
+    @staticmethod
+    def close(node, out_file):
+        """
+        Write the part of a node that comes after its children
+        :param node: Statement
+        :param out_file: RenderBuffer or text stream
+        :return:
+        """
+        node.close(out_file)
+
+
+class NdjsonBackend:
+    """
+    Compact diagram structure as newline delimited JSON, for tools that
+    want the statements without parsing XML. Every node with a kind
+    (instruction, call, alternative, case, for, while, forever, jump,
+    ...) is one object holding its kind, color and text fields. The
+    children of a container follow it, up to an {"end": kind} line.
+    No line depends on what came before it, so the streamed, parallel
+    and fragment cached conversions produce the same output. The text
+    is written as it is in the program, without the XML escapes.
+    """
+    name = 'ndjson'
+    suffix = '.ndjson'
+    content_type = 'application/x-ndjson'
+
+    leaves = frozenset(['instruction', 'call', 'jump'])     # Kinds that never have children
+
+    encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+
+    @staticmethod
+    def open(node, out_file):
+        kind = node.kind
+
+        if kind is not None:
+            fields = {field: [plain_text(part) for part in parts] for field, parts in node.node_text.items()}
+
+            out_file.write(NdjsonBackend.encode({'kind': kind, 'color': node.color, 'text': fields}))
+            out_file.write('\n')
+
+    @staticmethod
+    def close(node, out_file):
+        kind = node.kind
+
+        if kind is not None and kind not in NdjsonBackend.leaves:
+            out_file.write('{"end":"' + kind + '"}\n')
+
+
+backends = {backend.name: backend for backend in (XmlBackend, NdjsonBackend)}
+
+
+def read_ndjson(lines):
+    """
+    Rebuild the diagrams written by the NdjsonBackend. The children of
+    a container are listed under 'children'.
+    :param lines: iterable of NDJSON lines
+    :return: list of the top level nodes, normally one diagram
+    """
+    roots = []
+    stack = [roots]
+
+    for line in lines:
+        if not line.strip():
+            continue
+
+        node = json.loads(line)
+
+        if 'end' in node:
+            stack.pop()
+        elif node['kind'] in NdjsonBackend.leaves:
+            stack[-1].append(node)
+        else:
+            node['children'] = []
+            stack[-1].append(node)
+            stack.append(node['children'])
+
+    return roots
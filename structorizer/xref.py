@@ -0,0 +1,142 @@
+"""
+    gpstruct.py Convert a GOLDParser parse tree export to Structorizer XML
+
+    Copyright (C) 2022  Sven Coenye
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import json
+import os
+
+from structorizer.compression import strip_extension
+from structorizer.output import plain_text
+
+
+class CrossReference:
+    """
+    Index of what a program refers to outside itself: the subroutines
+    and programs it calls (PERFORM, CALLNAT, FETCH) and the files it
+    accesses (READ, FIND, GET, STORE, UPDATE). The Statement nodes add
+    their references while the diagram is built, so no second pass
+    over the output is needed. Names are kept as written in the
+    program, string literals without their quotes.
+    """
+    suffix = '.xref.json'
+
+    # Words that can come between a database verb and the view name
+    view_keywords = frozenset(['ALL', 'FIRST', 'UNIQUE', 'NUMBER', 'RECORD', 'RECORDS', 'IN', 'FILE', 'STATEMENT',
+                               'MULTI-FETCH', 'OF', 'ON', 'OFF'])
+
+    # Words that can come between FETCH and the program name
+    fetch_keywords = frozenset(['RETURN', 'REPEAT'])
+
+    def __init__(self):
+        self.calls = {}     # Verb -> set of called names
+        self.files = {}     # Verb -> set of view names
+
+    @staticmethod
+    def name(word):
+        """
+        :param word: operand as collected by a node
+        :return: name as written in the program, without the quotes of a string literal
+        """
+        word = plain_text(word)
+
+        if len(word) > 1 and word[0] == word[-1] and word[0] in '\'"':
+            return word[1:-1]
+        else:
+            return word
+
+    @staticmethod
+    def operand(words, keywords):
+        """
+        :param words: text of a statement, the verb first
+        :param keywords: words to skip after the verb
+        :return: first word after the verb that is not a keyword, a number or in parentheses, None if there is none
+        """
+        depth = 0
+
+        for word in words[1:]:
+            if word == '(':
+                depth += 1
+            elif word == ')':
+                depth -= 1
+            elif depth == 0 and word.upper() not in keywords and not word.isdigit():
+                return word
+
+        return None
+
+    @staticmethod
+    def view_name(words):
+        """
+        :param words: text of a database statement, the verb first
+        :return: view name, None if there is none
+        """
+        return CrossReference.operand(words, CrossReference.view_keywords)
+
+    def add_call(self, words):
+        """
+        Record a call
+        :param words: text of a PERFORM, CALLNAT or FETCH statement
+        :return:
+        """
+        target = CrossReference.operand(words, CrossReference.fetch_keywords)
+
+        if target is not None:
+            self.calls.setdefault(words[0].upper(), set()).add(CrossReference.name(target))
+
+    def add_access(self, verb, view):
+        """
+        Record a file access
+        :param verb: database statement, like READ or STORE
+        :param view: view name
+        :return:
+        """
+        self.files.setdefault(verb.upper(), set()).add(CrossReference.name(view))
+
+    def as_dict(self):
+        """
+        :return: dictionary of 'calls' and 'files', each a dictionary of verb: sorted names
+        """
+        return {'calls': {verb: sorted(names) for verb, names in sorted(self.calls.items())},
+                'files': {verb: sorted(names) for verb, names in sorted(self.files.items())}}
+
+    def write(self, path):
+        """
+        Write the index as JSON. A temporary file is written first so
+        readers never see a partial index.
+        :param path: index file
+        :return:
+        """
+        temp_path = path + '.tmp'
+
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as xref_file:
+                json.dump(self.as_dict(), xref_file, indent=2)
+                xref_file.write('\n')
+
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    @staticmethod
+    def sidecar_path(out_path):
+        """
+        :param out_path: diagram file
+        :return: index file next to it, with the extensions of the diagram replaced
+        """
+        return os.path.splitext(strip_extension(out_path))[0] + CrossReference.suffix
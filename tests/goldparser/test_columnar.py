@@ -0,0 +1,100 @@
+"""
+    gpstruct.py Convert a GOLDParser parse tree export to Structorizer XML
+
+    Copyright (C) 2022  Sven Coenye
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import io
+import unittest
+
+from goldparser.columnar import ColumnarTree
+from goldparser.grammar import ExpressionNode, TerminalNode
+from gpstruct import GPStruct
+from structorizer.factory import StatementFactory
+from structorizer.nodes import InstructionNode, DiagramTerminal
+
+from tests.test_gpstruct import PARSE_TREE
+
+
+class ColumnarTreeTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tree = ColumnarTree()
+        self.tree.append(0, '<program> ::= <statement_list> END', False)
+        self.tree.append(1, '<ADD> ::= ADD <operand> TO <operand>', False)
+        self.tree.append(2, 'ADD', True)
+        self.tree.append(2, '1', True)
+        self.tree.append(1, '<ADD> ::= ADD <operand> TO <operand>', False)
+        self.tree.append(2, 'ADD', True)
+        self.tree.append(1, 'END', True)
+        self.tree.close()
+
+        self.root = self.tree.root()
+
+    def test_string_table(self):
+        self.assertEqual(5, len(self.tree.strings))
+
+    def test_traverse(self):
+        children = list(self.root.traverse())
+
+        self.assertListEqual([1, 4, 6], [child.index for child in children])
+        self.assertIsInstance(children[0], ExpressionNode)
+        self.assertIsInstance(children[2], TerminalNode)
+
+    def test_parent(self):
+        child = self.tree.node(3)
+
+        self.assertEqual(self.tree.node(1), child.parent)
+        self.assertEqual(2, child.level)
+        self.assertIsNone(self.root.parent)
+
+    def test_lvalue(self):
+        self.assertEqual('ADD', self.tree.node(1).lvalue())
+        self.assertTrue(self.tree.node(4).matches('<ADD>'))
+
+    def test_export_node(self):
+        statement = self.tree.node(1).export_node(StatementFactory, None)
+
+        self.assertIsInstance(statement, InstructionNode)
+        self.assertIsInstance(statement.child_nodes[0], DiagramTerminal)
+
+    def test_render(self):
+        self.assertEqual('1', self.tree.node(3).render())
+
+    def test_no_dict(self):
+        # Views only hold the tree and the node number
+        for node in (self.root, self.tree.node(2)):
+            with self.subTest(node=type(node).__name__):
+                self.assertFalse(hasattr(node, '__dict__'))
+
+    def test_outside_root(self):
+        with self.assertRaises(ValueError):
+            self.tree.append(0, '<program>', False)
+
+
+class ColumnarParseTest(unittest.TestCase):
+    def convert(self, columnar):
+        gp_parser = GPStruct(columnar)
+
+        with open(PARSE_TREE) as gp_file, io.StringIO() as output:
+            gp_parser.convert(gp_file, StatementFactory, output)
+            return output.getvalue()
+
+    def test_convert(self):
+        self.assertEqual(self.convert(False), self.convert(True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -19,7 +19,7 @@
 
 import unittest
 
-from goldparser.grammar import ExpressionNode, TerminalNode
+from goldparser.grammar import EscapeCache, ExpressionNode, TerminalNode, SymbolTable, symbols
 from structorizer.factory import StatementFactory
 from structorizer.nodes import InstructionNode, DiagramTerminal
 
@@ -35,6 +35,53 @@ class ExpressionNodeTest(unittest.TestCase):
     def test_export_node(self):
         self.assertIsInstance(self.gp_node.export_node(StatementFactory, None), InstructionNode)
 
+    def test_symbol(self):
+        other = ExpressionNode(3, '<ADD> ::= <rvalue>')
+
+        self.assertEqual(self.gp_node.symbol, other.symbol)
+        self.assertIs(self.gp_node.expression, other.expression)
+        self.assertEqual('ADD', symbols.names[other.symbol])
+
+    def test_matches(self):
+        self.assertTrue(self.gp_node.matches('<ADD>'))
+        self.assertFalse(self.gp_node.matches('<ADD_all>'))
+        self.assertTrue(self.gp_node.matches('<ADD> ::='))
+
+
+class SymbolTableTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.symbols = SymbolTable()
+
+    def test_expression(self):
+        text, symbol = self.symbols.expression('<FOR> ::= FOR <user_identifier>')
+
+        self.assertEqual(symbol, self.symbols.symbol('FOR'))
+        self.assertEqual(symbol, self.symbols.expression('<FOR> ::= FOR <user_identifier>')[1])
+
+    def test_tag(self):
+        self.assertEqual(self.symbols.symbol('OF'), self.symbols.tag('<OF>'))
+        self.assertIsNone(self.symbols.tag('<OF> ::='))
+        self.assertIsNone(self.symbols.tag('OF'))
+
+
+class EscapeCacheTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.escapes = EscapeCache(max_entries=2)
+
+    def test_escape(self):
+        self.assertEqual('#A &lt; &#34;&#34;B&amp;C&#34;&#34;', self.escapes.escape('#A < "B&C"'))
+        self.assertEqual('#A &lt; &#34;&#34;B&amp;C&#34;&#34;', self.escapes.escape('#A < "B&C"'))
+        self.assertEqual('MOVE', self.escapes.escape('MOVE'))
+
+        self.assertDictEqual({'hits': 1, 'misses': 2, 'plain': 1, 'entries': 2}, self.escapes.counts())
+
+    def test_bounded(self):
+        for text in ('A', 'B', 'C'):
+            self.escapes.escape(text)
+
+        self.assertEqual(1, len(self.escapes))
+        self.assertEqual('A', self.escapes.escape('A'))
+
 
 class TerminalNodeTest(unittest.TestCase):
     def setUp(self) -> None:
@@ -45,6 +92,11 @@ class TerminalNodeTest(unittest.TestCase):
 
     def test_render(self):
         self.assertEqual('TEST', self.node.render())
+        self.assertEqual('&lt;', TerminalNode(0, '<').render())
+
+    def test_matches(self):
+        self.assertFalse(self.node.matches('<TEST>'))
+        self.assertTrue(self.node.matches('TE'))
 
 
 if __name__ == '__main__':
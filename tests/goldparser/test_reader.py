@@ -0,0 +1,165 @@
+"""
+    gpstruct.py Convert a GOLDParser parse tree export to Structorizer XML
+
+    Copyright (C) 2022  Sven Coenye
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import io
+import os
+import tempfile
+import unittest
+
+from benchmarks.generator import ParseTreeGenerator
+from goldparser.reader import MappedExport, TreeTokenizer
+from gpstruct import GPStruct
+
+from tests.test_gpstruct import PARSE_TREE, convert
+
+
+class MappedExportTest(unittest.TestCase):
+    def test_tree_lines(self):
+        with open(PARSE_TREE) as gp_file:
+            expected = list(GPStruct()._read_tree(gp_file))
+
+        with MappedExport(PARSE_TREE) as gp_file:
+            self.assertListEqual(expected, list(gp_file.tree_lines()))
+
+    def test_convert(self):
+        with open(PARSE_TREE) as gp_file:
+            expected = convert(gp_file)
+
+        with open(PARSE_TREE, 'rb') as raw_file, MappedExport(raw_file) as gp_file:
+            self.assertEqual(expected, convert(gp_file))
+
+    def test_shared_strings(self):
+        with MappedExport(PARSE_TREE) as gp_file:
+            terminals = [expression for _, expression in gp_file.tree_lines() if expression == 'EMPLOYEES']
+
+        self.assertEqual(2, len(terminals))
+        self.assertIs(terminals[0], terminals[1])
+
+    def test_stream(self):
+        # Streams that cannot be mapped are read instead
+        tree = 'Parse Tree\r\n\r\n+--<program> ::= <statement_list> END\r\n|  +--END\r\n\r\nTokens\r\n'
+
+        with MappedExport(io.BytesIO(tree.encode('ascii'))) as gp_file:
+            self.assertListEqual([(0, '<program> ::= <statement_list> END'), (1, 'END')],
+                                 list(gp_file.tree_lines()))
+
+    def test_empty(self):
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+
+        try:
+            with MappedExport(path) as gp_file:
+                self.assertListEqual([], list(gp_file.tree_lines()))
+        finally:
+            os.remove(path)
+
+    def test_malformed(self):
+        tree = 'Parse Tree\n\n+--<program> ::= END\n|  +--\n|  +--END\n\n'
+
+        with MappedExport(io.BytesIO(tree.encode('ascii'))) as gp_file:
+            self.assertListEqual([(0, '<program> ::= END')], list(gp_file.tree_lines()))
+            self.assertEqual('|  +--', gp_file.malformed)
+
+    def test_trailing_whitespace(self):
+        tree = 'Parse Tree\n\n+--<program> ::= END\n|  +--#B\xa0\n|  +--TO\n\n'
+
+        with MappedExport(io.BytesIO(tree.encode('utf-8'))) as gp_file:
+            self.assertListEqual([(0, '<program> ::= END'), (1, '#B'), (1, 'TO')], list(gp_file.tree_lines()))
+
+    def test_encoding(self):
+        tree = "Parse Tree\n\n+--<program> ::= <statement_list> END\n|  +--'Café+--Crème'\n"
+
+        with MappedExport(io.BytesIO(tree.encode('cp1252')), 'cp1252') as gp_file:
+            self.assertListEqual([(0, '<program> ::= <statement_list> END'), (1, "'Café+--Crème'")],
+                                 list(gp_file.tree_lines()))
+
+
+def split_lines(gp_file):
+    # The line by line reader TreeTokenizer replaces
+    for line in gp_file:
+        if line.strip() == '':
+            break
+
+    for line in gp_file:
+        line = line.strip()
+        if line == '':
+            break
+
+        prefix, _, text = line.partition('+--')
+
+        yield prefix.count('|'), text
+
+
+class TreeTokenizerTest(unittest.TestCase):
+    tree = ("Parse Tree\n\n+--<program> ::= <statement_list> END\n|  +--<compare> ::= <a> '<' <b>\n"
+            "|  |  +--<\n|  |  +--'A+--B'\n|  +--END\n\nTokens\n+--END\n")
+
+    def test_lines(self):
+        with io.StringIO(self.tree) as gp_file:
+            self.assertListEqual([(0, '<program> ::= <statement_list> END'), (1, "<compare> ::= <a> '<' <b>"),
+                                  (2, '<'), (2, "'A+--B'"), (1, 'END')],
+                                 list(TreeTokenizer(gp_file).lines()))
+
+    def test_unclosed(self):
+        # No blank line after the tree
+        with io.StringIO('Parse Tree\n\n+--<program> ::= END\n|  +--END') as gp_file:
+            self.assertListEqual([(0, '<program> ::= END'), (1, 'END')], list(TreeTokenizer(gp_file).lines()))
+
+    def test_malformed(self):
+        # Reading stops at a line without an expression after +--
+        for line in ('|  END', '|  +--'):
+            with self.subTest(line=line), io.StringIO('Parse Tree\n\n+--<program> ::= END\n' + line +
+                                                     '\n|  +--END\n\n') as gp_file:
+                tokenizer = TreeTokenizer(gp_file)
+
+                self.assertListEqual([(0, '<program> ::= END')], list(tokenizer.lines()))
+                self.assertEqual(line, tokenizer.malformed)
+
+    def test_whitespace(self):
+        tree = 'Parse Tree  \r\n \r\n  +--<program> ::= END \r\n|  +--END\t\r\n   \r\nTokens\r\n'
+
+        with io.StringIO(tree, newline='') as gp_file:
+            self.assertListEqual([(0, '<program> ::= END'), (1, 'END')], list(TreeTokenizer(gp_file).lines()))
+
+    def test_parse_tree(self):
+        with open(PARSE_TREE) as gp_file:
+            expected = list(split_lines(gp_file))
+
+        with open(PARSE_TREE) as gp_file:
+            self.assertListEqual(expected, list(TreeTokenizer(gp_file).lines()))
+
+    def test_generated(self):
+        text = ParseTreeGenerator(200, seed=3).text()
+
+        with io.StringIO(text) as gp_file:
+            expected = list(split_lines(gp_file))
+
+        with io.StringIO(text) as gp_file:
+            self.assertListEqual(expected, list(TreeTokenizer(gp_file).lines()))
+
+    def test_trailing_whitespace(self):
+        # Every line loses its trailing whitespace, whatever the lines around it hold
+        for other in ('|  +--TO', '|  +--TO '):
+            with self.subTest(other=other), io.StringIO('Parse Tree\n\n+--<program> ::= END\n|  +--#B\xa0\n' +
+                                                       other + '\n\n') as gp_file:
+                self.assertListEqual([(0, '<program> ::= END'), (1, '#B'), (1, 'TO')],
+                                     list(TreeTokenizer(gp_file).lines()))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+"""
+    gpstruct.py Convert a GOLDParser parse tree export to Structorizer XML
+
+    Copyright (C) 2022  Sven Coenye
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import io
+import struct
+import unittest
+
+from goldparser.grammar import TerminalNode
+from goldparser.snapshot import SnapshotError, TreeSnapshot
+from gpstruct import GPStruct
+from structorizer.factory import StatementFactory
+
+from tests.test_gpstruct import PARSE_TREE, convert, deep_tree, flatten
+
+
+def parse(columnar=False):
+    gp_parser = GPStruct(columnar)
+
+    with open(PARSE_TREE) as gp_file:
+        gp_parser.parse(gp_file)
+
+    return gp_parser.gp_root
+
+
+def outline(root):
+    """
+    flatten, with terminal flags in place of the node classes so object and columnar trees compare
+    """
+    return [(issubclass(node_class, TerminalNode), level, expression, parent)
+            for node_class, level, expression, parent in flatten(root)]
+
+
+class TreeSnapshotTest(unittest.TestCase):
+    def test_round_trip(self):
+        root = parse()
+
+        for columnar in (False, True):
+            self.assertListEqual(outline(root), outline(TreeSnapshot.loads(TreeSnapshot.dumps(root), columnar)))
+
+    def test_columnar_round_trip(self):
+        data = TreeSnapshot.dumps(parse(columnar=True))
+
+        self.assertEqual(TreeSnapshot.dumps(parse()), data)
+        self.assertListEqual(outline(parse()), outline(TreeSnapshot.loads(data, columnar=True)))
+
+    def test_terminals(self):
+        root = TreeSnapshot.loads(TreeSnapshot.dumps(parse()))
+        condition = root.children[2].children[1]
+
+        self.assertIsInstance(condition.children[1], TerminalNode)
+        self.assertEqual('<', condition.children[1].expression)
+        self.assertTrue(root.children[2].matches('<IF_open>'))
+
+    def test_convert(self):
+        with open(PARSE_TREE) as gp_file:
+            expected = convert(gp_file)
+
+        gp_parser = GPStruct()
+        gp_parser.gp_root = TreeSnapshot.loads(TreeSnapshot.dumps(parse()))
+        gp_parser.build_render_nodes(StatementFactory)
+        gp_parser.build_diagram()
+
+        with io.StringIO() as output:
+            gp_parser.render(output)
+            self.assertEqual(expected, output.getvalue())
+
+    def test_prune(self):
+        # A snapshot holds the whole tree, the pruned productions are left out once it is loaded
+        StatementFactory.pruned = {'DEFINE_DATA'}
+
+        try:
+            with open(PARSE_TREE) as gp_file:
+                expected = convert(gp_file)
+
+            for columnar in (False, True):
+                with self.subTest(columnar=columnar):
+                    gp_parser = GPStruct(columnar)
+                    gp_parser.gp_root = TreeSnapshot.loads(TreeSnapshot.dumps(parse()), columnar)
+                    gp_parser.prune(StatementFactory)
+
+                    pruned_parser = GPStruct()
+
+                    with open(PARSE_TREE) as gp_file:
+                        pruned_parser.parse(gp_file, StatementFactory)
+
+                    self.assertListEqual(outline(pruned_parser.gp_root), outline(gp_parser.gp_root))
+
+                    gp_parser.build_render_nodes(StatementFactory)
+                    gp_parser.build_diagram()
+
+                    with io.StringIO() as output:
+                        gp_parser.render(output)
+                        self.assertEqual(expected, output.getvalue())
+        finally:
+            StatementFactory.pruned = set()
+
+    def test_deep(self):
+        gp_parser = GPStruct()
+        gp_parser.parse(io.StringIO(deep_tree(5000)))
+
+        root = TreeSnapshot.loads(TreeSnapshot.dumps(gp_parser.gp_root))
+        self.assertEqual(5001, len(flatten(root)))
+
+    def test_checksum(self):
+        data = bytearray(TreeSnapshot.dumps(parse()))
+        data[-1] ^= 1
+
+        with self.assertRaises(SnapshotError):
+            TreeSnapshot.loads(bytes(data))
+
+    def test_version(self):
+        data = bytearray(TreeSnapshot.dumps(parse()))
+        struct.pack_into('<H', data, len(TreeSnapshot.magic), TreeSnapshot.version + 1)
+
+        with self.assertRaises(SnapshotError):
+            TreeSnapshot.loads(bytes(data))
+
+    def test_not_a_snapshot(self):
+        with open(PARSE_TREE, 'rb') as gp_file:
+            with self.assertRaises(SnapshotError):
+                TreeSnapshot.loads(gp_file.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+"""
+    gpstruct.py Convert a GOLDParser parse tree export to Structorizer XML
+
+    Copyright (C) 2022  Sven Coenye
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from structorizer import nodes
+from structorizer.cache import ConversionCache
+from structorizer.factory import StatementFactory
+from structorizer.output import NdjsonBackend, XmlBackend
+
+
+class ConversionCacheTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.cache_dir)
+        nodes.DiagramNode.created = None
+        nodes.Statement.backend = XmlBackend
+
+    def test_get_put(self):
+        cache = ConversionCache(self.cache_dir, StatementFactory)
+        key = cache.key(b'Parse Tree\n')
+
+        self.assertIsNone(cache.get(key))
+        cache.put(key, b'<root/>')
+        self.assertEqual(b'<root/>', cache.get(key))
+
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+        self.assertEqual(7, cache.size())
+
+    def test_key(self):
+        cache = ConversionCache(self.cache_dir, StatementFactory)
+
+        self.assertEqual(cache.key(b'Parse Tree\n'), cache.key(b'Parse Tree\n'))
+        self.assertNotEqual(cache.key(b'Parse Tree\n'), cache.key(b'Parse Tree\r\n'))
+        self.assertNotEqual(cache.key(b'Parse Tree\n'), cache.key(b'Parse Tree\n', 'cp1252'))
+
+    def test_fingerprint(self):
+        class ChangedFactory(StatementFactory):
+            nodes = dict(StatementFactory.nodes, MOVE=nodes.CallNode)
+
+        fingerprint = ConversionCache.converter_fingerprint(StatementFactory)
+
+        self.assertNotEqual(fingerprint, ConversionCache.converter_fingerprint(ChangedFactory))
+
+        undated = ConversionCache.converter_fingerprint(StatementFactory, dated=False)
+
+        nodes.DiagramNode.created = '2022-01-01'
+        self.assertNotEqual(fingerprint, ConversionCache.converter_fingerprint(StatementFactory))
+        self.assertEqual(undated, ConversionCache.converter_fingerprint(StatementFactory, dated=False))
+
+        class PrunedFactory(StatementFactory):
+            pruned = {'DEFINE_DATA'}
+
+        self.assertNotEqual(ConversionCache.converter_fingerprint(StatementFactory),
+                            ConversionCache.converter_fingerprint(PrunedFactory))
+
+        fingerprint = ConversionCache.converter_fingerprint(StatementFactory)
+        nodes.Statement.backend = NdjsonBackend
+        self.assertNotEqual(fingerprint, ConversionCache.converter_fingerprint(StatementFactory))
+
+    def test_evict(self):
+        cache = ConversionCache(self.cache_dir, StatementFactory, max_bytes=250)
+        keys = [cache.key(bytes([number])) for number in range(3)]
+
+        for age, key in enumerate(keys):
+            cache.put(key, b'x' * 100)
+            path = cache._path(key)
+            os.utime(path, (time.time() - 100 + age, time.time() - 100 + age))
+
+        # The first entry was the least recently used
+        self.assertIsNone(cache.get(keys[0]))
+        self.assertIsNotNone(cache.get(keys[1]))
+        self.assertIsNotNone(cache.get(keys[2]))
+        self.assertEqual(200, cache.size())
+
+
+class CreatedDateTest(unittest.TestCase):
+    def tearDown(self) -> None:
+        nodes.DiagramNode.created = None
+
+    def test_created(self):
+        nodes.DiagramNode.created = '2022-01-01'
+        self.assertEqual('2022-01-01', nodes.DiagramNode.created_date())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+"""
+    gpstruct.py Convert a GOLDParser parse tree export to Structorizer XML
+
+    Copyright (C) 2022  Sven Coenye
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from structorizer.compression import data_format, input_format, open_input, open_output, path_format, strip_extension
+
+DATA = b'Parse Tree\n\n+--<program> ::= <statement_list> END\n' * 10
+
+
+class CompressionTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.work_dir = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.work_dir)
+
+    def test_path_format(self):
+        self.assertEqual('gz', path_format('tree.txt.GZ'))
+        self.assertEqual('xz', path_format('tree.xz'))
+        self.assertIsNone(path_format('tree.txt'))
+        self.assertEqual('tree.txt', strip_extension('tree.txt.bz2'))
+        self.assertEqual('tree.txt', strip_extension('tree.txt'))
+
+    def test_round_trip(self):
+        for compression in ('gz', 'bz2', 'xz'):
+            with io.BytesIO() as target:
+                with open_output(target, compression) as out_file:
+                    out_file.write(DATA)
+
+                self.assertFalse(target.closed)
+                packed = target.getvalue()
+
+            self.assertEqual(compression, data_format(packed))
+
+            # The magic bytes are found without consuming them
+            source = io.BufferedReader(io.BytesIO(packed))
+            self.assertEqual(compression, input_format(source))
+
+            with open_input(source) as in_file:
+                self.assertEqual(DATA, in_file.read())
+
+    def test_paths(self):
+        path = os.path.join(self.work_dir, 'tree.txt.xz')
+
+        with open_output(path) as out_file:
+            out_file.write(DATA)
+
+        # Recognised from the magic bytes when the extension says nothing
+        renamed = os.path.join(self.work_dir, 'tree.txt')
+        os.rename(path, renamed)
+        self.assertEqual('xz', input_format(renamed))
+
+        with open_input(renamed) as in_file:
+            self.assertEqual(DATA, in_file.read())
+
+    def test_uncompressed(self):
+        source = io.BufferedReader(io.BytesIO(DATA))
+
+        self.assertIsNone(input_format(source))
+        self.assertIs(source, open_input(source))
+        self.assertEqual(DATA, source.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
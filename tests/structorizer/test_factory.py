@@ -17,6 +17,7 @@
     along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+import threading
 import unittest
 
 from goldparser import grammar
@@ -220,6 +221,33 @@ class StatementFactoryTest(unittest.TestCase):
         gp_node = grammar.ExpressionNode(1, '<^>')
         self.assertIsInstance(Factory.node(gp_node, None),  nodes.NullStatement)
 
+    def test_not_an_expression(self):
+        with self.assertRaises(TypeError):
+            Factory.node(grammar.TerminalNode(1, 'MOVE'), None)
+
+    def test_threads(self):
+        # Classes looked up from several threads at once stay at their symbol ID
+        Factory.reset()
+        names = ['THREADED_{}'.format(number) for number in range(200)] + list(Factory.nodes)
+        start = threading.Barrier(4)
+
+        def look_up(offset):
+            start.wait()
+
+            for name in names[offset::4]:
+                Factory.node(grammar.ExpressionNode(1, '<{}>'.format(name)), None)
+
+        threads = [threading.Thread(target=look_up, args=(offset,)) for offset in range(4)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        for symbol, node_class in enumerate(Factory._classes):
+            self.assertIs(Factory.nodes.get(grammar.symbols.names[symbol], nodes.Statement), node_class)
+
 
 if __name__ == '__main__':
     unittest.main()
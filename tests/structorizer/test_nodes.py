@@ -333,6 +333,15 @@ class ToDecideOnTest(unittest.TestCase):
 
         self.diagram_node = nodes.ToCaseNode(gp_decide_on, None)
 
+    def test_roles(self):
+        self.diagram_node.import_expressions(StatementFactory)
+
+        # The <OF> expression is left out, the children after it build the control text
+        self.assertListEqual([('DECIDE', 'comments'), ('ON', 'comments'), ('<DECIDE_which>', 'comments'),
+                              ('<user_variable>', 'control'), ('<DECIDE_ON_branch>', 'control'),
+                              ('<DECIDE_ON_branch>', 'control'), ('<DECIDE_ON_none>', 'control')],
+                             [(child.gp_node.expression, field) for child, field in self.diagram_node.roles])
+
     def test_render(self):
         self.diagram_node.import_expressions(StatementFactory)
         self.diagram_node.build('instruction')
@@ -846,5 +855,40 @@ class NullStatementTest(unittest.TestCase):
             self.assertEqual('', output.getvalue())
 
 
+class PassesThroughTest(unittest.TestCase):
+    def test_diagram(self):
+        self.assertTrue(nodes.DiagramNode(ExpressionNode(0, '<program>'), None).passes_through())
+
+    def test_statement_list(self):
+        self.assertTrue(nodes.Statement(ExpressionNode(1, '<statement_list>'), None).passes_through())
+
+    def test_instruction(self):
+        self.assertFalse(nodes.InstructionNode(ExpressionNode(1, '<MOVE>'), None).passes_through())
+
+    def test_terminal(self):
+        self.assertFalse(nodes.DiagramTerminal(TerminalNode(1, 'MOVE'), None).passes_through())
+
+
+class StatementSlotsTest(unittest.TestCase):
+    def test_no_dict(self):
+        statement = nodes.ForNode(ExpressionNode(0, '<FOR>'), None)
+
+        with self.assertRaises(AttributeError):
+            statement.extra = None
+
+    def test_text(self):
+        statement = nodes.ForNode(ExpressionNode(0, '<FOR>'), None)
+        statement.add_text('for_to', '10')
+
+        self.assertListEqual(['10'], statement.text('for_to'))
+        self.assertListEqual(['10'], statement.node_text['for_to'])
+
+    def test_lazy_children(self):
+        statement = nodes.InstructionNode(ExpressionNode(0, '<IGNORE>'), None)
+        statement.import_expressions(StatementFactory)
+
+        self.assertEqual(nodes.NO_CHILDREN, statement.child_nodes)
+
+
 if __name__ == '__main__':
     unittest.main()
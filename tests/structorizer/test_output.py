@@ -0,0 +1,146 @@
+"""
+    gpstruct.py Convert a GOLDParser parse tree export to Structorizer XML
+
+    Copyright (C) 2022  Sven Coenye
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import io
+import json
+import unittest
+
+from goldparser.grammar import ExpressionNode, TerminalNode
+from gpstruct import batch_jobs
+from structorizer import nodes
+from structorizer.factory import StatementFactory
+from structorizer.output import NdjsonBackend, RenderBuffer, XmlBackend, read_ndjson
+
+from tests.test_gpstruct import PARSE_TREE, convert, stream
+
+
+class RenderBufferTest(unittest.TestCase):
+    def test_buffered(self):
+        with io.StringIO() as output:
+            buffer = RenderBuffer(output)
+            buffer.write('<qTrue>\n')
+
+            self.assertEqual('', output.getvalue())
+
+            buffer.flush()
+            self.assertEqual('<qTrue>\n', output.getvalue())
+
+    def test_chunk(self):
+        with io.StringIO() as output:
+            buffer = RenderBuffer(output)
+            buffer.write('x' * RenderBuffer.chunk_size)
+
+            self.assertEqual(RenderBuffer.chunk_size, len(output.getvalue()))
+
+    def test_binary(self):
+        with io.BytesIO() as output:
+            with RenderBuffer(output) as buffer:
+                buffer.write('MOVE é')
+
+            self.assertEqual('MOVE é'.encode('utf-8'), output.getvalue())
+
+    def test_wrap(self):
+        buffer = RenderBuffer(io.StringIO())
+        self.assertIs(buffer, RenderBuffer.wrap(buffer))
+
+
+class BinaryRenderTest(unittest.TestCase):
+    def test_render(self):
+        gp_expression = ExpressionNode(0, '<MOVE>')
+        gp_expression.add_node(1, TerminalNode(1, 'MOVE'))
+        gp_expression.add_node(1, TerminalNode(1, "'é'"))
+
+        diagram_node = nodes.InstructionNode(gp_expression, None)
+        diagram_node.import_expressions(StatementFactory)
+        diagram_node.build('instruction')
+
+        with io.BytesIO() as output:
+            diagram_node.render(output)
+
+            self.assertEqual(
+                '<instruction text="MOVE \'é\'" comment="" color="ffffff" rotated="0" disabled="0"></instruction>\n'
+                .encode('utf-8'),
+                output.getvalue())
+
+
+class NdjsonBackendTest(unittest.TestCase):
+    def setUp(self) -> None:
+        nodes.Statement.backend = NdjsonBackend
+
+    def tearDown(self) -> None:
+        nodes.Statement.backend = XmlBackend
+
+    def test_render(self):
+        gp_expression = ExpressionNode(0, '<MOVE>')
+        gp_expression.add_node(1, TerminalNode(1, 'MOVE'))
+        gp_expression.add_node(1, TerminalNode(1, '\'<a & "b">\''))
+
+        diagram_node = nodes.InstructionNode(gp_expression, None)
+        diagram_node.import_expressions(StatementFactory)
+        diagram_node.build('instruction')
+
+        with io.StringIO() as output:
+            diagram_node.render(output)
+            lines = output.getvalue().splitlines()
+
+        # One line, with the text as it is in the program
+        self.assertEqual(1, len(lines))
+        self.assertDictEqual({'kind': 'instruction', 'color': 'ffffff',
+                              'text': {'instruction': ['MOVE', '\'<a & "b">\'']}}, json.loads(lines[0]))
+
+    def test_structure(self):
+        with open(PARSE_TREE) as gp_file:
+            diagrams = read_ndjson(convert(gp_file).splitlines())
+
+        self.assertEqual(1, len(diagrams))
+        self.assertEqual('diagram', diagrams[0]['kind'])
+
+        alternative = diagrams[0]['children'][2]
+        self.assertEqual('alternative', alternative['kind'])
+        self.assertListEqual(['#A', '<', '2', 'END-IF'], alternative['text']['instruction'])
+        self.assertListEqual(['true', 'false'], [branch['kind'] for branch in alternative['children']])
+        self.assertEqual('call', alternative['children'][0]['children'][0]['kind'])
+
+    def test_kinds(self):
+        # The same statements as in the XML
+        with open(PARSE_TREE) as gp_file:
+            lines = [json.loads(line) for line in convert(gp_file).splitlines()]
+
+        nodes.Statement.backend = XmlBackend
+
+        with open(PARSE_TREE) as gp_file:
+            xml = convert(gp_file)
+
+        for kind in ('instruction', 'call', 'alternative', 'case', 'for', 'while', 'forever', 'jump'):
+            with self.subTest(kind=kind):
+                self.assertEqual(xml.count('<{} '.format(kind)), sum(line.get('kind') == kind for line in lines))
+
+    def test_stream(self):
+        with open(PARSE_TREE) as gp_file:
+            expected = convert(gp_file)
+
+        with open(PARSE_TREE) as gp_file:
+            self.assertEqual(expected, stream(gp_file))
+
+    def test_suffix(self):
+        self.assertTrue(batch_jobs([PARSE_TREE], 'out')[0][1].endswith('.ndjson'))
+
+
+if __name__ == '__main__':
+    unittest.main()
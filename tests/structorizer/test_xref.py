@@ -0,0 +1,149 @@
+"""
+    gpstruct.py Convert a GOLDParser parse tree export to Structorizer XML
+
+    Copyright (C) 2022  Sven Coenye
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from gpstruct import GPStruct
+from structorizer import nodes
+from structorizer.factory import StatementFactory
+from structorizer.xref import CrossReference
+
+from tests.test_gpstruct import PARSE_TREE, convert, stream
+
+TREE = '''Parse Tree
+
++--<program> ::= <statement_list> END
+|  +--<FIND_with_loop> ::= FIND <view_name> WITH <search_expression> <loop_statement_list>
+|  |  +--FIND
+|  |  +--(
+|  |  +--10
+|  |  +--)
+|  |  +--EMPLOYEES
+|  |  +--WITH
+|  |  +--<search_expression> ::= <descriptor> <comparison> <operand>
+|  |  |  +--NAME
+|  |  |  +--=
+|  |  |  +--'X'
+|  |  +--<UPDATE> ::= UPDATE
+|  |  |  +--UPDATE
+|  |  +--<loop_statement_list> ::= END-FIND
+|  |  |  +--END-FIND
+|  +--<FETCH> ::= FETCH RETURN <operand>
+|  |  +--FETCH
+|  |  +--RETURN
+|  |  +--'OTHER'
+|  +--END
+
+'''
+
+
+class CrossReferenceTest(unittest.TestCase):
+    def setUp(self) -> None:
+        nodes.Statement.xref = CrossReference()
+
+    def tearDown(self) -> None:
+        nodes.Statement.xref = None
+
+    def test_operand(self):
+        self.assertEqual('EMPLOYEES', CrossReference.view_name(['READ', '(', '10', ')', 'EMPLOYEES', 'BY', 'NAME']))
+        self.assertEqual('EMPLOYEES', CrossReference.view_name(['READ', 'MULTI-FETCH', 'OF', '10', 'EMPLOYEES']))
+        self.assertEqual('EMPLOYEES', CrossReference.view_name(['STORE', 'RECORD', 'IN', 'FILE', 'EMPLOYEES']))
+        self.assertIsNone(CrossReference.view_name(['UPDATE']))
+
+    def test_name(self):
+        self.assertEqual('NATPGM', CrossReference.name("'NATPGM'"))
+        self.assertEqual('#PGM', CrossReference.name('#PGM'))
+        self.assertEqual('A&B', CrossReference.name('&#34;&#34;A&amp;B&#34;&#34;'))
+
+    def test_parse_tree(self):
+        with open(PARSE_TREE) as gp_file:
+            convert(gp_file)
+
+        self.assertDictEqual({'calls': {'CALLNAT': ['NATPGM'], 'PERFORM': ['SUB-A']},
+                              'files': {'READ': ['EMPLOYEES'], 'STORE': ['EMPLOYEES']}},
+                             nodes.Statement.xref.as_dict())
+
+    def test_update(self):
+        # UPDATE names no view, it is taken from the loop
+        with io.StringIO(TREE) as gp_file:
+            convert(gp_file)
+
+        self.assertDictEqual({'calls': {'FETCH': ['OTHER']},
+                              'files': {'FIND': ['EMPLOYEES'], 'UPDATE': ['EMPLOYEES']}},
+                             nodes.Statement.xref.as_dict())
+
+    def test_build_root(self):
+        # A node with references that is built on its own still adds them
+        gp_parser = GPStruct()
+
+        with io.StringIO(TREE) as gp_file:
+            gp_parser.parse(gp_file)
+
+        statement = gp_parser.gp_root.children[1].export_node(StatementFactory, None)
+        statement.build('instruction')
+
+        self.assertTrue(statement._references)
+        self.assertFalse(nodes.InstructionNode._references)
+        self.assertDictEqual({'calls': {'FETCH': ['OTHER']}, 'files': {}}, nodes.Statement.xref.as_dict())
+
+    def test_stream(self):
+        with open(PARSE_TREE) as gp_file:
+            convert(gp_file)
+
+        expected = nodes.Statement.xref.as_dict()
+        nodes.Statement.xref = CrossReference()
+
+        with open(PARSE_TREE) as gp_file:
+            stream(gp_file)
+
+        self.assertDictEqual(expected, nodes.Statement.xref.as_dict())
+
+    def test_not_collected(self):
+        nodes.Statement.xref = None
+
+        with open(PARSE_TREE) as gp_file:
+            self.assertIn('<call ', convert(gp_file))
+
+    def test_write(self):
+        work_dir = tempfile.mkdtemp()
+
+        try:
+            path = CrossReference.sidecar_path(os.path.join(work_dir, 'program.nsd.gz'))
+            self.assertEqual(os.path.join(work_dir, 'program.xref.json'), path)
+
+            with open(PARSE_TREE) as gp_file:
+                convert(gp_file)
+
+            nodes.Statement.xref.write(path)
+
+            with open(path) as xref_file:
+                self.assertDictEqual(nodes.Statement.xref.as_dict(), json.load(xref_file))
+
+            self.assertListEqual(['program.xref.json'], os.listdir(work_dir))
+        finally:
+            shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,694 @@
+"""
+    gpstruct.py Convert a GOLDParser parse tree export to Structorizer XML
+
+    Copyright (C) 2022  Sven Coenye
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import codecs
+import contextlib
+import gzip
+import io
+import json
+import os
+import pathlib
+import shutil
+import sys
+import tempfile
+import unittest
+
+from goldparser.grammar import ExpressionNode, TerminalNode
+from gpstruct import (ConversionProfile, Converter, GPStruct, ParseTreeError, batch_convert, batch_jobs,
+                      convert_documents, convert_export, read_documents, write_frame)
+from structorizer.cache import ConversionCache
+from structorizer.factory import StatementFactory
+from structorizer.nodes import DiagramNode, Statement
+from structorizer.output import NdjsonBackend, XmlBackend
+from structorizer.xref import CrossReference
+
+PARSE_TREE = os.path.join(os.path.dirname(__file__), 'data', 'parsetree.txt')
+
+
+def flatten(gp_node):
+    """
+    List the (class, level, expression, parent expression) of every node in pre-order
+    """
+    result = []
+    pending = [gp_node]
+
+    while pending:
+        node = pending.pop()
+        result.append((type(node), node.level, node.expression,
+                       node.parent.expression if node.parent else None))
+
+        if isinstance(node, ExpressionNode):
+            pending.extend(reversed(node.children))
+
+    return result
+
+
+def deep_tree(depth):
+    """
+    Parse tree export with a single chain of nested expressions
+    """
+    lines = ['Parse Tree', '']
+
+    for level in range(depth):
+        lines.append('|  ' * level + '+--<statement_list> ::= <statement> <statement_list>')
+
+    lines.append('|  ' * depth + '+--END')
+    lines.append('')
+
+    return '\n'.join(lines)
+
+
+def deep_program(depth):
+    """
+    Parse tree export of a program with a single chain of nested loops
+    """
+    lines = ['Parse Tree', '', '+--<program> ::= <statement_list> END']
+
+    for level in range(1, depth + 1):
+        lines.append('|  ' * level + '+--<REPEAT> ::= REPEAT <statement_list> LOOP')
+        lines.append('|  ' * (level + 1) + '+--REPEAT')
+
+    lines.append('|  ' * (depth + 1) + '+--<IGNORE> ::= IGNORE')
+    lines.append('|  ' * (depth + 2) + '+--IGNORE')
+
+    for level in range(depth, 0, -1):
+        lines.append('|  ' * (level + 1) + '+--LOOP')
+
+    lines.append('|  +--END')
+    lines.append('')
+
+    return '\n'.join(lines)
+
+
+def convert(gp_file):
+    """
+    Run the three phase conversion and return the XML
+    """
+    gp_parser = GPStruct()
+    gp_parser.parse(gp_file, StatementFactory)
+    gp_parser.build_render_nodes(StatementFactory)
+    gp_parser.build_diagram()
+
+    with io.StringIO() as output:
+        gp_parser.render(output)
+        return output.getvalue()
+
+
+def stream(gp_file):
+    """
+    Run the streaming conversion and return the XML
+    """
+    with io.StringIO() as output:
+        GPStruct().stream(gp_file, StatementFactory, output)
+        return output.getvalue()
+
+
+class ParseTest(unittest.TestCase):
+    def test_parse(self):
+        gp_parser = GPStruct()
+
+        with open(PARSE_TREE) as gp_file:
+            gp_parser.parse(gp_file)
+
+        self.assertEqual('<program> ::= <statement_list> END', gp_parser.gp_root.expression)
+        self.assertEqual(8, len(gp_parser.gp_root.children))
+
+        move = gp_parser.gp_root.children[1]
+        self.assertListEqual(['MOVE', "'A+--B'", 'TO', '#A'], [child.expression for child in move.children])
+
+        condition = gp_parser.gp_root.children[2].children[1]
+        self.assertIsInstance(condition.children[1], TerminalNode)
+        self.assertEqual('<', condition.children[1].expression)
+
+    def test_parse_matches_add_node(self):
+        # The tree built by parse must be the one obtained by feeding each line
+        # to the last expression seen and letting add_node find its place.
+        gp_parser = GPStruct()
+
+        with open(PARSE_TREE) as gp_file:
+            gp_parser.parse(gp_file)
+
+        with open(PARSE_TREE) as gp_file:
+            lines = gp_file.read().split('\n\n')[1].splitlines()
+
+        def split_line(line):
+            prefix, _, expression = line.strip().partition('+--')
+            return prefix.count('|'), expression
+
+        level, expression = split_line(lines[0])
+        expected = ExpressionNode(level, expression)
+        last_node = expected
+
+        for line in lines[1:]:
+            level, expression = split_line(line)
+
+            if expression[0] != '<' or expression == '<':
+                last_node.add_node(level, TerminalNode(level, expression))
+            else:
+                new_node = ExpressionNode(level, expression)
+                last_node.add_node(level, new_node)
+                last_node = new_node
+
+        self.assertListEqual(flatten(expected), flatten(gp_parser.gp_root))
+
+    def test_parse_pruned(self):
+        gp_parser = GPStruct()
+
+        with open(PARSE_TREE) as gp_file:
+            gp_parser.parse(gp_file, StatementFactory)
+
+        expressions = [expression for _, _, expression, _ in flatten(gp_parser.gp_root)]
+
+        # REDEFINE maps to a NullStatement, nothing below it is kept
+        self.assertNotIn('REDEFINE', expressions)
+        self.assertNotIn('#A', expressions[:expressions.index('END-DEFINE')])
+        self.assertIn('END-DEFINE', expressions)
+
+    def test_parse_pruned_configured(self):
+        with open(PARSE_TREE) as gp_file:
+            expected = convert(gp_file)
+
+        StatementFactory.pruned = {'DEFINE_DATA'}
+
+        try:
+            with open(PARSE_TREE) as gp_file:
+                pruned = convert(gp_file)
+
+            with open(PARSE_TREE) as gp_file:
+                streamed = stream(gp_file)
+        finally:
+            StatementFactory.pruned = set()
+
+        self.assertNotIn('DEFINE DATA', pruned)
+        self.assertEqual(expected.replace(
+            '<instruction text="DEFINE DATA END-DEFINE" comment="" color="ffffff" rotated="0" disabled="0">'
+            '</instruction>\n', ''), pruned)
+        self.assertEqual(pruned, streamed)
+
+    def test_parse_deep(self):
+        gp_parser = GPStruct()
+        gp_parser.parse(io.StringIO(deep_tree(5000)))
+
+        node = gp_parser.gp_root
+        depth = 0
+        while isinstance(node, ExpressionNode):
+            node = node.children[0]
+            depth += 1
+
+        self.assertEqual(5000, depth)
+        self.assertEqual('END', node.expression)
+
+
+class ConvertTest(unittest.TestCase):
+    def test_convert_deep(self):
+        # Export, build and render must not be limited by the recursion depth
+        depth = sys.getrecursionlimit() * 2
+        xml = convert(io.StringIO(deep_program(depth)))
+
+        self.assertEqual(depth, xml.count('<forever'))
+        self.assertEqual(depth, xml.count('</forever>'))
+
+
+class ConverterTest(unittest.TestCase):
+    def setUp(self) -> None:
+        with open(PARSE_TREE) as gp_file:
+            self.expected = convert(gp_file)
+
+        with open(PARSE_TREE, 'rb') as gp_file:
+            self.gp_data = gp_file.read()
+
+    def test_sources(self):
+        converter = Converter()
+
+        self.assertEqual(self.expected, converter.convert(self.gp_data.decode('utf-8')))
+        self.assertEqual(self.expected, converter.convert(self.gp_data.replace(b'\n', b'\r\n')))
+        self.assertEqual(self.expected, converter.convert(pathlib.Path(PARSE_TREE)))
+        self.assertEqual(self.expected, converter.convert_file(PARSE_TREE))
+        self.assertEqual(self.expected, converter.convert(PARSE_TREE))
+
+        with open(PARSE_TREE) as gp_file:
+            self.assertEqual(self.expected, converter.convert(gp_file))
+
+        with open(PARSE_TREE, 'rb') as gp_file:
+            self.assertEqual(self.expected, converter.convert(gp_file))
+            self.assertFalse(gp_file.closed)
+
+    def test_settings(self):
+        # Process-wide settings left by others do not reach a Converter, its own are undone afterwards
+        xref = CrossReference()
+        Statement.backend, Statement.xref, StatementFactory.pruned = NdjsonBackend, xref, {'DEFINE_DATA'}
+
+        try:
+            self.assertEqual(self.expected, Converter().convert(self.gp_data))
+            self.assertDictEqual({'calls': {}, 'files': {}}, xref.as_dict())
+
+            xml = Converter(created='2000-01-01', pruned=['DEFINE_DATA']).convert(self.gp_data)
+            self.assertIn('created="2000-01-01"', xml)
+            self.assertNotIn('DEFINE DATA', xml)
+
+            self.assertTrue(Converter(backend='ndjson').convert(self.gp_data).startswith('{'))
+
+            self.assertIs(NdjsonBackend, Statement.backend)
+            self.assertIs(xref, Statement.xref)
+            self.assertSetEqual({'DEFINE_DATA'}, StatementFactory.pruned)
+            self.assertIsNone(DiagramNode.created)
+        finally:
+            Statement.backend, Statement.xref, StatementFactory.pruned = XmlBackend, None, set()
+
+    def test_binary(self):
+        xml = convert_export(self.gp_data, binary=True)
+
+        self.assertIsInstance(xml, bytes)
+        self.assertEqual(self.expected, xml.decode('utf-8'))
+
+    def test_bad_tree(self):
+        converter = Converter()
+
+        with contextlib.redirect_stderr(io.StringIO()) as printed:
+            for text in ('', 'Parse Tree\n\n+--MOVE\n', 'Parse Tree\n\n|  +--<program> ::= END\n'):
+                with self.assertRaises(ParseTreeError):
+                    converter.convert(text)
+
+        self.assertEqual('', printed.getvalue())
+
+        # Nothing from the failed conversions is left behind
+        self.assertEqual(self.expected, converter.convert(self.gp_data))
+        self.assertEqual(self.expected, converter.convert(self.gp_data))
+
+    def test_malformed_lines(self):
+        # A line without +-- and a +-- without an expression
+        texts = ('Parse Tree\n\n+--<program> ::= x\nfoo\n\n',
+                 'Parse Tree\n\n+--<program> ::= <statement_list> END\n|  +--\n|  +--END\n\n')
+
+        for converter in (Converter(), Converter(columnar=True), Converter(stream=True)):
+            for text in texts:
+                with self.subTest(text=text, columnar=converter.columnar, stream=converter.stream):
+                    with self.assertRaises(ParseTreeError):
+                        converter.convert(text)
+
+                    with self.assertRaises(ParseTreeError):
+                        converter.convert(text.encode('ascii'), binary=True)
+
+
+def read_frames(data):
+    """
+    Split a framed stream into its documents
+    """
+    frames = []
+
+    with io.BytesIO(data) as framed:
+        for header in iter(framed.readline, b''):
+            frames.append(framed.read(int(header)))
+
+    return frames
+
+
+class DocumentsTest(unittest.TestCase):
+    def setUp(self) -> None:
+        with open(PARSE_TREE, 'rb') as gp_file:
+            self.gp_data = gp_file.read()
+
+        self.expected = convert_export(self.gp_data, binary=True)
+        self.other = deep_program(3).encode('utf-8')
+
+    def test_concatenated(self):
+        documents = list(read_documents(io.BytesIO(self.gp_data + self.other + self.gp_data)))
+
+        # The Tokens section after the tree is not needed for the conversion
+        self.assertEqual(3, len(documents))
+        self.assertEqual(self.gp_data.split(b'\n\nTokens')[0] + b'\n\n', documents[0])
+        self.assertEqual(self.expected, convert_export(documents[2], binary=True))
+
+    def test_convert(self):
+        in_file = io.BytesIO()
+
+        for document in (self.gp_data, b'Parse Tree\n\nfoo\n\n', self.other):
+            write_frame(in_file, document)
+
+        in_file.seek(0)
+
+        with io.BytesIO() as out_file:
+            errors = list(convert_documents(in_file, out_file, framed=True))
+            frames = read_frames(out_file.getvalue())
+
+        self.assertListEqual([1, 2, 3], [number for number, _ in errors])
+        self.assertIsNotNone(errors[1][1])
+        self.assertListEqual([self.expected, b'', convert_export(self.other, binary=True)], frames)
+
+    def test_bad_document(self):
+        # A bad document in the middle of a concatenated stream does not stop the others
+        bad = b'Parse Tree\n\n+--<program> ::= <statement_list> END\n|  +--\n\n'
+
+        with io.BytesIO() as out_file:
+            errors = list(convert_documents(io.BytesIO(self.gp_data + bad + self.other), out_file))
+            frames = read_frames(out_file.getvalue())
+
+        self.assertListEqual([1, 2, 3], [number for number, _ in errors])
+        self.assertListEqual([False, True, False], [error is not None for _, error in errors])
+        self.assertListEqual([self.expected, b'', convert_export(self.other, binary=True)], frames)
+
+    def test_byte_order_mark(self):
+        bom = codecs.BOM_UTF8
+
+        with io.BytesIO() as out_file:
+            errors = list(convert_documents(io.BytesIO(bom + self.gp_data + bom + self.other), out_file))
+            frames = read_frames(out_file.getvalue())
+
+        self.assertListEqual([(1, None), (2, None)], errors)
+        self.assertListEqual([self.expected, convert_export(self.other, binary=True)], frames)
+
+    def test_stray_text(self):
+        # Text before the first header is a document of its own, which fails
+        with io.BytesIO() as out_file:
+            errors = list(convert_documents(io.BytesIO(b'junk\n\n' + self.gp_data), out_file))
+            frames = read_frames(out_file.getvalue())
+
+        self.assertListEqual([True, False], [error is not None for _, error in errors])
+        self.assertListEqual([b'', self.expected], frames)
+
+    def test_truncated_frame(self):
+        with self.assertRaises(ParseTreeError):
+            list(read_documents(io.BytesIO(b'100\nParse Tree\n'), framed=True))
+
+
+class CacheTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.cache_dir)
+
+    def test_convert_cached(self):
+        cache = ConversionCache(self.cache_dir, StatementFactory)
+        gp_parser = GPStruct()
+
+        with open(PARSE_TREE, 'rb') as gp_file:
+            gp_data = gp_file.read()
+
+        with open(PARSE_TREE) as gp_file:
+            expected = convert(gp_file)
+
+        for _ in range(2):
+            with io.StringIO() as output:
+                self.assertTrue(gp_parser.convert_cached(gp_data, StatementFactory, output, cache))
+                self.assertEqual(expected, output.getvalue())
+
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+        self.assertIsNone(gp_parser.gp_root)
+
+    def test_convert_cached_no_tree(self):
+        cache = ConversionCache(self.cache_dir, StatementFactory)
+
+        with io.BytesIO() as output:
+            self.assertFalse(GPStruct().convert_cached(b'', StatementFactory, output, cache))
+
+        self.assertEqual(0, cache.size())
+
+
+class ParallelTest(unittest.TestCase):
+    def parallel(self, gp_file, chunk_lines):
+        gp_parser = GPStruct()
+        gp_parser.parallel_lines = chunk_lines
+
+        with io.StringIO() as output:
+            self.assertTrue(gp_parser.convert(gp_file, StatementFactory, output, workers=2))
+            return output.getvalue()
+
+    def test_parallel(self):
+        with open(PARSE_TREE) as gp_file:
+            expected = convert(gp_file)
+
+        for chunk_lines in (1, 10, 1000):
+            with open(PARSE_TREE) as gp_file:
+                self.assertEqual(expected, self.parallel(gp_file, chunk_lines))
+
+    def test_parallel_single_unit(self):
+        # The root does not pass its children through, it is sent as a whole
+        tree = ('Parse Tree\n'
+                '\n'
+                '+--<MOVE> ::= MOVE <operand> TO <operand>\n'
+                '|  +--MOVE\n'
+                '|  +--1\n'
+                '|  +--TO\n'
+                '|  +--#A\n')
+
+        self.assertEqual(convert(io.StringIO(tree)), self.parallel(io.StringIO(tree), 1))
+
+
+class IncrementalTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.cache_dir)
+
+    def incremental(self, gp_file, fragments):
+        gp_parser = GPStruct()
+        gp_parser.fragment_lines = 1
+
+        with io.StringIO() as output:
+            gp_parser.convert(gp_file, StatementFactory, output, fragments=fragments)
+            return output.getvalue()
+
+    def test_incremental(self):
+        fragments = ConversionCache(self.cache_dir, StatementFactory)
+
+        with open(PARSE_TREE) as gp_file:
+            expected = convert(gp_file)
+
+        for _ in range(2):
+            with open(PARSE_TREE) as gp_file:
+                self.assertEqual(expected, self.incremental(gp_file, fragments))
+
+        self.assertEqual(fragments.hits, fragments.misses)
+
+    def test_incremental_created(self):
+        # The fragments do not hold the creation date, a later day reuses them all
+        with open(PARSE_TREE) as gp_file:
+            tree = gp_file.read()
+
+        try:
+            DiagramNode.created = '2022-01-01'
+            self.incremental(io.StringIO(tree), ConversionCache(self.cache_dir, StatementFactory, dated=False))
+
+            DiagramNode.created = '2022-01-02'
+            fragments = ConversionCache(self.cache_dir, StatementFactory, dated=False)
+            xml = self.incremental(io.StringIO(tree), fragments)
+        finally:
+            DiagramNode.created = None
+
+        self.assertEqual(0, fragments.misses)
+        self.assertGreater(fragments.hits, 0)
+        self.assertIn('created="2022-01-02"', xml)
+
+    def test_incremental_changed(self):
+        fragments = ConversionCache(self.cache_dir, StatementFactory)
+
+        with open(PARSE_TREE) as gp_file:
+            tree = gp_file.read()
+
+        self.incremental(io.StringIO(tree), fragments)
+        hits, misses = fragments.hits, fragments.misses
+
+        # Only the subroutine changed
+        tree = tree.replace("'NATPGM'", "'NATPGM2'")
+        self.assertEqual(convert(io.StringIO(tree)), self.incremental(io.StringIO(tree), fragments))
+        self.assertEqual(misses + 1, fragments.misses)
+        self.assertEqual(hits + misses - 1, fragments.hits)
+
+
+class ProfileTest(unittest.TestCase):
+    def test_profile(self):
+        profile = ConversionProfile(cprofile=True)
+
+        with open(PARSE_TREE) as gp_file, io.StringIO() as output:
+            self.assertTrue(profile.run(GPStruct(), gp_file, StatementFactory, output))
+            xml = output.getvalue()
+
+        with open(PARSE_TREE) as gp_file:
+            self.assertEqual(convert(gp_file), xml)
+
+        self.assertListEqual(list(ConversionProfile.phases), list(profile.times))
+        self.assertEqual(1, profile.node_counts['DiagramNode'])
+        self.assertEqual(1, profile.node_counts['ForNode'])
+        self.assertGreaterEqual(profile.peak_memory, max(profile.peaks.values()))
+        self.assertIsNotNone(profile.stats)
+        # Terminals the diagram leaves out, like the OF of a DECIDE, are never escaped
+        self.assertLessEqual(profile.escapes['hits'] + profile.escapes['misses'], profile.node_counts['DiagramTerminal'])
+        self.assertGreater(profile.escapes['hits'] + profile.escapes['misses'], 0)
+
+        with io.StringIO() as report:
+            profile.report(report, json_format=True)
+            report_data = json.loads(report.getvalue())
+            self.assertEqual(profile.node_counts['DiagramTerminal'], report_data['nodes']['DiagramTerminal'])
+            self.assertDictEqual(profile.escapes, report_data['escape_cache'])
+
+    def test_profile_no_tree(self):
+        profile = ConversionProfile(trace_memory=False)
+
+        with io.StringIO() as output:
+            self.assertFalse(profile.run(GPStruct(), io.StringIO(''), StatementFactory, output))
+
+        self.assertListEqual(['parse'], list(profile.times))
+        self.assertIsNone(profile.peak_memory)
+
+
+class StreamTest(unittest.TestCase):
+    def test_stream(self):
+        with open(PARSE_TREE) as gp_file:
+            expected = convert(gp_file)
+
+        with open(PARSE_TREE) as gp_file:
+            self.assertEqual(expected, stream(gp_file))
+
+    def test_stream_deep_unit(self):
+        # A REPEAT chain is a single unit; the LOOP terminals close it from the deepest level up
+        tree = deep_program(500)
+        self.assertEqual(convert(io.StringIO(tree)), stream(io.StringIO(tree)))
+
+    def test_stream_pass_through(self):
+        # Nested statement_list expressions pass their children through
+        tree = deep_tree(200)
+        self.assertEqual(convert(io.StringIO(tree)), stream(io.StringIO(tree)))
+
+    def test_stream_forever(self):
+        tree = ('Parse Tree\n'
+                '\n'
+                '+--<program> ::= <statement_list> END\n'
+                '|  +--<REPEAT> ::= REPEAT <statement_list> LOOP\n'
+                '|  |  +--REPEAT\n'
+                '|  |  +--<IGNORE> ::= IGNORE\n'
+                '|  |  |  +--IGNORE\n'
+                '|  |  +--<ESCAPE> ::= ESCAPE BOTTOM\n'
+                '|  |  |  +--ESCAPE\n'
+                '|  |  |  +--BOTTOM\n'
+                '|  |  +--LOOP\n'
+                '|  +--END\n')
+
+        self.assertEqual(convert(io.StringIO(tree)), stream(io.StringIO(tree)))
+
+    def test_stream_drops_units(self):
+        gp_parser = GPStruct()
+
+        with open(PARSE_TREE) as gp_file, io.StringIO() as output:
+            gp_parser.stream(gp_file, StatementFactory, output)
+
+        self.assertListEqual([], gp_parser.gp_root.children)
+
+
+class BatchTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.work_dir = tempfile.mkdtemp()
+        self.in_dir = os.path.join(self.work_dir, 'in')
+        self.out_dir = os.path.join(self.work_dir, 'out')
+
+        os.makedirs(os.path.join(self.in_dir, 'sub'))
+        shutil.copy(PARSE_TREE, os.path.join(self.in_dir, 'first.txt'))
+        shutil.copy(PARSE_TREE, os.path.join(self.in_dir, 'sub', 'second.txt'))
+
+        with open(os.path.join(self.in_dir, 'broken.txt'), 'w') as broken:
+            broken.write('Parse Tree\n\n|  +--MOVE\n')
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.work_dir)
+
+    def test_batch_jobs(self):
+        jobs = batch_jobs([self.in_dir], self.out_dir)
+
+        self.assertListEqual([os.path.join(self.out_dir, 'broken.nsd'),
+                              os.path.join(self.out_dir, 'first.nsd'),
+                              os.path.join(self.out_dir, 'sub', 'second.nsd')],
+                             [out_path for _, out_path in jobs])
+
+    def test_batch_jobs_glob(self):
+        # Matches keep their path below the directory in front of the wildcards
+        jobs = batch_jobs([os.path.join(self.in_dir, '**', 's*.txt')], self.out_dir)
+
+        self.assertListEqual([(os.path.join(self.in_dir, 'sub', 'second.txt'),
+                               os.path.join(self.out_dir, 'sub', 'second.nsd'))], jobs)
+
+    def test_batch_jobs_same_name(self):
+        shutil.copy(PARSE_TREE, os.path.join(self.in_dir, 'sub', 'first.txt'))
+        jobs = batch_jobs([os.path.join(self.in_dir, '**', 'first.txt')], self.out_dir)
+
+        self.assertListEqual([os.path.join(self.out_dir, 'first.nsd'), os.path.join(self.out_dir, 'sub', 'first.nsd')],
+                             sorted(out_path for _, out_path in jobs))
+
+        # Two inputs for one output file are refused
+        with self.assertRaises(ValueError):
+            batch_jobs([os.path.join(self.in_dir, 'first.txt'), os.path.join(self.in_dir, 'sub', 'first.txt')],
+                       self.out_dir)
+
+    def test_batch_jobs_output_skipped(self):
+        # Output of an earlier run written inside the input directory is not converted again
+        for name in ('first.nsd', 'first.nsd.gz', 'first.xref.json', 'first.nsd.tmp'):
+            shutil.copy(PARSE_TREE, os.path.join(self.in_dir, name))
+
+        jobs = batch_jobs([self.in_dir], self.in_dir)
+
+        self.assertListEqual(['broken.txt', 'first.txt', os.path.join('sub', 'second.txt')],
+                             [os.path.relpath(in_path, self.in_dir) for in_path, _ in jobs])
+
+    def test_batch_convert(self):
+        jobs = batch_jobs([self.in_dir], self.out_dir)
+        results = dict(batch_convert(jobs, workers=2))
+
+        self.assertIn('ParseTreeError', results[os.path.join(self.in_dir, 'broken.txt')])
+        self.assertIsNone(results[os.path.join(self.in_dir, 'first.txt')])
+        self.assertFalse(os.path.exists(os.path.join(self.out_dir, 'broken.nsd')))
+
+        with open(PARSE_TREE) as gp_file:
+            expected = convert(gp_file)
+
+        with open(os.path.join(self.out_dir, 'sub', 'second.nsd')) as out_file:
+            self.assertEqual(expected, out_file.read())
+
+    def test_batch_compressed(self):
+        with open(PARSE_TREE, 'rb') as gp_file, gzip.open(os.path.join(self.in_dir, 'third.txt.gz'), 'wb') as packed:
+            packed.write(gp_file.read())
+
+        jobs = batch_jobs([self.in_dir], self.out_dir, '.nsd.gz')
+        results = dict(batch_convert(jobs, workers=1))
+
+        self.assertIsNone(results[os.path.join(self.in_dir, 'third.txt.gz')])
+
+        with open(PARSE_TREE) as gp_file:
+            expected = convert(gp_file)
+
+        for name in ('first.nsd.gz', 'third.nsd.gz'):
+            with gzip.open(os.path.join(self.out_dir, name), 'rt') as out_file:
+                self.assertEqual(expected, out_file.read())
+
+    def test_batch_xref(self):
+        jobs = batch_jobs([self.in_dir], self.out_dir)
+        list(batch_convert(jobs, workers=1, xref=True))
+
+        # An index for each converted file, none for the broken one
+        self.assertFalse(os.path.exists(os.path.join(self.out_dir, 'broken.xref.json')))
+
+        for name in ('first.xref.json', os.path.join('sub', 'second.xref.json')):
+            with open(os.path.join(self.out_dir, name)) as xref_file:
+                self.assertListEqual(['SUB-A'], json.load(xref_file)['calls']['PERFORM'])
+
+        with self.assertRaises(ValueError):
+            list(batch_convert(jobs, workers=1, cache=self.work_dir, xref=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
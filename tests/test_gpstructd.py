@@ -0,0 +1,163 @@
+"""
+    gpstruct.py Convert a GOLDParser parse tree export to Structorizer XML
+
+    Copyright (C) 2022  Sven Coenye
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from gpstruct import GPStruct
+from gpstructd import ConversionServer, ResultCache, UnixHTTPConnection, is_loopback, request
+from structorizer.factory import StatementFactory
+
+PARSE_TREE = os.path.join(os.path.dirname(__file__), 'data', 'parsetree.txt')
+
+
+class ResultCacheTest(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = ResultCache(max_bytes=10)
+        cache.put('a', b'1234')
+        cache.put('b', b'1234')
+        cache.get('a')
+        cache.put('c', b'1234')
+
+        self.assertEqual(b'1234', cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(8, cache.size)
+        self.assertEqual((2, 1), (cache.hits, cache.misses))
+
+
+class ServerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.work_dir = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.work_dir, 'gpstruct.sock')
+        self.server = ConversionServer()
+
+        started = threading.Event()
+        self.loop = asyncio.new_event_loop()
+        self.task = None
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            self.task = self.loop.create_task(self.server.serve(self.socket_path, ready=lambda _: started.set()))
+
+            try:
+                self.loop.run_until_complete(self.task)
+            except asyncio.CancelledError:
+                pass
+
+        self.thread = threading.Thread(target=run)
+        self.thread.start()
+        started.wait(10)
+
+    def tearDown(self) -> None:
+        self.loop.call_soon_threadsafe(self.task.cancel)
+        self.thread.join()
+        self.loop.close()
+        self.server.close()
+        shutil.rmtree(self.work_dir)
+
+    def test_convert(self):
+        with open(PARSE_TREE, 'rb') as gp_file:
+            gp_data = gp_file.read()
+
+        with open(PARSE_TREE) as gp_file, io.StringIO() as output:
+            GPStruct().convert(gp_file, StatementFactory, output)
+            expected = output.getvalue()
+
+        connection = UnixHTTPConnection(self.socket_path)
+
+        for _ in range(2):
+            status, xml = request(gp_data, self.socket_path, connection=connection)
+
+            self.assertEqual(200, status)
+            self.assertEqual(expected, xml.decode('utf-8'))
+
+        connection.close()
+
+        stats = self.server.stats()
+        self.assertEqual((1, 1, 1), (stats['cache_hits'], stats['cache_misses'], stats['cache_entries']))
+
+    def test_encoding(self):
+        with open(PARSE_TREE, 'rb') as gp_file:
+            gp_data = gp_file.read()
+
+        status, xml = request(gp_data.decode('utf-8').encode('utf-16'), self.socket_path, encoding='utf-16')
+
+        self.assertEqual(200, status)
+        self.assertEqual(request(gp_data, self.socket_path)[1], xml)
+        self.assertEqual(400, request(gp_data, self.socket_path, encoding='no-such-codec')[0])
+
+    def test_no_parse_tree(self):
+        status, _ = request(b'Parse Tree\n', self.socket_path)
+
+        self.assertEqual(422, status)
+        self.assertEqual(0, self.server.stats()['cache_entries'])
+
+    def test_stats(self):
+        request(b'', self.socket_path)
+
+        connection = UnixHTTPConnection(self.socket_path)
+        connection.request('GET', '/stats')
+        response = connection.getresponse()
+        stats = json.loads(response.read())
+        connection.close()
+
+        self.assertEqual(200, response.status)
+        self.assertEqual(2, stats['requests'])
+        self.assertEqual(1, stats['failures'])
+
+    def test_unknown_path(self):
+        connection = UnixHTTPConnection(self.socket_path)
+        connection.request('GET', '/nothing')
+        response = connection.getresponse()
+        response.read()
+        connection.close()
+
+        self.assertEqual(404, response.status)
+
+    def test_long_header(self):
+        connection = UnixHTTPConnection(self.socket_path)
+        connection.putrequest('GET', '/stats')
+        connection.putheader('X-Padding', 'x' * (1 << 17))
+        connection.endheaders()
+        response = connection.getresponse()
+        response.read()
+        connection.close()
+
+        self.assertEqual(431, response.status)
+
+
+class LoopbackTest(unittest.TestCase):
+    def test_is_loopback(self):
+        for host in ('127.0.0.1', '127.1.2.3', '::1', 'localhost'):
+            with self.subTest(host=host):
+                self.assertTrue(is_loopback(host))
+
+        for host in ('0.0.0.0', '192.168.1.10', '::', 'example.com', ''):
+            with self.subTest(host=host):
+                self.assertFalse(is_loopback(host))
+
+
+if __name__ == '__main__':
+    unittest.main()